@@ -7,99 +7,290 @@ import signal
 # for game id numbering
 import secrets
 
-import json
-
 import asyncio
+import functools
+import time
 from typing import Set, Tuple, List
 
 import websockets
 
-from connect4 import PLAYER1, PLAYER2, Connect4
+from connect4 import PLAYER1, PLAYER2, Connect4, Moves
+import events
+import logs
+import metrics
+from fanout import Outbox, publish
+from spectators import Audience
+import spectators
+from registry import Match
+from lifecycle import MatchLifecycle
+import registry
+import book
+import compression
+import journal
+import matchmaking
+import ratings
+import relay
+import sessions
+import solver
+import throttle
+import wire
+import workers
 
 import logging
-# logging.basicConfig(format="%(message)s", level=logging.DEBUG)
 
-# module level dict to store all currently active games
-# stored as { join key : (Connect4 Game Object, set of all connected websockets for that game) }
-# CURR_MATCHES: [str,Tuple[Connect4,websockets.__all__]] = {}
-CURR_MATCHES = {}
-# dict that stores a game object and all websockets that are 
-# spectating that match
-WATCHING_MATCHES = {}
+# module level registry of all currently active games
+# each one is a registry.Match holding the game, the Outbox of each connected
+# player and the Audience of its spectators, findable by join or watch key
+MATCHES = registry.from_env()
+# removes matches once everyone has left, and sweeps out finished or idle ones
+LIFECYCLE = MatchLifecycle(MATCHES)
+
+# read when /metrics is scraped
+metrics.ACTIVE_MATCHES.set_function(lambda: len(MATCHES))
+metrics.SPECTATORS.set_function(lambda: sum(len(match.audience) for match in MATCHES if match.local))
+metrics.LOG_LINES_DROPPED.set_function(lambda: logs.DROPPED)
+metrics.QUICK_PLAY_QUEUED.set_function(lambda: len(QUICK_PLAY))
+metrics.RATED_PLAYERS.set_function(lambda: len(RATINGS.leaderboard))
+metrics.SESSIONS.set_function(lambda: len(SESSIONS))
+metrics.SESSION_CHANNELS.set_function(lambda: sum(len(session) for session in SESSIONS))
+
+# players waiting for a quick play opponent, paired by rating
+# with several workers each one pairs the players that connected to it
+QUICK_PLAY = matchmaking.Queue()
+
+# multiplexed connections, each following or playing several matches
+SESSIONS = set()
 
-# dict to track relationship between watch keys and join keys
-WATCH_KEY_TO_JOIN_KEY = {}
-JOIN_KEY_TO_WATCH_KEY = {}
+# players' ratings and the leaderboard, saved to RATINGS_PATH if set, see main()
+RATINGS = ratings.Ratings()
+
+# precomputed replies for the computer's early moves, memory mapped so it
+# costs nothing to open whatever its size. None if no book was built
+OPENING_BOOK = book.open_default()
 
 JOIN_KEY_SIZE = 5
 
-async def start_game(websocket):
+PORT = int(os.environ.get("PORT","8001"))
+
+# seconds matches in progress get to finish after a SIGTERM, heroku kills
+# the process 30 seconds after sending it
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT","25"))
+# seconds between two checks for matches still in progress while draining
+DRAIN_POLL_INTERVAL = 0.1
+# seconds between two attempts at taking the journal and the ratings over
+# from the previous process, which holds them until it is done draining
+HANDOVER_POLL_INTERVAL = 0.05
+# close code for connections still open when the drain ends: "Service Restart"
+RESTART_CLOSE_CODE = 1012
+
+# set on SIGTERM, from then on new games are turned away, see drain()
+DRAINING = False
+
+# leaderboard entries sent at most in one "leaderboard" event
+LEADERBOARD_PAGE = 100
+
+# seconds a quick play player waits for the opponent they were paired with
+# to set the match up, before going back in the queue
+HANDOFF_TIMEOUT = 10
+
+# seconds a player whose connection dropped mid-game keeps their seat, and
+# the match stays up, for them to come back with their token, see resume()
+RESUME_GRACE = float(os.environ.get("RESUME_GRACE","60"))
+# bytes of randomness in a reconnect token
+TOKEN_SIZE = 16
+
+async def start_game(websocket, computer=False, handoff=None, player_id=None):
     """
     part2 handler to create a game for the first time 
-    """
-    game = Connect4()
-    connected_websockets = {websocket}
 
-    # generates random url safe string with arguments' amount of bytes
-    join_key = secrets.token_urlsafe(JOIN_KEY_SIZE)
-    watch_key = secrets.token_urlsafe(JOIN_KEY_SIZE)
+    with computer=True, player 2 is the solver instead of whoever follows the join link
 
-    CURR_MATCHES[join_key] = game,connected_websockets
-    # empty set as the player who makes a game is meant to be player 1
-    WATCHING_MATCHES[watch_key] = game,set()
+    handoff, if given, is a future set to the match once it is in the
+    registry, for the quick play opponent to join it, see quick_play()
 
-    WATCH_KEY_TO_JOIN_KEY[watch_key] = join_key
-    JOIN_KEY_TO_WATCH_KEY[join_key] = watch_key
+    player_id identifies the player for ratings, see ratings.py
+    """
+    match = new_match(computer)
+    join_key,watch_key,game = match.join_key,match.watch_key,match.game
+
+    # players are sent to through their outbox, so a slow connection only
+    # ever holds up its own frames
+    outbox = Outbox(websocket,snapshot=functools.partial(match.history.snapshot,game))
+    match.players[outbox] = PLAYER1
+    match.tokens[PLAYER1] = secrets.token_urlsafe(TOKEN_SIZE)
+    if player_id:
+        match.player_ids[PLAYER1] = player_id
+
+    await MATCHES.add(match)
+    LIFECYCLE.acquire(match)
+    if handoff is not None:
+        handoff.set_result(match)
 
     try:
         # send game information to frontend 
-        await send_new_game(websocket,join_key=join_key,watch_key=watch_key)
+        await send_new_game(outbox,join_key=join_key,watch_key=watch_key,token=match.tokens[PLAYER1],player=PLAYER1)
 
         # player 1 starts playing
-        await play(player_websocket=websocket,game=game,player=PLAYER1,connected_websockets=connected_websockets,game_watch_key=watch_key)
+        opponent = functools.partial(solver.choose_move,book=OPENING_BOOK) if computer else None
+        await play(player_outbox=outbox,match=match,player=PLAYER1,opponent=opponent)
     finally:
-        # deleting the entry in the open matches because 
-        # when the connection is closed this game and the websocket data structure
-        # are no longer valid, but will be kept in memory
-        print(f"removing match with join_key:", join_key)
-        del CURR_MATCHES[join_key]
+        # the match is deleted from the registry once nobody is connected to it,
+        # as the game and the websocket data structures are no longer needed
+        # but would be kept in memory
+        logs.event("player_left",join=join_key,player=PLAYER1)
+        await leave_seat(match,outbox)
+
+
+def new_match(computer=False):
+    """
+    a match with a new game and keys, not in the registry yet
+    """
+    game = Connect4()
+
+    # generates random url safe string with arguments' amount of bytes
+    # prefixed with this worker's id so other workers know where to send
+    # people following the links
+    join_key = workers.key_prefix() + secrets.token_urlsafe(JOIN_KEY_SIZE)
+    watch_key = workers.key_prefix() + secrets.token_urlsafe(JOIN_KEY_SIZE)
 
-        # if at any point this player disconnects, we want to also remove this game
-        # from the watchable matches
-        del WATCHING_MATCHES[watch_key]
+    match = Match(join_key,watch_key,game,computer=computer)
+    # empty audience as the player who makes a game is meant to be player 1
+    match.audience = Audience(snapshot=functools.partial(match.history.snapshot,game))
+    return match
 
 
-async def watch(websocket, watch_key):
+async def quick_play(websocket, player_id=None):
+    """
+    puts the player in the quick play queue until someone of about their
+    rating comes along, see matchmaking.py
+
+    whoever waited longer plays red and creates the match as start_game
+    does, the other one joins it as yellow. both are sent the init event
+    with the match's keys and their token, which is how they know they
+    were paired. yellow goes back in the queue if red's match doesn't come
+    within HANDOFF_TIMEOUT
+    """
+    while True:
+        rating = RATINGS.rating(player_id) if player_id else ratings.INITIAL_RATING
+        ticket = QUICK_PLAY.enqueue(websocket,rating)
+        pairing = None
+        # the player may leave while waiting
+        closed = asyncio.ensure_future(websocket.wait_closed())
+        try:
+            await asyncio.wait([ticket.found,closed],return_when=asyncio.FIRST_COMPLETED)
+            if ticket.found.done():
+                pairing = ticket.found.result()
+            if pairing is not None and pairing.first is not ticket:
+                # red sets the match up as soon as they are paired, unless
+                # something went wrong on their side
+                await asyncio.wait([pairing.match,closed],timeout=HANDOFF_TIMEOUT,return_when=asyncio.FIRST_COMPLETED)
+            left = closed.done()
+        finally:
+            closed.cancel()
+            QUICK_PLAY.cancel(ticket)
+        if pairing is None or left and pairing.first is not ticket:
+            logs.event("quick_play_left",waited=round(QUICK_PLAY.clock() - ticket.since,3))
+            return
+
+        if pairing.first is ticket:
+            await start_game(websocket,handoff=pairing.match,player_id=player_id)
+            return
+
+        if not pairing.match.done():
+            logs.event("quick_play_handoff_timeout",level=logging.WARNING,timeout=HANDOFF_TIMEOUT)
+            continue
+        match = pairing.match.result()
+        if match.closed:
+            # red left as soon as they were paired, wait for someone else
+            continue
+        logs.event(
+            "quick_play_paired",join=match.join_key,
+            waited=round(QUICK_PLAY.clock() - pairing.first.since,3),gap=abs(pairing.first.rating - ticket.rating),
+        )
+        await join(websocket,match.join_key,player=PLAYER2,player_id=player_id)
+        return
+
+
+async def watch(websocket, watch_key, since=None):
     """
     takes in a websocket connection that has a watch_key from the
     parsed URI.
 
-    adds the websocket to the entry in WATCHING_MATCHES so it can be
+    adds the websocket to the audience of the match so it can be
     in the loop for game updates
+
+    since is the number of the last event a returning spectator got, it is
+    only sent the ones after it when the match still has them
     """
 
-    game_socket_tuple = WATCHING_MATCHES.get(watch_key)
+    match = await MATCHES.by_watch_key(watch_key)
 
-    if game_socket_tuple is None:
-        await send_error(websocket,error=f"invalid watch key [{watch_key}] provided")
+    if match is None:
+        await send_error(websocket,error=f"invalid watch key [{watch_key}] provided",kind="invalid_key")
         return
 
-    # else we have a valid watch key with an assocated game
-    game,watching_websockets = game_socket_tuple
-
-    watching_websockets.add(websocket)
+    if not match.local:
+        # hosted by another server sharing our registry, follow it from there
+        await watch_remote(websocket,match)
+        return
 
-    WATCHING_MATCHES[watch_key] = [game,watching_websockets]
-    # TODO maybe change this out for something more comprehensive?
+    # else we have a valid watch key with an assocated game
+    game,audience = match.game,match.audience
 
+    # added before the replay: the audience holds back moves that are
+    # already in the replayed state, so nothing is sent twice
+    audience.add(websocket)
+    LIFECYCLE.acquire(match)
 
-    # make sure to replay moves for anyone who joins in after initial creation
-    await replay_current_moves(websocket_that_joined_late=websocket,game=game)
+    try:
+        # make sure to replay moves for anyone who joins in after initial creation
+        await replay_current_moves(websocket_that_joined_late=websocket,match=match,since=since)
+
+        # spectators have nothing to send, what they send anyway is logged
+        # but only so often, see logs.SpectatorChatter
+        chatter = logs.SpectatorChatter(watch=watch_key)
+        async for message in websocket:
+            chatter.log(message)
+    finally:
+        audience.discard(websocket)
+        await LIFECYCLE.release(match)
 
-    async for message in websocket:
-        print(f"\t spectator sent : {message}")
+async def watch_remote(websocket, match):
+    """
+    spectates a match hosted by another server by relaying the events the
+    registry publishes for it
+    """
+    await replay_current_moves(websocket_that_joined_late=websocket,match=match)
+
+    async def ignore_spectator_messages():
+        chatter = logs.SpectatorChatter(watch=match.watch_key)
+        async for message in websocket:
+            chatter.log(message)
+
+    # waited on together with the next event, so the subscription and its
+    # connection to the store go as soon as the spectator does
+    listener = asyncio.create_task(ignore_spectator_messages())
+    frames = MATCHES.follow(match)
+    next_frame = None
+    try:
+        while True:
+            next_frame = asyncio.ensure_future(anext(frames))
+            await asyncio.wait((listener,next_frame),return_when=asyncio.FIRST_COMPLETED)
+            if not next_frame.done():
+                # spectator left
+                break
+            if next_frame.exception() is not None:
+                # StopAsyncIteration: the store went away
+                break
+            await websocket.send(wire.encode_for(websocket,next_frame.result()))
+    finally:
+        listener.cancel()
+        if next_frame is not None and not next_frame.done():
+            next_frame.cancel()
+            await asyncio.wait((next_frame,))
+        await frames.aclose()
 
-async def join(websocket, join_key):
+async def join(websocket, join_key, player=None, player_id=None):
     """
     this handles the event loop of the second player
 
@@ -107,100 +298,506 @@ async def join(websocket, join_key):
         verify that the join_key is valid
         if so, then grab the game and list of websockets associated with that game
 
-        update the entry in the CURR_MATCHES to include the websocket of the second playert
+        add the outbox of the second player to the match's players
             (the one from function argument)
 
         once the connection has completed, remove the websocket from the set associated
         with the game
+
+    player, if given, is the seat asked for by someone reconnecting to a
+    match restored after a restart, see drain()
+
+    player_id identifies the player for ratings, see ratings.py
+
+    the player is sent an init event with the match's keys and the token
+    to take their seat back with, see resume()
     """
 
-    game_socket_tuple = CURR_MATCHES.get(join_key)
+    seat = await take_seat(websocket,join_key,player)
+    if seat is None:
+        return
+    match,player = seat
+    if player_id:
+        match.player_ids[player] = player_id
+    game = match.game
+    outbox = Outbox(websocket,snapshot=functools.partial(match.history.snapshot,game))
+    match.players[outbox] = player
+    token = match.tokens[player] = secrets.token_urlsafe(TOKEN_SIZE)
+    LIFECYCLE.acquire(match)
+
+    opponent = functools.partial(solver.choose_move,book=OPENING_BOOK) if match.computer else None
 
-    if not game_socket_tuple:
-        # invalid join key provided
-        await send_error(websocket,error=f"invalid join key [{join_key}] provided")
+    try:
+        await outbox.send(events.encode_init(match.join_key,match.watch_key,token,player))
+        # make sure to replay moves for anyone who joins in after initial creation
+        await replay_current_moves(websocket_that_joined_late=outbox,match=match)
+        if opponent and game.last_player == player and not game.winner:
+            # the server went down before the computer replied
+            await apply_move(match,PLAYER2,await opponent(game))
+        await play(player_outbox=outbox,match=match,player=player,opponent=opponent)
+    finally:
+        await leave_seat(match,outbox)
+
+async def resume(websocket, join_key, token, seq):
+    """
+    gives a player whose connection dropped their seat back, with the token
+    of their init event, as long as their game isn't over
+
+    seq is the number of the last event they got (see history.py), they are
+    sent the events after it and no others. a "state" snapshot replaces
+    them if the match no longer has them all, or without a usable seq
+
+    their old connection may still look open, e.g. after a phone switched
+    networks: it is closed, the new one takes over
+    """
+    match = await MATCHES.by_join_key(join_key)
+    player = None
+    if match is not None and match.local and isinstance(token,str):
+        # compared as bytes, compare_digest refuses str that aren't ASCII
+        token = token.encode()
+        for seat,seat_token in match.tokens.items():
+            if secrets.compare_digest(seat_token.encode(),token):
+                player = seat
+
+    if player is None:
+        await send_error(websocket,error=f"can't resume match [{join_key}], the token is invalid or expired",kind="invalid_token")
+        return
+    if match.game.finished:
+        await send_error(websocket,error=f"can't resume match [{join_key}], the game is over",kind="game_over")
         return
-    
-    # we know we have a valid game now, since .get returned a tuple
-    game,connected_websockets = game_socket_tuple
-    connected_websockets.add(websocket)
 
-    CURR_MATCHES[join_key] = [game,connected_websockets]
-    # grab the assocated watch jey to play can figure out 
-    # which (if any) spectators to update
-    watch_key = JOIN_KEY_TO_WATCH_KEY[join_key]
+    held = match.held.pop(player,None)
+    if held is not None:
+        # the reference kept on the match is the new connection's
+        held.cancel()
+    else:
+        for old_outbox,seated in list(match.players.items()):
+            if seated == player:
+                # its handler finds the seat taken when it ends, see leave_seat()
+                del match.players[old_outbox]
+                old_outbox.close()
+                asyncio.create_task(old_outbox.websocket.close(1000,"resumed on another connection"))
+        LIFECYCLE.acquire(match)
+
+    game = match.game
+    outbox = Outbox(websocket,snapshot=functools.partial(match.history.snapshot,game))
+    match.players[outbox] = player
+    # queued before any event that follows, nothing in between is missed
+    missed = match.history.since(seq) if type(seq) is int else None
+    if missed is None:
+        outbox.put(match.history.snapshot(game))
+    else:
+        for frame in missed:
+            outbox.put(frame)
+    metrics.RESUMES.inc("snapshot" if missed is None else "delta")
+    logs.event(
+        "player_resumed",join=join_key,player=player,
+        missed=None if missed is None else len(missed),seq=match.history.seq,
+    )
+
+    opponent = functools.partial(solver.choose_move,book=OPENING_BOOK) if match.computer else None
+    try:
+        await play(player_outbox=outbox,match=match,player=player,opponent=opponent)
+    finally:
+        await leave_seat(match,outbox,resumed=True)
 
-    assert(len(connected_websockets)==2)
+async def leave_seat(match, outbox, resumed=False):
+    """
+    a player's connection closed. if their game isn't over, their seat, and
+    with it the match, is kept for RESUME_GRACE seconds for them to resume()
 
-    # make sure to replay moves for anyone who joins in after initial creation
-    await replay_current_moves(websocket_that_joined_late=websocket,game=game)
-    await play(player_websocket=websocket,game=game,player=PLAYER2,connected_websockets=connected_websockets,game_watch_key=watch_key)
+    a seat isn't kept while the other one was never taken, e.g. red leaving
+    a quick play match before yellow joined, nor for a player who never got
+    the init event with their token. resumed is true for a connection of
+    resume(), whose player has it already
+    """
+    outbox.close()
+    player = match.players.pop(outbox,None)
+    if player is None:
+        # taken over by a resumed connection, or gone with the match
+        await LIFECYCLE.release(match)
+        return
+    got_token = resumed or outbox.sent > 0
+    if match.game.finished or match.closed or DRAINING or player not in match.tokens or match.seats or not got_token:
+        await LIFECYCLE.release(match)
+        return
+    # holds on to the player's reference until then
+    match.held[player] = asyncio.create_task(hold_seat(match,player))
+    logs.event("player_dropped",join=match.join_key,player=player,grace=RESUME_GRACE)
 
+async def hold_seat(match, player):
+    """
+    keeps a dropped player's seat for RESUME_GRACE seconds, unless cancelled
+    by resume()
+    """
+    await asyncio.sleep(RESUME_GRACE)
+    del match.held[player]
+    match.tokens.pop(player,None)
+    metrics.RESUMES.inc("expired")
+    logs.event("resume_expired",join=match.join_key,player=player)
+    await LIFECYCLE.release(match)
+
+async def take_seat(websocket, join_key, player=None):
+    """
+    finds the match of a join key and gives the player a seat in it
 
-    return 
-    # connected_websockets.
+    returns (match, player), or None after telling the client why not
+    """
+    match = await MATCHES.by_join_key(join_key)
 
-async def play(player_websocket,game,player,connected_websockets,game_watch_key):
+    if match is None:
+        # invalid join key provided
+        await send_error(websocket,error=f"invalid join key [{join_key}] provided",kind="invalid_key")
+        return None
+
+    if not match.local:
+        await send_error(websocket,error=f"match [{join_key}] is hosted on another server",kind="remote_match")
+        return None
+
+    if not match.seats:
+        if match.computer:
+            await send_error(websocket,error=f"match [{join_key}] is against the computer, watch it instead",kind="computer_match")
+        else:
+            await send_error(websocket,error=f"match [{join_key}] already has two players",kind="match_full")
+        return None
+    
+    # we know we have a valid game now, since the registry found it
+    # usually the seat left is yellow, in a match recovered after a restart
+    # players say which one they had, or else whoever comes back first plays red
+    if player is None:
+        player = match.seats[0]
+    elif player not in match.seats:
+        await send_error(websocket,error=f"{player} is taken in match [{join_key}]",kind="seat_taken")
+        return None
+    match.seats.remove(player)
+    return match,player
+
+async def play(player_outbox,match,player,opponent=None):
     """
     arbitrarily takes in a game, and a particular player
-    then takes in any message from the player_websocket 
+    then takes in any message from the player's websocket 
     and sees if it can happen based on Connect4 game logic
 
     if an action requiring an event happens (such as playing a move and/or ending the game)
-    then that information will be sent to all websockets in the set of 
-    "connected_websockets" associated with this game
+    then that information will be queued on every outbox in the set of 
+    players associated with this match, and published to its spectators
+
+    opponent, if given, is a coroutine function picking the other player's
+    column for a game, which is then played after each of this player's moves
     """
-    async for message in player_websocket:
-        event = json.loads(message)
+    game = match.game
+    other_player = PLAYER2 if player == PLAYER1 else PLAYER1
+    limiter = throttle.TokenBucket()
+    async for message in player_outbox.websocket:
+        if not limiter.take():
+            if limiter.flooding:
+                await player_outbox.websocket.close(throttle.FLOOD_CLOSE_CODE,"too many messages")
+                break
+            if limiter.dropped == 1:
+                # only the first dropped message gets a reply, a flood of
+                # errors would just feed the flood
+                await send_error(player_outbox,error="Too many messages, slow down.",kind="throttled")
+            continue
 
-        column = get_col_from_play_event(event)
+        try:
+            column = parse_play_message(message)
+        except ValueError as exc:
+            # malformed message, tell the client instead of dropping the connection
+            await send_error(player_outbox,error=exc,kind="invalid_message")
+            continue
 
         try:
-            landing_row = game.play(player,column) 
+            await apply_move(match,player,column)
         except RuntimeError as exc:
             # either the column is full or it is not your turn
-            await send_error(player_websocket,error=exc)
+            await send_error(player_outbox,error=exc,kind="illegal_move")
             continue
 
-        # if getting here, then no runtime errors occurred, 
-        # thus we have a valid play from a player on their turn
-        winner = game.winner
-        await send_move(connected_websockets,player=player,row=landing_row,column=column,game_watch_key=game_watch_key)
+        if opponent and not game.winner:
+            await apply_move(match,other_player,await opponent(game))
+
+
+async def apply_move(match,player,column):
+    """
+    plays a move in the match's game and sends it out
+
+    raises RuntimeError from Connect4.play if the move isn't allowed
+    """
+    # moves can still be played once someone won, the game only counts once
+    decided = match.game.winner is not None
+    landing_row = match.game.play(player,column) 
+
+    # if getting here, then no runtime errors occurred, 
+    # thus we have a valid play from a player on their turn
+    LIFECYCLE.touch(match)
+    winner = match.game.winner
+    await send_move(match,player=player,row=landing_row,column=column)
+
+    if not decided and (winner or len(match.game.log) == 42):
+        # before the "win" event, main.js hangs up as soon as it gets it
+        rate_game(match)
+
+    if winner:
+        await send_winner(match,winner=winner)
+
+
+async def session(websocket, opening):
+    """
+    serves a multiplexed session until the client leaves, see sessions.py
+
+    every message names its match with a "match" id the client picks:
+        {type: "start", match: "m1"}               creates a match ("computer": true
+                                                   to play the computer), replies init
+        {type: "join", match: "m2", join: "AbC"}   takes a seat, "player" optional
+        {type: "watch", match: "m3", watch: "AdE"} follows a match
+        {type: "play", match: "m2", column: 3}
+        {type: "leave", match: "m3"}
+
+    opening is the {type: "session"} message, its player_id counts for
+    every match played in the session
+    """
+    try:
+        player_id = identify(opening)
+    except ValueError as exc:
+        logs.event("invalid_init",level=logging.WARNING)
+        await send_error(websocket,error=exc,kind="invalid_init")
+        return
+    mux = sessions.Session(websocket,LIFECYCLE)
+    SESSIONS.add(mux)
+    limiter = throttle.TokenBucket(
+        throttle.RATE * sessions.THROTTLE_FACTOR,throttle.BURST * sessions.THROTTLE_FACTOR,
+    )
+    try:
+        async for message in websocket:
+            if not limiter.take():
+                if limiter.flooding:
+                    await websocket.close(throttle.FLOOD_CLOSE_CODE,"too many messages")
+                    break
+                if limiter.dropped == 1:
+                    await send_error(websocket,error="Too many messages, slow down.",kind="throttled")
+                continue
+            try:
+                request = events.loads(message)
+            except ValueError:
+                request = None
+            if not isinstance(request,dict) or not sessions.valid_id(request.get("match")):
+                await send_error(websocket,error="session messages must be JSON objects with a match id",kind="invalid_message")
+                continue
+            await session_request(mux,request,player_id)
+    finally:
+        SESSIONS.discard(mux)
+        await mux.close()
+
+async def session_request(mux, request, player_id):
+    """
+    handles one message of a session, replies are tagged with its match id
+    """
+    kind = request.get("type")
+    match_id = request["match"]
+    # a channel that isn't added to the session only sends the replies
+    channel = mux.channels.get(match_id) or sessions.Channel(mux,match_id)
+
+    if kind == "play":
+        if channel.player is None:
+            await send_error(channel,error=f"not playing in match [{match_id}]",kind="invalid_message")
+            return
+        try:
+            column = get_col_from_play_event(request)
+        except ValueError as exc:
+            await send_error(channel,error=exc,kind="invalid_message")
+            return
+        match = channel.match
+        try:
+            await apply_move(match,channel.player,column)
+        except RuntimeError as exc:
+            await send_error(channel,error=exc,kind="illegal_move")
+            return
+        if match.computer and not match.game.finished:
+            reply_as_computer(channel)
+        return
+
+    if kind == "leave":
+        await mux.leave(channel)
+        return
 
-        if winner:
-            await send_winner(connected_websockets,winner=winner,game_watch_key=game_watch_key)
+    if kind not in ("start","join","watch"):
+        await send_error(channel,error=f"unknown session message type: {kind}",kind="invalid_message")
+        return
+    if channel.match is not None:
+        await send_error(channel,error=f"match id [{match_id}] is already in use",kind="invalid_message")
+        return
+    if len(mux) >= sessions.MAX_CHANNELS:
+        await send_error(channel,error=f"a session has at most {sessions.MAX_CHANNELS} matches",kind="too_many_matches")
+        return
+
+    if kind == "start":
+        if DRAINING:
+            await send_reconnect(channel)
+            return
+        match = new_match(bool(request.get("computer")))
+        game = match.game
+        if player_id:
+            match.player_ids[PLAYER1] = player_id
+        await MATCHES.add(match)
+        mux.add(channel,match,PLAYER1,Outbox(channel,snapshot=functools.partial(match.history.snapshot,game)))
+        await send_new_game(channel,join_key=match.join_key,watch_key=match.watch_key)
+        return
+
+    key = request.get(kind)
+    if not isinstance(key,str):
+        await send_error(channel,error=f"a {kind} key is needed",kind="invalid_message")
+        return
+    if workers.owner_of(key) != workers.WORKER_ID:
+        # a connection can be relayed to another worker, not part of one
+        await send_error(channel,error=f"match [{key}] is hosted by another worker",kind="remote_match")
+        return
+
+    if kind == "join":
+        seat = await take_seat(channel,key,request.get("player"))
+        if seat is None:
+            return
+        match,player = seat
+        game = match.game
+        if player_id:
+            match.player_ids[player] = player_id
+        mux.add(channel,match,player,Outbox(channel,snapshot=functools.partial(match.history.snapshot,game)))
+        await replay_current_moves(websocket_that_joined_late=channel,match=match)
+        if match.computer and game.last_player == player and not game.finished:
+            # the server went down before the computer replied
+            reply_as_computer(channel)
+        return
+
+    match = await MATCHES.by_watch_key(key)
+    if match is None:
+        await send_error(channel,error=f"invalid watch key [{key}] provided",kind="invalid_key")
+        return
+    # in the audience before the replay, as in watch()
+    mux.add(channel,match)
+    await replay_current_moves(websocket_that_joined_late=channel,match=match,since=request.get("since"))
+    if not match.local:
+        channel.follower = asyncio.create_task(follow_remote(channel,match))
+
+def reply_as_computer(channel):
+    """
+    plays the computer's move in a session's match in a task of its own, so
+    the session goes on reading messages for its other matches while the
+    solver thinks. one at a time per match: the player can't move until the
+    computer has anyway
+    """
+    if channel.reply is None or channel.reply.done():
+        channel.reply = asyncio.create_task(computer_move(channel.match))
+
+async def computer_move(match):
+    await apply_move(match,PLAYER2,await solver.choose_move(match.game,book=OPENING_BOOK))
+
+async def follow_remote(channel, match):
+    """
+    relays the events the registry publishes for a match hosted by another
+    server to a session's channel
+    """
+    try:
+        async for frame in MATCHES.follow(match):
+            await channel.send(frame)
+    except websockets.ConnectionClosed:
+        pass
 
 
 async def handler(websocket):
+    """
+    a connection closing under us, dropped by the client or closed with
+    RESTART_CLOSE_CODE by drain(), is how connections end, not an error
+    """
+    try:
+        await dispatch(websocket)
+    except websockets.ConnectionClosed:
+        pass
+
+async def dispatch(websocket):
     # game creation is now UI based
     # we don't actually create a connection until we recieve 
     # a message saying that we want to start a game
     first_message = await websocket.recv()
 
-    event = json.loads(first_message)
-    print("event received", event)
+    try:
+        if isinstance(first_message,bytes):
+            # binary wire protocol, see wire.py
+            event = wire.decode_client_message(first_message)
+        else:
+            event = events.loads(first_message)
+    except ValueError:
+        event = None
+
+    if isinstance(event,dict) and event.get("type") == "leaderboard":
+        # not a game, only questions about the leaderboard
+        logs.event("init_received",mode="leaderboard")
+        await leaderboard(websocket,first_query=event)
+        return
+
+    if isinstance(event,dict) and event.get("type") == "session":
+        # many matches over this one connection
+        logs.event("init_received",mode="session")
+        await session(websocket,opening=event)
+        return
 
     # should only ever recieve an opening connection message
     # from the beginning
-    assert event["type"] == "init"
+    if not isinstance(event,dict) or event.get("type") != "init":
+        logs.event("invalid_init",level=logging.WARNING)
+        await send_error(websocket,error="the first message must be an init event",kind="invalid_init")
+        return
 
     # now we check whehter there is a join key
     join_key = event.get("join")
     watch_key = event.get("watch")
+    computer = event.get("computer")
+    quick = event.get("quick")
+    if not all(key is None or isinstance(key,str) for key in (join_key,watch_key)):
+        logs.event("invalid_init",level=logging.WARNING)
+        await send_error(websocket,error="join and watch keys must be strings",kind="invalid_init")
+        return
+    try:
+        player_id = identify(event)
+    except ValueError as exc:
+        logs.event("invalid_init",level=logging.WARNING)
+        await send_error(websocket,error=exc,kind="invalid_init")
+        return
+
+    owner = workers.owner_of(join_key or watch_key)
+    if owner != workers.WORKER_ID:
+        # the match lives in another worker process, hand the connection over
+        logs.event("init_received",mode="relay",worker=owner,join=join_key,watch=watch_key)
+        await relay.forward(websocket,port=PORT,worker_id=owner,first_message=first_message)
+
+    elif join_key and "token" in event:
+        # back after losing the connection
+        logs.event("init_received",mode="resume",join=join_key)
+        await resume(websocket, join_key=join_key, token=event.get("token"), seq=event.get("seq"))
 
-    if join_key:
-        print(f"joining...")
+    elif join_key:
+        logs.event("init_received",mode="join",join=join_key)
         # second player has joined, let's process it!
-        await join(websocket, join_key=join_key)
+        await join(websocket, join_key=join_key, player=event.get("player"), player_id=player_id)
 
     elif watch_key:
         # second player has joined, let's process it!
-        print(f"watching...")
-        await watch(websocket, watch_key=watch_key)
+        logs.event("init_received",mode="watch",watch=watch_key)
+        await watch(websocket, watch_key=watch_key, since=event.get("since"))
+    elif DRAINING:
+        # shutting down, the game can start on the next server
+        logs.event("init_received",mode="refused")
+        await send_reconnect(websocket)
+    elif computer:
+        # single player game, the server plays yellow
+        logs.event("init_received",mode="computer")
+        await start_game(websocket, computer=True, player_id=player_id)
+    elif quick:
+        # paired with whoever comes along, no link to share
+        logs.event("init_received",mode="quick")
+        await quick_play(websocket, player_id=player_id)
     else:
         # now we know we're starting a game, call on start and let it handle the event_loop
-        print(f"starting...")
-        await start_game(websocket)
+        logs.event("init_received",mode="start")
+        await start_game(websocket, player_id=player_id)
 
 
 
@@ -208,27 +805,74 @@ async def handler(websocket):
 
 # HELPER FUNCTIONS
 
-async def replay_current_moves(websocket_that_joined_late,game):
+async def replay_current_moves(websocket_that_joined_late,match,since=None):
     """
     function to replay all the moves that have currently happened for a particular websocket
     this is to handle the case when a player/spectator opens their connection
     after a move has been made.
+
+    the whole board goes out as a single "state" event instead of one
+    "play" event per move, numbered like the match's last event (see
+    history.py) unless the match is hosted somewhere else
+
+    a spectator giving the number of the last event it got (since) is sent
+    the events after it instead, if the match still keeps them and, in
+    JSON, they are smaller than the whole board
+    """
+    if since is not None:
+        missed = match.history.since(since) if match.local and type(since) is int else None
+        if missed and not wire.is_binary(websocket_that_joined_late):
+            if sum(map(len,missed)) > len(match.history.snapshot(match.game)):
+                missed = None
+        metrics.SPECTATOR_REPLAYS.inc("snapshot" if missed is None else "delta")
+        if missed is not None:
+            # written right away, in order, before the audience sends anything newer
+            for frame in missed:
+                spectators.broadcast([websocket_that_joined_late],frame)
+            metrics.REPLAY_BYTES.observe(sum(map(len,missed)))
+            return
+
+    game = match.game
+    if not game.moves:
+        # nothing to draw yet
+        return
+
+    start = time.perf_counter()
+    jsoned_event = match.history.snapshot(game) if match.local else events.encode_state(game)
+    metrics.ENCODE_SECONDS.observe(time.perf_counter() - start)
+    metrics.REPLAY_BYTES.observe(len(jsoned_event))
+    await websocket_that_joined_late.send(wire.encode_for(websocket_that_joined_late,jsoned_event))
+
+
+# the exact text JSON.stringify produces in main.js for each column
+PLAY_MESSAGES = {f'{{"type":"play","column":{column}}}': column for column in range(7)}
+# and the single byte it sends instead with the binary protocol
+PLAY_MESSAGES.update(wire.PLAY_MESSAGES)
+
+def parse_play_message(message) -> int:
+    """
+    returns the column of a "play" message from a player
+
+    messages from main.js are looked up as they are, anything else goes
+    through the json parser (or the binary decoder of wire.py for binary
+    frames) and get_col_from_play_event
+
+    raises ValueError for anything that isn't a valid play
     """
-    # https://websockets.readthedocs.io/en/stable/intro/tutorial2.html#solution
-    # replay moves in their version copies the move list
-    # to avoid raising an exception
-    # I want to not update this until I see that exception
-    for player,column,row in game.moves:
-        event = {
-                    "type": "play",
-                    "player": player,
-                    "column": column,
-                    "row": row 
-                }
+    column = PLAY_MESSAGES.get(message)
+    if column is not None:
+        return column
 
-        jsoned_event = json.dumps(event)
-        await websocket_that_joined_late.send(jsoned_event)
+    if isinstance(message,bytes):
+        return get_col_from_play_event(wire.decode_client_message(message))
 
+    try:
+        event = events.loads(message)
+    except ValueError:
+        raise ValueError("message is not valid JSON")
+    if not isinstance(event, dict):
+        raise ValueError("message is not a JSON object")
+    return get_col_from_play_event(event)
 
 def get_col_from_play_event(event) -> int:
     """
@@ -236,8 +880,8 @@ def get_col_from_play_event(event) -> int:
 
     if its a play, parse, error check, and return the column
 
-    no need to check if the column is in bounds as the `main.js` playMove function
-    has column and row bound checking 
+    the column is checked here even though the `main.js` playMove function
+    has column and row bound checking, as not every client is main.js
     """
 
     event_type = event.get("type")
@@ -251,82 +895,283 @@ def get_col_from_play_event(event) -> int:
     column = event.get("column")
 
     if column is None:
-        print(f"col val : {column}")
         raise ValueError(f"no column given")
 
+    # bool is a subclass of int, but true isn't a column
+    if type(column) is not int or not 0 <= column < 7:
+        raise ValueError("column must be between 0 and 6.")
+
     return column
 
-async def send_error(websocket,error):
+async def send_error(websocket,error,kind="other"):
     """
     sends the given error via the websocket
 
     type: "error"
     message: string
-    """
-    event = {
-            "type": "error",
-            "message": str(error) 
-            }
 
-    jsoned_event = json.dumps(event)
-    await websocket.send(jsoned_event)
+    kind is what the error is counted as in the metrics
+    """
+    metrics.ERRORS.inc(kind)
+    # str() first so the memoized encoding is keyed on the message text
+    jsoned_event = events.encode_error(str(error))
+    await websocket.send(wire.encode_for(websocket,jsoned_event))
 
-async def send_move(connected_websockets,player,row,column,game_watch_key):
+async def send_move(match,player,row,column):
     """
     after validating the row and column, sends a move with that coordinate
-    to all given websockets
+    to the match's players and spectators, and records it in the registry
+
+    nothing here waits on a connection, the players' writer tasks do the sending
     """
+    # a lookup in a precomputed table, numbered by splicing, not worth timing
+    jsoned_event = match.history.append(events.encode_play(player,column,row))
 
-    event = {
-            "type":"play",
-            "player": player,
-            "column": column,
-            "row": row
-            }
-    jsoned_event = json.dumps(event)
-    for websocket in connected_websockets:
-        await websocket.send(jsoned_event)
+    # only some moves are timed, see metrics.py
+    timed = metrics.PUBLISH_SECONDS.sample()
+    if timed:
+        start = time.perf_counter()
+    publish(match.players,jsoned_event)
 
-    _,watching_websockets = WATCHING_MATCHES[game_watch_key]
-    
-    websockets.broadcast(watching_websockets,jsoned_event)
+    # spectators are sent to by the audience's shard tasks, off this coroutine
+    match.audience.publish(jsoned_event)
+    if timed:
+        metrics.PUBLISH_SECONDS.observe(time.perf_counter() - start)
+    metrics.MOVES.inc()
+
+    await MATCHES.record_move(match,jsoned_event)
 
-async def send_winner(connected_websockets,winner,game_watch_key):
+async def send_winner(match,winner):
     """
     sends a correctly formatted event for the winner winning in a game of connect 4
 
     inputs:
-        set of websockets to send message to
+        match whose players and spectators the message goes to
         winner: string of the color of the winning player, provided by Connect4.winner
     """
     # winning message, game is over
     # sending message of type "win", with player color
-    event = {
-            "type": "win",
-            "player": winner
-            }
-
-    # not sure what the difference is here between json.dump and json.dumps
-    jsoned_event = json.dumps(event)
-    for websocket in connected_websockets:
-        await websocket.send(jsoned_event)
-    _,watching_websockets = WATCHING_MATCHES[game_watch_key]
-    
-    websockets.broadcast(watching_websockets,jsoned_event)
+    jsoned_event = match.history.append(events.encode_win(winner))
+    publish(match.players,jsoned_event)
+
+    # spectators are sent to by the audience's shard tasks, off this coroutine
+    match.audience.publish(jsoned_event)
+    metrics.WINS.inc()
+
+    await MATCHES.record_win(match,jsoned_event)
+
+async def send_reconnect(websocket,**keys):
+    """
+    sends a "reconnect" event with the keys to come back with, see drain()
+    """
+    await websocket.send(wire.encode_for(websocket,events.encode_reconnect(**keys)))
 
-async def send_new_game(websocket,join_key,watch_key):
+async def send_new_game(websocket,join_key,watch_key,token=None,player=None):
     """
     sends the initGame messgae with a join created upon the first player opening the websocket
+
+    token, if given, is the reconnect token of the player's seat, see resume()
+    """
+    jsoned_event = events.encode_init(join_key,watch_key,token,player)
+    logs.event("game_created",join=join_key,watch=watch_key)
+    await websocket.send(wire.encode_for(websocket,jsoned_event))
+
+async def recover_matches(match_journal):
+    """
+    puts the matches left in the journal by the previous run back in the
+    registry, so players and spectators can reconnect with their old join
+    and watch keys
+
+    the previous process may still be draining, its matches are taken over
+    once it lets go of the journal. new games are served meanwhile
+    """
+    while not match_journal.lock(blocking=False):
+        await asyncio.sleep(HANDOVER_POLL_INTERVAL)
+    for entry in match_journal.open():
+        game = Connect4()
+        for player, column, _ in Moves(entry.log):
+            game.play(player, column)
+        match = Match(entry.join_key,entry.watch_key,game,computer=entry.computer)
+        match.audience = Audience(snapshot=functools.partial(match.history.snapshot,game))
+        # events keep their numbers, the ones before the restart are gone
+        match.history.seq = len(entry.log) + (game.winner is not None)
+        # both players are gone, they take their seats back with the join key
+        match.seats = [PLAYER1] if entry.computer else [PLAYER1,PLAYER2]
+        await MATCHES.add(match)
+        # nobody holds the match yet, if nobody comes back it goes idle
+        LIFECYCLE.touch(match)
+        logs.event("match_recovered",join=entry.join_key,watch=entry.watch_key,moves=len(entry.log))
+
+async def load_ratings():
+    """
+    loads the ratings saved by the previous run once it lets go of them,
+    games finished meanwhile count after that
+    """
+    while not RATINGS.lock(blocking=False):
+        await asyncio.sleep(HANDOVER_POLL_INTERVAL)
+    RATINGS.open()
+    logs.event("ratings_loaded",players=len(RATINGS.leaderboard))
+
+def identify(event):
+    """
+    the player_id of an init event, None if it has none or an unusable one
+
+    a display name sent along with it is recorded for the leaderboard. raises
+    ValueError for a name that isn't a string or is longer than MAX_NAME_SIZE
+    """
+    name = event.get("name")
+    if name is not None:
+        if not isinstance(name,str):
+            raise ValueError("name must be a string")
+        name = name.strip()
+        if len(name) > ratings.MAX_NAME_SIZE:
+            raise ValueError(f"name must be at most {ratings.MAX_NAME_SIZE} characters")
+    player_id = event.get("player_id")
+    if not isinstance(player_id,str) or not 0 < len(player_id) <= ratings.MAX_ID_SIZE:
+        return None
+    if name:
+        RATINGS.rename(player_id,name)
+    return player_id
+
+def rate_game(match):
     """
-    event = {
-            "type": "init",
-            "join": join_key,
-            "watch": watch_key
-            }
+    updates the players' ratings once the game is over and sends each one
+    a "rating" event, for games between two players who sent a player_id
+    """
+    red_id = match.player_ids.get(PLAYER1)
+    yellow_id = match.player_ids.get(PLAYER2)
+    if not red_id or not yellow_id or red_id == yellow_id:
+        # anonymous, against the computer, or against yourself
+        return
+    score = {PLAYER1: 1.0, PLAYER2: 0.0}.get(match.game.winner,0.5)
+    changes = dict(zip((PLAYER1,PLAYER2),RATINGS.record(red_id,yellow_id,score)))
+    metrics.RATED_GAMES.inc()
+    for outbox,player in match.players.items():
+        player_id = match.player_ids[player]
+        outbox.put(events.encode_rating(RATINGS.rating(player_id),changes[player],RATINGS.rank(player_id)))
+
+async def leaderboard(websocket, first_query):
+    """
+    answers leaderboard queries until the client leaves, the first one
+    being the connection's first message
+
+        {type: "leaderboard", start: 1, count: 10, player_id: "..."}
+
+    every field but the type is optional. the reply lists `count` players
+    (up to LEADERBOARD_PAGE) from rank `start` on, and with a player_id,
+    that player's own rank and rating
+    """
+    await send_leaderboard(websocket,first_query)
+    limiter = throttle.TokenBucket()
+    async for message in websocket:
+        if not limiter.take():
+            if limiter.flooding:
+                await websocket.close(throttle.FLOOD_CLOSE_CODE,"too many messages")
+                break
+            continue
+        try:
+            query = events.loads(message)
+        except ValueError:
+            query = None
+        if not isinstance(query,dict) or query.get("type") != "leaderboard":
+            await send_error(websocket,error="expected a leaderboard query",kind="invalid_message")
+            continue
+        await send_leaderboard(websocket,query)
+
+async def send_leaderboard(websocket, query):
+    start = query.get("start",1)
+    count = query.get("count",10)
+    if type(start) is not int or type(count) is not int or start < 1 or count < 0:
+        await send_error(websocket,error="start must be a positive integer and count not negative",kind="invalid_message")
+        return
+    entries = [
+        (rank,player.name or "anonymous",player.rating)
+        for rank,player in RATINGS.top(min(count,LEADERBOARD_PAGE),start)
+    ]
+    you = None
+    player_id = query.get("player_id")
+    rank = RATINGS.rank(player_id) if isinstance(player_id,str) else None
+    if rank is not None:
+        you = {"rank": rank, "rating": round(RATINGS.rating(player_id))}
+    await websocket.send(wire.encode_for(websocket,events.encode_leaderboard(start,entries,you)))
+
+def process_request(connection, request):
+    """
+    serves /metrics over plain HTTP on the websocket port, every other
+    request goes on to the websocket handshake
+    """
+    if request.path == "/metrics":
+        response = connection.respond(200, metrics.render())
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = metrics.CONTENT_TYPE
+        return response
+    return compression.process_request(connection, request)
+
+def in_progress():
+    """
+    matches hosted here with a game being played: unfinished and with both
+    players connected
+    """
+    return [
+        match for match in MATCHES
+        if not match.game.finished and (len(match.players) == 2 or match.computer and match.players)
+    ]
+
+async def drain(server,timeout=DRAIN_TIMEOUT):
+    """
+    shuts down without cutting matches short, on SIGTERM
+
+    the server stops listening right away so the next process can start on
+    the same port, and new games are turned away with a "reconnect" event,
+    as are the players waiting for a quick play opponent.
+    games in progress get `timeout` seconds to finish. then the journal (if
+    any) is closed with the unfinished matches in it for the next process,
+    and everyone still connected is sent a "reconnect" event with the keys
+    to come back with, and disconnected
+    """
+    global DRAINING
+    DRAINING = True
+    server.close(close_connections=False)
+    # players waiting for a quick play opponent queue again on the next server
+    await asyncio.gather(
+        *(send_reconnect(ticket.player) for ticket in QUICK_PLAY.clear()),
+        return_exceptions=True,
+    )
 
-    jsoned_event = json.dumps(event)
-    print(f"sending event {jsoned_event}")
-    await websocket.send(jsoned_event)
+    event_loop = asyncio.get_running_loop()
+    deadline = event_loop.time() + timeout
+    logs.event("drain_started",in_progress=len(in_progress()),timeout=timeout)
+    while in_progress() and event_loop.time() < deadline:
+        await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+    unfinished = len(in_progress())
+    # before anyone is told to come back, the next process may be waiting
+    # for them
+    if MATCHES.journal is not None:
+        MATCHES.journal.close()
+    RATINGS.close()
+    logs.event("drain_done",unfinished=unfinished,saved=MATCHES.journal is not None)
+
+    # connections relayed to another worker are left to it, it is draining too
+    connections = set(server.connections) - relay.FORWARDED
+    sends = []
+    for match in MATCHES:
+        for outbox,player in match.players.items():
+            # the last frame, sent directly instead of after what is queued
+            outbox.close()
+            connections.add(outbox.websocket)
+            sends.append(send_reconnect(outbox.websocket,join=match.join_key,player=player))
+        watchers = list(match.audience)
+        match.audience.close()
+        connections.update(watchers)
+        sends.extend(send_reconnect(spectator,watch=match.watch_key) for spectator in watchers)
+    await asyncio.gather(*sends,return_exceptions=True)
+    # anyone else, e.g. following a match on another server, only gets the
+    # close code
+    await asyncio.gather(
+        *(websocket.close(RESTART_CLOSE_CODE,"server restarting") for websocket in connections),
+        return_exceptions=True,
+    )
 
 # END OF HELPER FUNCTIONS
 
@@ -340,18 +1185,74 @@ async def main():
 
     # added event_loop and stop syntax to allow a SIGTERM
     # to end the serve() loop
+    # log lines are written by a thread, the event loop only queues them
+    log_listener = logs.start()
+
+    # with JOURNAL_PATH set, matches are logged to disk and those of the
+    # previous run are brought back, see recover_matches
+    MATCHES.journal = journal.from_env()
+    # with RATINGS_PATH set, ratings are saved there and loaded on startup
+    global RATINGS
+    RATINGS = ratings.from_env()
+
     event_loop = asyncio.get_running_loop()
     stop = event_loop.create_future()
     event_loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
 
-    port = int(os.environ.get("PORT","8001"))
-    async with websockets.serve(handler, "", port):
-        # handle incoming connection on port "port" 
-        # sending connections over to the handler()
-        # meanwhile, this "await stop" line will keep running the serve()
-        # until stop actually returns something and ends
-        # then when stop ends, main finishes execution, shutting down the websocket
-        await stop
+    # with several workers they all listen on PORT, and each also listens on a
+    # unix socket for connections relayed from the others
+    multi_worker = workers.WORKER_COUNT > 1
+    # max_size rejects oversized frames before they are even buffered
+    # clients asking for the binary subprotocol get compact frames, everyone
+    # else gets JSON
+    # compression is negotiated per connection by compression.process_request,
+    # players get none and spectators a tuned permessage-deflate
+    # process_request also answers GET /metrics
+    async with websockets.serve(
+        handler, "", PORT,
+        reuse_port=multi_worker,
+        max_size=throttle.MAX_MESSAGE_SIZE,
+        select_subprotocol=wire.select_subprotocol,
+        compression=None,
+        process_request=process_request,
+    ) as server:
+        if MATCHES.journal is not None:
+            recovery = asyncio.create_task(recover_matches(MATCHES.journal))
+        if RATINGS.path is not None:
+            ratings_loader = asyncio.create_task(load_ratings())
+        if multi_worker:
+            relay_server = await relay.serve(handler,port=PORT,worker_id=workers.WORKER_ID)
+        try:
+            # handle incoming connection on port "PORT" 
+            # sending connections over to the handler()
+            # meanwhile, this "await stop" line will keep running the serve()
+            # until stop actually returns something and ends
+            # then when stop ends, main finishes execution, shutting down the websocket
+            sweeper = asyncio.create_task(LIFECYCLE.run())
+            matchmaker = asyncio.create_task(QUICK_PLAY.run())
+            lag_watcher = asyncio.create_task(metrics.watch_loop_lag())
+            await stop
+            # still waiting for the previous process, it keeps its matches and
+            # ratings
+            if MATCHES.journal is not None:
+                recovery.cancel()
+            if RATINGS.path is not None:
+                ratings_loader.cancel()
+            # lets the games in progress finish, the connections are closed after
+            await drain(server)
+            sweeper.cancel()
+            matchmaker.cancel()
+            lag_watcher.cancel()
+        finally:
+            if multi_worker:
+                # the socket file would be in the way of the next start
+                relay.close(relay_server,port=PORT,worker_id=workers.WORKER_ID)
+    log_listener.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # WEB_CONCURRENCY > 1 forks that many workers, each running main()
+    worker_count = workers.worker_count()
+    if worker_count > 1:
+        workers.spawn(worker_count, lambda: asyncio.run(main()))
+    else:
+        asyncio.run(main())
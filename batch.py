@@ -0,0 +1,173 @@
+"""
+batched Connect4 engine for bulk analysis: offline evaluation, load test
+traffic and Monte Carlo rollouts
+
+advances N games at once with NumPy. boards are uint64 bitboards in the same
+8 bits per column layout as connect4.py, one per player and game, so legality
+and win checks are a handful of array operations for the whole batch
+
+games that are over (won or full) ignore further moves. the batch agrees
+move for move with Connect4 up to the end of each game, which check()
+asserts on random games: run `python batch.py` after changing either engine
+
+requires numpy, which the server itself doesn't need
+"""
+
+import random
+import sys
+
+import numpy as np
+
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+__all__ = ["BatchConnect4", "check"]
+
+ONE = np.uint64(1)
+# shifts checked for lines of four: vertical, both diagonals and horizontal
+DIRECTIONS = [np.uint64(v) for v in (1, 7, 8, 9)]
+
+# index of each player in BatchConnect4.boards and BatchConnect4.winner
+PLAYERS = [PLAYER1, PLAYER2]
+NO_WINNER = -1
+
+
+def has_four(boards):
+    """
+    for each bitboard, whether it holds a line of four
+    """
+    found = np.zeros(boards.shape, dtype=bool)
+    for v in DIRECTIONS:
+        pairs = boards & (boards >> v)
+        found |= (pairs & (pairs >> (v + v))) != 0
+    return found
+
+
+class BatchConnect4:
+    """
+    `size` Connect4 games played in lockstep
+
+    boards:  (2, size) uint64, stones of red and yellow
+    heights: (size, 7) uint8, like Connect4.top
+    moves:   (size,) uint8, number of moves played
+    log:     (size, 42) uint8, moves packed as ``column << 3 | row``
+    winner:  (size,) int8, index in PLAYERS or NO_WINNER
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.boards = np.zeros((2, size), dtype=np.uint64)
+        self.heights = np.zeros((size, 7), dtype=np.uint8)
+        self.moves = np.zeros(size, dtype=np.uint8)
+        self.log = np.zeros((size, 42), dtype=np.uint8)
+        self.winner = np.full(size, NO_WINNER, dtype=np.int8)
+
+    @property
+    def active(self):
+        """
+        games that are neither won nor full
+        """
+        return (self.winner == NO_WINNER) & (self.moves < 42)
+
+    def legal(self):
+        """
+        (size, 7) array of the columns each game can be played in
+        """
+        return (self.heights < 6) & self.active[:, None]
+
+    def play(self, columns):
+        """
+        plays one move in every game still going, columns[i] in game i
+
+        returns the landing rows, -1 for games that were already over
+
+        raises ValueError if a game still going gets an illegal column
+        """
+        columns = np.asarray(columns, dtype=np.intp)
+        rows = np.full(self.size, -1, dtype=np.int8)
+
+        games = np.flatnonzero(self.active)
+        columns = columns[games]
+        if ((columns < 0) | (columns > 6)).any():
+            raise ValueError("column must be between 0 and 6.")
+        landing = self.heights[games, columns]
+        if (landing >= 6).any():
+            raise ValueError("This slot is full.")
+
+        player = self.moves[games] & 1
+        shift = columns.astype(np.uint64) * np.uint64(8) + landing.astype(np.uint64)
+        self.boards[player, games] |= ONE << shift
+        self.heights[games, columns] += 1
+        self.log[games, self.moves[games]] = (columns << 3 | landing).astype(np.uint8)
+        self.moves[games] += 1
+
+        won = has_four(self.boards[player, games])
+        self.winner[games[won]] = player[won]
+
+        rows[games] = landing
+        return rows
+
+    def rollout(self, policy):
+        """
+        plays every game to the end, policy(batch) returning the columns of
+        each move, and returns the winner array
+        """
+        while self.active.any():
+            self.play(policy(self))
+        return self.winner
+
+    def random_rollout(self, seed=None):
+        """
+        plays every game to the end with uniformly random legal moves
+        """
+        rng = np.random.default_rng(seed)
+
+        def random_policy(batch):
+            scores = rng.random((batch.size, 7))
+            scores[~(batch.heights < 6)] = -1.0
+            return scores.argmax(axis=1)
+
+        return self.rollout(random_policy)
+
+    def game(self, index):
+        """
+        replays game `index` into a Connect4 object
+        """
+        game = Connect4()
+        for number, move in enumerate(self.log[index, : self.moves[index]]):
+            game.play(PLAYERS[number % 2], int(move) >> 3)
+        return game
+
+
+def check(games=2000, seed=0):
+    """
+    plays `games` random games in a batch and in Connect4 objects side by
+    side, asserting every landing row and winner agree until each game ends
+    """
+    rng = random.Random(seed)
+    batch = BatchConnect4(games)
+    scalar = [Connect4() for _ in range(games)]
+    while batch.active.any():
+        active = batch.active
+        # games that are over get a placeholder column, which the batch ignores
+        columns = [
+            rng.choice([c for c in range(7) if game.top[c] < 6]) if going else 0
+            for game, going in zip(scalar, active)
+        ]
+        rows = batch.play(columns)
+        for index, game in enumerate(scalar):
+            if not active[index]:
+                assert rows[index] == -1, (index, rows[index])
+                continue
+            row = game.play(PLAYERS[len(game.moves) % 2], columns[index])
+            assert row == rows[index], (index, row, rows[index])
+            expected = NO_WINNER if game.winner is None else PLAYERS.index(game.winner)
+            assert expected == batch.winner[index], (index, game.winner, batch.winner[index])
+    for index in range(games):
+        assert list(batch.game(index).moves) == list(scalar[index].moves), index
+
+
+if __name__ == "__main__":
+    seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for seed in range(seeds):
+        check(seed=seed)
+    print(f"batch and Connect4 agree on {seeds} x 2000 random games")
@@ -0,0 +1,80 @@
+"""
+runs app.py for the benchmarks measuring the real server
+
+    with appserver.running(PORT, {"WEB_CONCURRENCY": "4"}) as process:
+        ...
+
+the server gets this process' environment, PORT, the extra variables given,
+and the per-connection limits of throttle.py raised so the bots' moves
+aren't dropped. its output is discarded
+"""
+
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+__all__ = ["start", "running", "port_in_use", "UNTHROTTLED"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UNTHROTTLED = {"THROTTLE_RATE": "1000000", "THROTTLE_BURST": "1000000"}
+
+
+def port_in_use(port) -> bool:
+    try:
+        socket.create_connection(("localhost", port), timeout=1).close()
+    except OSError:
+        return False
+    return True
+
+
+def start(port, env=None):
+    """
+    starts app.py on `port` and returns its Popen once it accepts connections
+    """
+    if port_in_use(port):
+        # e.g. left over from an interrupted run, with other settings
+        raise RuntimeError(f"port {port} is already in use, is a server still running?")
+
+    server_env = dict(os.environ, PORT=str(port))
+    server_env.update(UNTHROTTLED)
+    server_env.update(env or {})
+    server = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=ROOT, env=server_env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    async def probe():
+        async with websockets.connect(f"ws://localhost:{port}/"):
+            pass
+
+    for _ in range(100):
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with status {server.returncode}")
+        try:
+            asyncio.run(probe())
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    server.wait()
+    raise RuntimeError("server did not start")
+
+
+@contextlib.contextmanager
+def running(port, env=None):
+    """
+    the server started by start(), stopped with SIGTERM on the way out
+    """
+    server = start(port, env)
+    try:
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+games/sec of random rollouts in the NumPy batch engine at batch sizes 1, 1k
+and 1M (SIZES env var to change)
+
+first checks the batch engine against Connect4 on random games with
+check(), which `python batch.py` runs on its own
+
+run from the repo root with `python benchmarks/bench_batch.py`
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import BatchConnect4, check
+
+SIZES = [int(size) for size in os.environ.get("SIZES", "1,1000,1000000").split(",")]
+DIFFERENTIAL_GAMES = 2000
+
+
+def main():
+    check(DIFFERENTIAL_GAMES)
+    print(f"differential check: {DIFFERENTIAL_GAMES} random games agree move for move")
+    for size in SIZES:
+        # enough repetitions for small batches to be measurable
+        repeats = max(1, 2000 // size)
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            batch = BatchConnect4(size)
+            batch.random_rollout(seed=repeat)
+        elapsed = time.perf_counter() - start
+        print(f"batch {size:>9,}: {size * repeats / elapsed:12,.0f} games/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+opening book open time and lookup latency
+
+builds synthetic books of 10k, 1M and 10M records (random sorted keys, the
+searched values don't matter here) in a temporary directory, then times
+opening each one and looking up positions in it. open time should not grow
+with the size, lookups only grow with log2 of it
+
+run from the repo root with `python benchmarks/bench_book.py`
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import book
+
+SIZES = [int(size) for size in os.environ.get("SIZES", "10000,1000000,10000000").split(",")]
+LOOKUPS = 100_000
+
+
+def write_book(path, count, rng):
+    keys = sorted(rng.sample(range(1 << 48), count))
+    with open(path, "wb") as file:
+        file.write(book.HEADER.pack(book.MAGIC, book.VERSION, 0, count))
+        for key in keys:
+            file.write(book.RECORD.pack(key, 0, 3))
+    return keys
+
+
+def main():
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for count in SIZES:
+            path = os.path.join(directory, f"book-{count}.bin")
+            keys = write_book(path, count, rng)
+            # look up stored keys as positions: mask = key, no stones of the player to move
+            probes = [rng.choice(keys) for _ in range(LOOKUPS)]
+
+            start = time.perf_counter()
+            opening_book = book.OpeningBook(path)
+            opened = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for key in probes:
+                opening_book.lookup(0, key)
+            looked_up = time.perf_counter() - start
+            opening_book.close()
+
+            print(
+                f"{count:>12,} records ({os.path.getsize(path) / 2**20:7.1f} MiB):"
+                f" open {opened * 1e6:7.1f}us | lookup {looked_up / LOOKUPS * 1e6:5.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+memory per connection and server CPU for 10k connections (CONNECTIONS env
+var to change) receiving a whole game, with each compression policy of
+compression.py
+
+connections are websockets' sans-I/O ServerProtocol objects, handshaken
+with the permessage-deflate offer a browser makes, so the numbers are the
+protocol and zlib costs without sockets. every connection gets the game's
+42 "play" frames, its "win" frame and a "state" snapshot every 10 moves,
+the way a spectator does. CPU covers the frames only, not the handshakes
+
+run from the repo root with `python benchmarks/bench_compression.py`
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+from websockets.client import ClientProtocol
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.server import ServerProtocol
+from websockets.uri import parse_uri
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression
+import events
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+CONNECTIONS = int(os.environ.get("CONNECTIONS", "10000"))
+# memory is traced on this many connections, tracemalloc would make the CPU
+# pass several times slower
+MEMORY_SAMPLE = min(CONNECTIONS, 1000)
+
+
+def game_frames():
+    """
+    the frames a spectator of one long game receives
+    """
+    game = Connect4()
+    frames = []
+    player = PLAYER1
+    # fills columns two at a time so the game runs long
+    for column in [0, 1, 0, 1, 0, 1, 2, 3, 2, 3, 2, 3, 4, 5, 4, 5, 4, 5, 6, 0, 6, 0, 6, 0,
+                   1, 2, 1, 2, 1, 2, 3, 4, 3, 4, 3, 4, 5, 6, 5, 6, 5, 6]:
+        row = game.play(player, column)
+        frames.append(events.encode_play(player, column, row).encode())
+        if game.winner:
+            frames.append(events.encode_win(game.winner).encode())
+            break
+        if len(game.moves) % 10 == 0:
+            frames.append(events.encode_state(game).encode())
+        player = PLAYER2 if player == PLAYER1 else PLAYER1
+    return frames
+
+
+def connect(path, policy):
+    client = ClientProtocol(
+        parse_uri(f"ws://localhost{path}"),
+        extensions=[ClientPerMessageDeflateFactory(client_max_window_bits=True)],
+    )
+    request = client.connect()
+    server = ServerProtocol(extensions=compression.extensions_for(path, policy))
+    server.send_response(server.accept(request))
+    server.data_to_send()
+    return server
+
+
+def send_game(connections, frames):
+    sent = 0
+    for frame in frames:
+        for connection in connections:
+            connection.send_text(frame)
+            sent += sum(map(len, connection.data_to_send()))
+    return sent
+
+
+def run(path, policy, frames):
+    """
+    returns (bytes of memory per connection, bytes sent per connection, CPU seconds)
+    """
+    connections = [connect(path, policy) for _ in range(CONNECTIONS)]
+    start = time.process_time()
+    sent = send_game(connections, frames)
+    elapsed = time.process_time() - start
+    del connections
+
+    compression.deflate.cache_clear()
+    gc.collect()
+    tracemalloc.start()
+    connections = [connect(path, policy) for _ in range(MEMORY_SAMPLE)]
+    send_game(connections, frames)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory / MEMORY_SAMPLE, sent / CONNECTIONS, elapsed
+
+
+def main():
+    frames = game_frames()
+    print(f"{CONNECTIONS:,} connections, {len(frames)} frames each")
+    for role, path in [("player", "/"), ("spectator", compression.SPECTATOR_PATH)]:
+        for policy in ["deflate", "off", "auto"]:
+            compression.deflate.cache_clear()
+            memory, sent, elapsed = run(path, policy, frames)
+            print(
+                f"{role:>9} {policy:>7}: {memory / 1024:7.1f} KiB/connection, "
+                f"{sent:6.0f} bytes sent/connection, {elapsed:6.2f}s CPU"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+compares the move throughput of the bitboard Connect4 engine against the
+original tutorial implementation, which rebuilt the bitboard on every play()
+
+run from the repo root with `python benchmarks/bench_connect4.py`
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+
+class LegacyConnect4:
+    """
+    the original implementation from the websockets tutorial, kept here
+    only as a point of comparison
+    """
+
+    def __init__(self):
+        self.moves = []
+        self.top = [0 for _ in range(7)]
+        self.winner = None
+
+    @property
+    def last_player(self):
+        return PLAYER1 if len(self.moves) % 2 else PLAYER2
+
+    @property
+    def last_player_won(self):
+        b = sum(1 << (8 * column + row) for _, column, row in self.moves[::-2])
+        return any(b & b >> v & b >> 2 * v & b >> 3 * v for v in [1, 7, 8, 9])
+
+    def play(self, player, column):
+        if player == self.last_player:
+            raise RuntimeError("It isn't your turn.")
+        row = self.top[column]
+        if row == 6:
+            raise RuntimeError("This slot is full.")
+        self.moves.append((player, column, row))
+        self.top[column] += 1
+        if self.winner is None and self.last_player_won:
+            self.winner = self.last_player
+        return row
+
+
+def random_games(count, seed=0):
+    """
+    generates column sequences for full random games (played past any win,
+    until the board is full) so both engines do the exact same work
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        top = [0] * 7
+        columns = []
+        while len(columns) < 42:
+            column = rng.choice([c for c in range(7) if top[c] < 6])
+            top[column] += 1
+            columns.append(column)
+        games.append(columns)
+    return games
+
+
+def run(engine, games):
+    start = time.perf_counter()
+    for columns in games:
+        game = engine()
+        player = PLAYER1
+        for column in columns:
+            game.play(player, column)
+            player = PLAYER2 if player == PLAYER1 else PLAYER1
+    return time.perf_counter() - start
+
+
+def check_agreement(games):
+    for columns in games:
+        new, old = Connect4(), LegacyConnect4()
+        player = PLAYER1
+        for column in columns:
+            assert new.play(player, column) == old.play(player, column)
+            assert new.winner == old.winner
+            player = PLAYER2 if player == PLAYER1 else PLAYER1
+
+
+def main():
+    games = random_games(int(os.environ.get("GAMES", "2000")))
+    check_agreement(games[:200])
+    moves = sum(len(columns) for columns in games)
+
+    for name, engine in [("legacy", LegacyConnect4), ("bitboard", Connect4)]:
+        elapsed = run(engine, games)
+        print(f"{name:>10}: {moves / elapsed:12,.0f} moves/sec ({elapsed:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
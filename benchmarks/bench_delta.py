@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+bytes and time it takes a spectator coming back to catch up with a match,
+sent a "state" snapshot of the whole board vs only the events it missed
+(watching with since, see history.py)
+
+one match is played to MOVES moves on a real server, then for each number of
+missed events SPECTATORS spectators reconnect at once, each knowing the
+number of the last event it got
+    snapshot: {"type": "init", "watch": ...}, the whole board
+    delta:    {"type": "init", "watch": ..., "since": N}
+with the JSON and the binary protocol. reports the bytes each spectator
+received until it had the last event, and the wall time and server CPU for
+all of them to catch up
+
+run from the repo root with `python benchmarks/bench_delta.py`
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import appserver
+from connect4 import PLAYER1, PLAYER2, Connect4
+from history import HISTORY_SIZE
+
+PORT = int(os.environ.get("BENCH_PORT", "8903"))
+URI = f"ws://localhost:{PORT}/"
+MOVES = int(os.environ.get("MOVES", "40"))
+SPECTATORS = int(os.environ.get("SPECTATORS", "1000"))
+
+BINARY_PROTOCOL = "connect4.binary.v1"
+
+
+def proc_cpu(pid):
+    """
+    CPU seconds of a process, from /proc (Linux only)
+    """
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def replayed(columns):
+    game = Connect4()
+    for number, column in enumerate(columns):
+        game.play(PLAYER1 if number % 2 == 0 else PLAYER2, column)
+    return game
+
+
+def drawn_out_game(moves):
+    """
+    columns of a game nobody has won after `moves` moves
+    """
+    rng = random.Random(1)
+    columns = []
+    while len(columns) < moves:
+        game = replayed(columns)
+        # moves that don't end the game
+        choices = [
+            column for column in range(7)
+            if game.top[column] < 6 and replayed(columns + [column]).winner is None
+        ]
+        if not choices:
+            columns = []
+            continue
+        columns.append(rng.choice(choices))
+    return columns
+
+
+async def start_match(columns):
+    """
+    the players and watch key of a match with these moves played
+    """
+    red = await websockets.connect(URI, compression=None)
+    await red.send(json.dumps({"type": "init"}))
+    init = json.loads(await red.recv())
+    yellow = await websockets.connect(URI, compression=None)
+    await yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+    await yellow.recv()
+    for number, column in enumerate(columns):
+        player = red if number % 2 == 0 else yellow
+        await player.send(json.dumps({"type": "play", "column": column}))
+        await red.recv()
+        await yellow.recv()
+    return red, yellow, init["watch"]
+
+
+async def catch_up(watch_key, since, binary):
+    """
+    bytes a returning spectator receives until it has event number MOVES
+    """
+    subprotocols = [BINARY_PROTOCOL] if binary else None
+    async with websockets.connect(URI + "watch", compression=None, subprotocols=subprotocols) as websocket:
+        init = {"type": "init", "watch": watch_key}
+        if since is not None:
+            init["since"] = since
+        await websocket.send(json.dumps(init))
+        received = 0
+        frames = 0
+        while True:
+            frame = await websocket.recv()
+            received += len(frame)
+            frames += 1
+            # binary play frames have no number, every one of them is the next
+            if isinstance(frame, str) and json.loads(frame).get("type") == "state":
+                return received
+            if since is not None and frames == MOVES - since:
+                return received
+
+
+async def storm(watch_key, since, binary, server_pid):
+    cpu = proc_cpu(server_pid)
+    start = time.perf_counter()
+    received = await asyncio.gather(*(catch_up(watch_key, since, binary) for _ in range(SPECTATORS)))
+    return received[0], time.perf_counter() - start, proc_cpu(server_pid) - cpu
+
+
+async def run(server_pid):
+    red, yellow, watch_key = await start_match(drawn_out_game(MOVES))
+    print(f"{SPECTATORS:,} spectators reconnecting at once to a match at move {MOVES}")
+    print(f"{'missed':>6} {'protocol':>8} {'snapshot':>30} {'delta':>30}")
+    for missed in (1, 2, 4, 8, HISTORY_SIZE):
+        for binary in (False, True):
+            columns = []
+            for since in (None, MOVES - missed):
+                size, seconds, cpu = await storm(watch_key, since, binary, server_pid)
+                columns.append(f"{size:6,} B {seconds * 1e3:7.1f}ms {cpu:5.2f}s CPU")
+            protocol = "binary" if binary else "json"
+            print(f"{missed:>6} {protocol:>8} {columns[0]:>30} {columns[1]:>30}")
+    await red.close()
+    await yellow.close()
+
+
+def main():
+    with appserver.running(PORT) as server:
+        asyncio.run(run(server.pid))
+
+
+if __name__ == "__main__":
+    main()
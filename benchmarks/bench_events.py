@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+messages encoded per second, building and json.dumps-ing a dict per event
+(the way app.py used to) vs the precomputed/memoized frames in events.py
+
+run from the repo root with `python benchmarks/bench_events.py`
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+from connect4 import PLAYER1, PLAYER2
+
+N = int(os.environ.get("MESSAGES", "200000"))
+
+
+def workload(seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.choice((PLAYER1, PLAYER2)), rng.randrange(7), rng.randrange(6))
+        for _ in range(N)
+    ]
+
+
+def before(moves):
+    for player, column, row in moves:
+        json.dumps({"type": "play", "player": player, "column": column, "row": row})
+    for player, _, _ in moves:
+        json.dumps({"type": "win", "player": player})
+    for _ in moves:
+        json.dumps({"type": "error", "message": str(RuntimeError("This slot is full."))})
+
+
+def after(moves):
+    for player, column, row in moves:
+        events.encode_play(player, column, row)
+    for player, _, _ in moves:
+        events.encode_win(player)
+    for _ in moves:
+        events.encode_error(str(RuntimeError("This slot is full.")))
+
+
+def dynamic(dumps, keys):
+    for join_key, watch_key in keys:
+        dumps({"type": "init", "join": join_key, "watch": watch_key})
+
+
+def report(name, elapsed, count):
+    print(f"{name:>22}: {count / elapsed:12,.0f} messages/sec")
+
+
+def main():
+    moves = workload()
+    for name, fn in [("json.dumps per event", before), ("events cache", after)]:
+        start = time.perf_counter()
+        fn(moves)
+        report(name, time.perf_counter() - start, 3 * N)
+
+    keys = [(f"join{i}", f"watch{i}") for i in range(N)]
+    start = time.perf_counter()
+    dynamic(json.dumps, keys)
+    report("dynamic: json", time.perf_counter() - start, N)
+    start = time.perf_counter()
+    dynamic(events.dumps, keys)
+    backend = "orjson" if events.orjson is not None else "json"
+    report(f"dynamic: events/{backend}", time.perf_counter() - start, N)
+
+
+if __name__ == "__main__":
+    main()
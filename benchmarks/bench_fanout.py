@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+p99 move-to-delivery latency for the fast clients of a match in which one
+client is artificially slow
+
+    sequential: await websocket.send() on each client in turn, the way
+                send_move used to
+    outbox:     fanout.publish onto per-connection outboxes, with each
+                slow consumer policy
+
+run from the repo root with `python benchmarks/bench_fanout.py`
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fanout import Outbox, publish
+
+MOVES = int(os.environ.get("MOVES", "400"))
+# time between two moves, and how long the slow client takes per frame
+MOVE_INTERVAL = 0.002
+SLOW_SEND = 0.02
+FAST_CLIENTS = 3
+
+
+class FakeWebsocket:
+    """
+    records how long after publication each frame was delivered
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.latencies = []
+        self.closed = False
+
+    async def send(self, frame):
+        await asyncio.sleep(self.delay)
+        if isinstance(frame, float):
+            self.latencies.append(time.perf_counter() - frame)
+
+    async def close(self, code=1000, reason=""):
+        self.closed = True
+
+
+def p99(latencies):
+    latencies = sorted(latencies)
+    return latencies[int(len(latencies) * 0.99) - 1] if latencies else float("nan")
+
+
+async def sequential():
+    clients = [FakeWebsocket(SLOW_SEND)] + [FakeWebsocket(0) for _ in range(FAST_CLIENTS)]
+    for _ in range(MOVES):
+        frame = time.perf_counter()
+        for websocket in clients:
+            await websocket.send(frame)
+        await asyncio.sleep(MOVE_INTERVAL)
+    return clients
+
+
+async def with_outboxes(policy):
+    clients = [FakeWebsocket(SLOW_SEND)] + [FakeWebsocket(0) for _ in range(FAST_CLIENTS)]
+    # the snapshot frame carries no timestamp, so it is not measured
+    outboxes = [Outbox(websocket, snapshot=lambda: "state", policy=policy) for websocket in clients]
+    for _ in range(MOVES):
+        publish(outboxes, time.perf_counter())
+        await asyncio.sleep(MOVE_INTERVAL)
+    await asyncio.sleep(SLOW_SEND * 2)
+    for outbox in outboxes:
+        outbox.close()
+    return clients
+
+
+def report(name, clients):
+    slow, fast = clients[0], clients[1:]
+    fast_latencies = [latency for client in fast for latency in client.latencies]
+    print(
+        f"{name:>22}: fast p99 {p99(fast_latencies) * 1000:8.2f}ms"
+        f" | slow p99 {p99(slow.latencies) * 1000:8.2f}ms,"
+        f" {len(slow.latencies)}/{MOVES} moves delivered"
+        + (", disconnected" if slow.closed else "")
+    )
+
+
+async def main():
+    report("sequential", await sequential())
+    for policy in ("drop", "snapshot", "disconnect"):
+        report(f"outbox/{policy}", await with_outboxes(policy))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+cost of the move journal (journal.py) and how long recovery takes
+
+throughput: plays GAMES games through app.apply_move with two players'
+outboxes and no spectators, sockets are in memory so the journal's share of
+a move is as large as it can be
+    off:        no journal
+    grouped:    the journal, one fsync per FLUSH_INTERVAL for every move
+                recorded in it
+    every move: write and fsync each move before the next one is played,
+                what durability costs without group commit
+
+recovery: writes a log of LOGGED games (LIVE of them never closed, like
+matches in progress when the server died), then times Journal.open(),
+which reads and compacts it, and replaying the surviving games into
+Connect4 objects, as app.recover_matches does. a running server compacts
+its log every journal.COMPACT_AFTER closed matches, so this is a log far
+longer than it would leave behind
+
+the log goes to a temporary directory, set TMPDIR to measure another disk
+
+run from the repo root with `python benchmarks/bench_journal.py`
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import events
+import journal
+from connect4 import PLAYER1, PLAYER2, Connect4, Moves
+from fanout import Outbox
+from registry import Match
+from spectators import Audience
+
+GAMES = int(os.environ.get("GAMES", "20000"))
+LOGGED = int(os.environ.get("LOGGED", "1000000"))
+LIVE = int(os.environ.get("LIVE", "10000"))
+
+# red wins on the 7th move
+GAME = [0, 0, 1, 1, 2, 2, 3]
+
+
+class FakeWebSocket:
+    subprotocol = None
+
+    async def send(self, frame):
+        pass
+
+
+class FsyncEveryMove(journal.Journal):
+    def moved(self, match):
+        super().moved(match)
+        self.flush()
+
+
+async def play_games():
+    """
+    returns moves per second
+    """
+    moves = 0
+    start = time.perf_counter()
+    for number in range(GAMES):
+        game = Connect4()
+        audience = Audience(snapshot=lambda: events.encode_state(game))
+        match = Match(f"join{number}", f"watch{number}", game, audience=audience)
+        for player in (PLAYER1, PLAYER2):
+            match.players[Outbox(FakeWebSocket(), snapshot=lambda: events.encode_state(game))] = player
+        await app.MATCHES.add(match)
+
+        for move, column in enumerate(GAME):
+            await app.apply_move(match, PLAYER1 if move % 2 == 0 else PLAYER2, column)
+            moves += 1
+            await asyncio.sleep(0)
+
+        for outbox in match.players:
+            outbox.close()
+        audience.close()
+        await app.MATCHES.remove(match)
+    return moves / (time.perf_counter() - start)
+
+
+def throughput(directory):
+    print(f"{GAMES:,} games of {len(GAME)} moves")
+    for name, factory in [("off", None), ("grouped", journal.Journal), ("every move", FsyncEveryMove)]:
+        if factory is None:
+            app.MATCHES.journal = None
+        else:
+            # the grouped journal flushes on its own, the other one never
+            # needs to
+            interval = journal.FLUSH_INTERVAL if factory is journal.Journal else 3600
+            app.MATCHES.journal = factory(os.path.join(directory, name.replace(" ", "-")), interval)
+            app.MATCHES.journal.open()
+        rate = asyncio.run(play_games())
+        line = f"{name:>11}: {rate:10,.0f} moves/sec"
+        if factory is not None:
+            log = app.MATCHES.journal
+            log.close()
+            line += f", {log.fsyncs:,} fsyncs, {log.records / max(log.fsyncs, 1):,.1f} records per fsync"
+            line += f", {log.compactions} compactions"
+        print(line)
+    app.MATCHES.journal = None
+
+
+def random_game(rng):
+    game = Connect4()
+    while game.winner is None and len(game.log) < 42:
+        column = rng.choice([column for column in range(7) if game.top[column] < 6])
+        game.play(PLAYER1 if len(game.log) % 2 == 0 else PLAYER2, column)
+    return bytes(game.log)
+
+
+def write_log(path):
+    """
+    a log of LOGGED games, each one opened, played and closed except the
+    last LIVE, which stop half way through their moves
+    """
+    rng = random.Random(42)
+    games = [random_game(rng) for _ in range(1000)]
+    with open(path, "wb") as file:
+        for number in range(LOGGED):
+            log = games[number % len(games)]
+            live = number >= LOGGED - LIVE
+            if live:
+                log = log[: len(log) // 2]
+            records = [journal.encode_open(number, f"j{number}", f"w{number}", False)]
+            records.extend(journal.RECORD.pack(journal.MOVE, number, move) for move in log)
+            if not live:
+                records.append(journal.RECORD.pack(journal.CLOSE, number, 0))
+            file.write(b"".join(records))
+
+
+def recovery(directory):
+    path = os.path.join(directory, "recovery")
+    write_log(path)
+    size = os.path.getsize(path)
+
+    log = journal.Journal(path)
+    start = time.perf_counter()
+    entries = log.open()
+    opened = time.perf_counter() - start
+    log.close()
+
+    start = time.perf_counter()
+    for entry in entries:
+        game = Connect4()
+        for player, column, _ in Moves(entry.log):
+            game.play(player, column)
+    replayed = time.perf_counter() - start
+
+    print(f"recovery of {LOGGED:,} logged games, {size / 1e6:,.0f} MB, {len(entries):,} left open")
+    print(f"  read and compact: {opened:8.2f}s")
+    print(f"  replay games:     {replayed:8.2f}s")
+    print(f"  compacted log:    {os.path.getsize(path) / 1e6:8.2f} MB")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        throughput(directory)
+        print()
+        recovery(directory)
+
+
+if __name__ == "__main__":
+    main()
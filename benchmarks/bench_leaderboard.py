@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+leaderboard queries while ratings keep changing (leaderboard.py)
+
+PLAYERS players are ranked, then QUERIES rounds each finish a game, whose two
+players' ratings change, and ask for a player's rank, the top 10, and the
+10 players from a random rank on, the way a busy server interleaves games
+ending with clients asking for the leaderboard
+    sorted:  a list of (rating bucket, player id) kept sorted with bisect,
+             ranks by binary search, updates shift the list
+    fenwick: leaderboard.Leaderboard
+
+ratings are normally distributed around 1500, with a deviation of 350
+
+run from the repo root with `python benchmarks/bench_leaderboard.py`
+"""
+
+import bisect
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leaderboard
+import ratings
+
+PLAYERS = int(os.environ.get("PLAYERS", "1000000"))
+QUERIES = int(os.environ.get("QUERIES", "20000"))
+
+position_of = leaderboard.Leaderboard.position_of
+
+
+class SortedLeaderboard:
+    """
+    the same interface on a sorted list, ranking on the Leaderboard's
+    buckets of whole points
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.ratings = {}
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def load(self, players):
+        self.ratings = dict(players)
+        self.entries = sorted((position_of(rating), player_id) for player_id, rating in players)
+
+    def update(self, player_id, rating):
+        previous = self.ratings.get(player_id)
+        if previous is not None:
+            del self.entries[bisect.bisect_left(self.entries, (position_of(previous), player_id))]
+        self.ratings[player_id] = rating
+        bisect.insort(self.entries, (position_of(rating), player_id))
+
+    def rank(self, player_id):
+        return bisect.bisect_left(self.entries, (position_of(self.ratings[player_id]),)) + 1
+
+    def top(self, count, start=1):
+        rank = start
+        found = []
+        for key, player_id in self.entries[start - 1:start - 1 + count]:
+            if not found or key != position_of(found[-1][2]):
+                rank = self.rank(player_id)
+            found.append((rank, player_id, self.ratings[player_id]))
+        return found
+
+
+def measure(name, board, players, rng):
+    """
+    QUERIES rounds of a game ending and three queries, returns nothing,
+    prints throughput and per-operation latencies
+    """
+    ids = [player_id for player_id, _ in players]
+    current = dict(players)
+    timings = {"update": [], "rank": [], "top 10": [], "page": []}
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for _ in range(QUERIES):
+        red, yellow = rng.choice(ids), rng.choice(ids)
+        change = ratings.K_FACTOR * (rng.random() - ratings.expected_score(current[red], current[yellow]))
+        current[red] += change
+        current[yellow] -= change
+
+        began = perf_counter()
+        board.update(red, current[red])
+        board.update(yellow, current[yellow])
+        timings["update"].append(perf_counter() - began)
+
+        began = perf_counter()
+        board.rank(rng.choice(ids))
+        timings["rank"].append(perf_counter() - began)
+
+        began = perf_counter()
+        board.top(10)
+        timings["top 10"].append(perf_counter() - began)
+
+        began = perf_counter()
+        board.top(10, rng.randrange(1, len(ids)))
+        timings["page"].append(perf_counter() - began)
+    elapsed = perf_counter() - start
+
+    print(f"{name:>8}: {QUERIES / elapsed:10,.0f} rounds/sec")
+    for operation, values in timings.items():
+        values.sort()
+        p99 = values[int(len(values) * 0.99)]
+        print(f"          {operation:>7}  p50 {statistics.median(values) * 1e6:9.1f}us  p99 {p99 * 1e6:9.1f}us")
+
+
+def check(first, second, players, rng):
+    """
+    both boards give the same ranks
+    """
+    for player_id, _ in rng.sample(players, 1000):
+        assert first.rank(player_id) == second.rank(player_id), player_id
+    for start in (1, 2, 1000, len(players) // 2, len(players) - 5):
+        ranks = [(rank, position_of(rating)) for rank, _, rating in first.top(10, start)]
+        assert ranks == [(rank, position_of(rating)) for rank, _, rating in second.top(10, start)], start
+
+
+def main():
+    rng = random.Random(42)
+    players = [(f"player{number}", rng.gauss(1500, 350)) for number in range(PLAYERS)]
+    print(f"{PLAYERS:,} players, {QUERIES:,} rounds of 2 rating updates, a rank, a top 10 and a page of 10")
+
+    sorted_board = SortedLeaderboard()
+    start = time.perf_counter()
+    sorted_board.load(players)
+    print(f"  sorted:  built in {time.perf_counter() - start:6.2f}s")
+
+    fenwick_board = leaderboard.Leaderboard()
+    start = time.perf_counter()
+    for player_id, rating in players:
+        fenwick_board.update(player_id, rating)
+    print(f"  fenwick: built in {time.perf_counter() - start:6.2f}s")
+    check(sorted_board, fenwick_board, players, rng)
+
+    measure("sorted", sorted_board, players, random.Random(7))
+    measure("fenwick", fenwick_board, players, random.Random(7))
+    check(sorted_board, fenwick_board, players, rng)
+
+
+if __name__ == "__main__":
+    main()
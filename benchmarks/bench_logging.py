@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+event loop latency while logging to a saturated stdout
+
+stdout is a pipe drained by a slow reader (READ_RATE bytes/sec), like a
+log shipper falling behind. a chatty spectator makes the server log LINES
+lines as fast as it can, while a ticker task measures how late the event
+loop wakes it up every millisecond, which every match on the process feels
+
+    print:  print() to the pipe from the event loop, the way app.py used to
+    logs:   logs.event(), queued for the listener thread, dropping lines
+            once the queue is full
+
+run from the repo root with `python benchmarks/bench_logging.py`
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs
+
+LINES = int(os.environ.get("LINES", "20000"))
+READ_RATE = int(os.environ.get("READ_RATE", "200000"))
+TICK = 0.001
+
+
+def slow_pipe():
+    """
+    returns a text stream whose reader only takes READ_RATE bytes/sec
+    """
+    read_end, write_end = os.pipe()
+
+    def drain():
+        chunk = READ_RATE // 100
+        while os.read(read_end, chunk):
+            time.sleep(0.01)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return open(write_end, "w", buffering=1)
+
+
+async def measure(log_line):
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - start - TICK)
+
+    task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    for number in range(LINES):
+        log_line(number)
+        if number % 100 == 0:
+            # the spectator's messages arrive over time, not all at once
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    done = True
+    await task
+    return lags, elapsed
+
+
+def report(name, lags, elapsed):
+    lags = sorted(lags)
+    p99 = lags[int(len(lags) * 0.99)]
+    print(
+        f"{name:>6}: {LINES / elapsed:10,.0f} lines/sec handled, loop lag "
+        f"p50 {statistics.median(lags) * 1e3:7.2f}ms  p99 {p99 * 1e3:7.2f}ms  max {lags[-1] * 1e3:7.2f}ms"
+    )
+
+
+def main():
+    print(f"{LINES:,} lines, stdout drained at {READ_RATE:,} bytes/sec")
+
+    stream = slow_pipe()
+
+    def print_line(number):
+        print(f"\t spectator sent : hello {number}", file=stream)
+
+    report("print", *asyncio.run(measure(print_line)))
+
+    stream = slow_pipe()
+    listener = logs.start(stream=stream)
+
+    def log_line(number):
+        logs.event("spectator_message", text=f"hello {number}", watch="AbCdEf")
+
+    report("logs", *asyncio.run(measure(log_line)))
+    print(f"        {logs.DROPPED:,} lines dropped by the full queue")
+    listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+cost of pairing players in the quick play queue (matchmaking.py)
+
+search: QUEUED players are waiting, then PROBES newcomers arrive one at a
+time, each paired right away with the closest waiting player in its window
+    linear:  a list of everyone waiting, scanned for the closest rating
+    buckets: matchmaking.Queue
+then the window of every player still waiting widens at once, and the time
+widen() takes to go through all of them is reported
+
+storm: ARRIVALS players arrive at RATE a second on a simulated clock, with
+the queue widening windows as app.py has it do every half second. reports
+the CPU time per arrival, how long players waited (in simulated seconds) and
+how far apart paired players' ratings were. then again with a tenth of the
+players arriving at QUIET_RATE a second, when windows have to widen for
+players to find someone
+
+ratings are normally distributed around 1500, with a deviation of 350
+
+run from the repo root with `python benchmarks/bench_matchmaking.py`
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matchmaking
+
+QUEUED = int(os.environ.get("QUEUED", "100000"))
+PROBES = int(os.environ.get("PROBES", "1000"))
+ARRIVALS = int(os.environ.get("ARRIVALS", "100000"))
+RATE = int(os.environ.get("RATE", "20000"))
+QUIET_RATE = int(os.environ.get("QUIET_RATE", "20"))
+
+
+def rating(rng):
+    return rng.gauss(1500, 350)
+
+
+class LinearQueue:
+    """
+    the obvious queue: everyone waiting in a list, scanned for the closest
+    rating within the window
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.waiting = []
+
+    def enqueue(self, rating):
+        best, best_gap = None, self.window
+        for index, other in enumerate(self.waiting):
+            gap = abs(other - rating)
+            if gap <= best_gap:
+                best, best_gap = index, gap
+        if best is None:
+            self.waiting.append(rating)
+        else:
+            del self.waiting[best]
+
+
+class Clock:
+    """
+    simulated time, moved forward by the benchmark
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingQueue(matchmaking.Queue):
+    """
+    keeps each pairing's waits and rating gap
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.waits = []
+        self.gaps = []
+
+    def pair(self, first, second, now):
+        self.waits.append(now - first.since)
+        self.waits.append(now - second.since)
+        self.gaps.append(abs(first.rating - second.rating))
+        super().pair(first, second, now)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+async def search():
+    rng = random.Random(42)
+    waiting = [rating(rng) for _ in range(QUEUED)]
+    probes = [rating(rng) for _ in range(PROBES)]
+    print(f"{PROBES:,} newcomers, {QUEUED:,} players waiting")
+
+    linear = LinearQueue(matchmaking.INITIAL_WINDOW)
+    linear.waiting = list(waiting)
+    start = time.perf_counter()
+    for probe in probes:
+        linear.enqueue(probe)
+    report("linear", time.perf_counter() - start)
+
+    # filled with a window of 0 so the waiting players don't pair up
+    clock = Clock()
+    queue = matchmaking.Queue(initial_window=0, clock=clock)
+    for value in waiting:
+        queue.enqueue(None, value)
+    queue.initial_window = matchmaking.INITIAL_WINDOW
+    start = time.perf_counter()
+    for probe in probes:
+        queue.enqueue(None, probe)
+    report("buckets", time.perf_counter() - start)
+    paired = (QUEUED + PROBES - len(queue)) // 2
+    print(f"          {paired:,} newcomers paired, {len(queue.filled)} buckets in use")
+
+    waiting = len(queue)
+    clock.now += queue.step_seconds
+    start = time.perf_counter()
+    paired = queue.widen()
+    elapsed = time.perf_counter() - start
+    print(f"  widen(): {elapsed * 1e3:10.1f}ms for {waiting:,} players, {paired:,} pairs, {len(queue):,} left waiting")
+
+
+def report(name, elapsed):
+    print(f"{name:>8}: {PROBES / elapsed:12,.0f} enqueues/sec, {elapsed / PROBES * 1e6:10.2f}us each")
+
+
+async def storm(arrivals, rate):
+    rng = random.Random(7)
+    clock = Clock()
+    queue = RecordingQueue(clock=clock)
+    tick = queue.step_seconds / 2
+    next_tick = tick
+    most_waiting = 0
+    cpu = 0.0
+    for number in range(arrivals):
+        clock.now = number / rate
+        start = time.perf_counter()
+        while clock.now >= next_tick:
+            queue.widen()
+            next_tick += tick
+        queue.enqueue(None, rating(rng))
+        cpu += time.perf_counter() - start
+        most_waiting = max(most_waiting, len(queue))
+
+    # the last arrivals get as long as they need
+    start = time.perf_counter()
+    for _ in range(int(matchmaking.MAX_WINDOW / matchmaking.WINDOW_STEP) * 2):
+        clock.now = next_tick
+        queue.widen()
+        next_tick += tick
+    cpu += time.perf_counter() - start
+
+    print(f"{arrivals:,} players arriving at {rate:,}/sec, simulated")
+    print(f"  cpu per arrival:   {cpu / arrivals * 1e6:8.2f}us, {arrivals / cpu:,.0f} arrivals/sec")
+    print(f"  most waiting:      {most_waiting:8,}")
+    print(f"  players paired:    {len(queue.waits):8,}, {len(queue):,} left waiting")
+    print(f"  wait p50 / p99:    {percentile(queue.waits, 0.5):8.2f}s / {percentile(queue.waits, 0.99):.2f}s")
+    print(f"  rating gap p50 / p99: {percentile(queue.gaps, 0.5):5.1f} / {percentile(queue.gaps, 0.99):.1f}")
+
+
+def main():
+    asyncio.run(search())
+    print()
+    asyncio.run(storm(ARRIVALS, RATE))
+    print()
+    asyncio.run(storm(ARRIVALS // 10, QUIET_RATE))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+reports the bytes each live match costs for its Connect4 game, at the match
+counts given on the command line (default 10k and 100k)
+
+every game is played to a random midgame position, so move logs are not empty
+
+run from the repo root with `python benchmarks/bench_memory.py [counts...]`
+"""
+
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+
+def build_games(count, seed=0):
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = Connect4()
+        player = PLAYER1
+        for _ in range(rng.randrange(10, 30)):
+            column = rng.choice([c for c in range(7) if game.top[c] < 6])
+            game.play(player, column)
+            if game.winner:
+                break
+            player = PLAYER2 if player == PLAYER1 else PLAYER1
+        games.append(game)
+    return games
+
+
+def measure(count):
+    gc.collect()
+    tracemalloc.start()
+    games = build_games(count)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del games
+    return used
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for count in counts:
+        used = measure(count)
+        print(f"{count:>8,} games: {used / 2**20:8.2f} MiB, {used / count:6.0f} bytes/match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+cost of the instrumentation in metrics.py on move throughput
+
+plays GAMES games through app.apply_move, the path every move takes, with
+two players' outboxes and an audience of SPECTATORS per match. sockets are
+in memory so the move path itself is what is measured, which makes the
+instrumentation look as expensive as it can. runs are alternated between
+metrics on and off, best of ROUNDS each. for "off", app.py and spectators.py
+are pointed at a stand-in for the metrics module whose metrics do nothing
+
+end to end throughput on a shared machine varies by more than the overhead
+being measured, so the work the instrumentation adds to each move (timing
+the publish and the shard's broadcast, counting the move) is also timed on
+its own and compared to the time a move takes
+
+the target is under 2% overhead
+
+run from the repo root with `python benchmarks/bench_metrics.py`
+"""
+
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import events
+import metrics
+import spectators
+from connect4 import PLAYER1, PLAYER2, Connect4
+from fanout import Outbox
+from registry import Match
+from spectators import Audience
+
+GAMES = int(os.environ.get("GAMES", "5000"))
+SPECTATORS = int(os.environ.get("SPECTATORS", "10"))
+ROUNDS = int(os.environ.get("ROUNDS", "5"))
+
+# red wins on the 7th move
+GAME = [0, 0, 1, 1, 2, 2, 3]
+
+
+class FakeWebSocket:
+    subprotocol = None
+
+    async def send(self, frame):
+        pass
+
+
+def ignore(connections, frame):
+    pass
+
+
+class NullMetric:
+    def inc(self, *args):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def sample(self):
+        return False
+
+
+class NullMetrics:
+    """
+    stands in for the metrics module
+    """
+
+    def __getattr__(self, name):
+        # only called the first time, the attribute is set from then on
+        metric = NullMetric()
+        setattr(self, name, metric)
+        return metric
+
+
+async def play_games():
+    """
+    returns moves per CPU second, steadier than wall time on a busy machine
+    """
+    moves = 0
+    start = time.process_time()
+    for _ in range(GAMES):
+        game = Connect4()
+        audience = Audience(snapshot=lambda: events.encode_state(game), broadcast=ignore)
+        for _ in range(SPECTATORS):
+            audience.add(FakeWebSocket())
+        match = Match("join", "watch", game, audience=audience)
+        for player in (PLAYER1, PLAYER2):
+            match.players[Outbox(FakeWebSocket(), snapshot=lambda: events.encode_state(game))] = player
+
+        for number, column in enumerate(GAME):
+            await app.apply_move(match, PLAYER1 if number % 2 == 0 else PLAYER2, column)
+            moves += 1
+            # lets the writer and shard tasks run, as the server would
+            await asyncio.sleep(0)
+
+        for outbox in match.players:
+            outbox.close()
+        audience.close()
+    return moves / (time.process_time() - start)
+
+
+def instrumentation():
+    """
+    the metric updates a move makes, in app.send_move and Shard.flush
+    """
+    for histogram in (metrics.PUBLISH_SECONDS, metrics.BROADCAST_SECONDS):
+        if histogram.sample():
+            start = time.perf_counter()
+            histogram.observe(time.perf_counter() - start)
+    metrics.MOVES.inc()
+
+
+def instrumentation_seconds(count=200_000):
+    """
+    seconds per move, best of several runs
+    """
+    return min(timeit.repeat(instrumentation, number=count, repeat=2 * ROUNDS)) / count
+
+
+def main():
+    per_move = instrumentation_seconds()
+
+    results = {"on": [], "off": []}
+    for _ in range(ROUNDS):
+        results["on"].append(asyncio.run(play_games()))
+        app.metrics = spectators.metrics = NullMetrics()
+        results["off"].append(asyncio.run(play_games()))
+        app.metrics = spectators.metrics = metrics
+
+    on, off = max(results["on"]), max(results["off"])
+    print(f"{GAMES:,} games, {SPECTATORS} spectators each, best of {ROUNDS}")
+    print(f"metrics off: {off:10,.0f} moves/sec")
+    print(f"metrics on:  {on:10,.0f} moves/sec")
+    print(f"overhead:    {(off - on) / off:10.2%} (end to end, noisy)")
+    print(f"metric updates: {per_move * 1e9:.0f} ns/move, {per_move * off:.2%} of a move")
+
+
+if __name__ == "__main__":
+    main()
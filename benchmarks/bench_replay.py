@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+late-join latency against move count: replaying history as one "play"
+frame per move (the old replay_current_moves) vs a single cached "state"
+frame
+
+sends go to a fake websocket whose send() yields to the event loop once,
+standing in for the await on a real connection
+
+run from the repo root with `python benchmarks/bench_replay.py`
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+from app import replay_current_moves
+from connect4 import PLAYER1, PLAYER2, Connect4
+from registry import Match
+
+JOINS = int(os.environ.get("JOINS", "2000"))
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.frames = 0
+
+    async def send(self, message):
+        self.frames += 1
+        await asyncio.sleep(0)
+
+
+async def replay_per_move(websocket, match):
+    for player, column, row in match.game.moves:
+        await websocket.send(events.encode_play(player, column, row))
+
+
+def game_with(move_count, seed=0):
+    """
+    plays random moves (ignoring wins) until the game has move_count moves
+    """
+    rng = random.Random(seed)
+    game = Connect4()
+    player = PLAYER1
+    while len(game.moves) < move_count:
+        column = rng.choice([c for c in range(7) if game.top[c] < 6])
+        game.play(player, column)
+        player = PLAYER2 if player == PLAYER1 else PLAYER1
+    return game
+
+
+def match_with(move_count):
+    """
+    a match hosted here whose game has move_count moves
+    """
+    return Match("join", "watch", game_with(move_count))
+
+
+async def time_joins(replay, match):
+    websocket = FakeWebsocket()
+    start = time.perf_counter()
+    for _ in range(JOINS):
+        await replay(websocket, match)
+    return (time.perf_counter() - start) / JOINS, websocket.frames // JOINS
+
+
+async def main():
+    print(f"{'moves':>5} {'per-move':>12} {'frames':>6} {'snapshot':>12} {'frames':>6}")
+    for move_count in (1, 10, 20, 30, 40, 42):
+        match = match_with(move_count)
+        old, old_frames = await time_joins(replay_per_move, match)
+        new, new_frames = await time_joins(replay_current_moves, match)
+        print(f"{move_count:>5} {old * 1e6:10.1f}us {old_frames:>6} {new * 1e6:10.1f}us {new_frames:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
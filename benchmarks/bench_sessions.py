@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+connections and memory saved by multiplexed sessions (sessions.py), for
+clients following many matches
+
+MATCHES matches are created on a real server, then FOLLOWERS clients each
+follow every one of them
+    connections: a watch connection per match, FOLLOWERS x MATCHES in all
+    session:     one session per follower, with a "watch" message per match
+and a 7 move game is played in every match. reports the connections the
+server holds, how much the server's and the followers' memory grew when
+the followers subscribed (RSS), the server CPU and wall time to deliver
+every game to every follower, and the bytes each follower received, the
+"match" field making session frames a little bigger
+
+each run gets a fresh server and client process. no compression, both
+connect on the player path
+
+run from the repo root with `python benchmarks/bench_sessions.py`
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import urllib.request
+
+import websockets
+
+import appserver
+
+PORT = int(os.environ.get("BENCH_PORT", "8902"))
+URI = f"ws://localhost:{PORT}/"
+MATCHES = int(os.environ.get("MATCHES", "50"))
+FOLLOWERS = int(os.environ.get("FOLLOWERS", "100"))
+
+# red wins on the 7th move: 7 "play" frames and a "win" per match
+GAME = [0, 0, 1, 1, 2, 2, 3]
+FRAMES = len(GAME) + 1
+
+
+def proc_stats(pid):
+    """
+    (RSS bytes, CPU seconds) of a process, from /proc (Linux only)
+    """
+    with open(f"/proc/{pid}/statm") as file:
+        rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return rss, (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def spectators():
+    with urllib.request.urlopen(f"http://localhost:{PORT}/metrics") as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("connect4_spectators "):
+                return int(float(line.split()[1]))
+    return 0
+
+
+async def create_matches():
+    """
+    (red, yellow, watch key) of MATCHES matches with both players in
+    """
+    matches = []
+    for _ in range(MATCHES):
+        red = await websockets.connect(URI, compression=None)
+        await red.send(json.dumps({"type": "init"}))
+        init = json.loads(await red.recv())
+        yellow = await websockets.connect(URI, compression=None)
+        await yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+        await yellow.recv()
+        matches.append((red, yellow, init["watch"]))
+    return matches
+
+
+async def play(red, yellow):
+    for number, column in enumerate(GAME):
+        player = red if number % 2 == 0 else yellow
+        await player.send(json.dumps({"type": "play", "column": column}))
+        await red.recv()
+        await yellow.recv()
+    # "win"
+    await red.recv()
+    await yellow.recv()
+
+
+async def receive(connection, frames):
+    """
+    bytes received until `frames` frames came in
+    """
+    received = 0
+    for _ in range(frames):
+        received += len(await connection.recv())
+    return received
+
+
+async def follow_with_connections(watch_keys):
+    """
+    (connections, frames expected on each)
+    """
+    connections = []
+    for _ in range(FOLLOWERS):
+        for watch_key in watch_keys:
+            connection = await websockets.connect(URI, compression=None)
+            await connection.send(json.dumps({"type": "init", "watch": watch_key}))
+            connections.append(connection)
+    return connections, FRAMES
+
+
+async def follow_with_sessions(watch_keys):
+    connections = []
+    for _ in range(FOLLOWERS):
+        connection = await websockets.connect(URI, compression=None)
+        await connection.send(json.dumps({"type": "session"}))
+        for number, watch_key in enumerate(watch_keys):
+            await connection.send(json.dumps({"type": "watch", "match": number, "watch": watch_key}))
+        connections.append(connection)
+    return connections, FRAMES * len(watch_keys)
+
+
+async def scenario(follow, server_pid):
+    matches = await create_matches()
+    watch_keys = [watch_key for _, _, watch_key in matches]
+
+    server_before, _ = proc_stats(server_pid)
+    client_before, _ = proc_stats(os.getpid())
+    start = time.perf_counter()
+    connections, frames = await follow(watch_keys)
+    while spectators() < FOLLOWERS * MATCHES:
+        await asyncio.sleep(0.05)
+    subscribed = time.perf_counter() - start
+    server_after, server_cpu = proc_stats(server_pid)
+    client_after, _ = proc_stats(os.getpid())
+
+    start = time.perf_counter()
+    receivers = [asyncio.create_task(receive(connection, frames)) for connection in connections]
+    await asyncio.gather(*(play(red, yellow) for red, yellow, _ in matches))
+    received = sum(await asyncio.gather(*receivers))
+    delivered = time.perf_counter() - start
+    delivery_cpu = proc_stats(server_pid)[1] - server_cpu
+
+    await asyncio.gather(*(connection.close() for connection in connections))
+    for red, yellow, _ in matches:
+        await red.close()
+        await yellow.close()
+    return {
+        "connections": len(connections),
+        "server memory": server_after - server_before,
+        "client memory": client_after - client_before,
+        "subscribe time": subscribed,
+        "delivery time": delivered,
+        "delivery cpu": delivery_cpu,
+        "bytes per follower": received / FOLLOWERS,
+    }
+
+
+def client_process(mode, server_pid, results):
+    follow = follow_with_sessions if mode == "session" else follow_with_connections
+    results.put(asyncio.run(scenario(follow, server_pid)))
+
+
+def run(mode):
+    with appserver.running(PORT) as server:
+        results = multiprocessing.Queue()
+        client = multiprocessing.Process(target=client_process, args=(mode, server.pid, results))
+        client.start()
+        result = results.get()
+        client.join()
+    return result
+
+
+def main():
+    print(f"{FOLLOWERS} followers x {MATCHES} matches, a {len(GAME)} move game in each")
+    for mode in ["connections", "session"]:
+        result = run(mode)
+        print(
+            f"{mode:>11}: {result['connections']:6,} connections, "
+            f"server +{result['server memory'] / 2**20:6.1f} MiB ({result['server memory'] / FOLLOWERS / 1024:6.1f} KiB/follower), "
+            f"clients +{result['client memory'] / 2**20:6.1f} MiB"
+        )
+        print(
+            f"             subscribed in {result['subscribe time']:5.2f}s, "
+            f"delivered in {result['delivery time']:5.2f}s using {result['delivery cpu']:5.2f}s server CPU, "
+            f"{result['bytes per follower']:7,.0f} bytes/follower"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+solver benchmark: nodes/sec and positions solved within a time budget
+
+test positions are built like the test sets of Pascal Pons' solver: random
+games stopped with a given number of moves left, skipping any that are
+already won. a position counts as solved when the search reaches an exact
+result (win, loss or draw) before the budget runs out
+
+    BUDGET     seconds per position (default 1)
+    POSITIONS  positions per set (default 20)
+
+run from the repo root with `python benchmarks/bench_solver.py`
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import solver
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+BUDGET = float(os.environ.get("BUDGET", "1"))
+POSITIONS = int(os.environ.get("POSITIONS", "20"))
+
+# name : range of moves left in the positions
+SETS = {
+    "end (8-14 left)": range(8, 15),
+    "middle (15-22 left)": range(15, 23),
+    "begin (26-34 left)": range(26, 35),
+}
+
+
+def random_position(moves_left, rng):
+    while True:
+        game = Connect4()
+        player = PLAYER1
+        while len(game.moves) < 42 - moves_left and not game.winner:
+            game.play(player, rng.choice([c for c in range(7) if game.top[c] < 6]))
+            player = PLAYER2 if player == PLAYER1 else PLAYER1
+        if not game.winner:
+            position = solver.position_from_log(game.log)
+            # no immediate win for the player to move either
+            if not solver.winning_cells(position[0], position[1]) & ((position[1] + solver.BOTTOM) & solver.BOARD):
+                return position
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{POSITIONS} positions per set, {BUDGET}s budget each")
+    for name, moves_left in SETS.items():
+        positions = [random_position(rng.choice(moves_left), rng) for _ in range(POSITIONS)]
+        searcher = solver.Searcher()
+        solved = depth = 0
+        start = time.perf_counter()
+        for position in positions:
+            _, score, completed = searcher.search(*position, budget=BUDGET)
+            # exact result, or searched all the way to the end of the game
+            solved += abs(score) >= solver.WIN or completed == 42 - position[2]
+            depth += completed
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>20}: {searcher.nodes / elapsed:9,.0f} nodes/sec"
+            f" | solved {solved:>3}/{POSITIONS}"
+            f" | mean depth {depth / POSITIONS:4.1f}"
+            f" | mean time {elapsed / POSITIONS * 1000:6.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
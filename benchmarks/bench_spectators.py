@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+load test of one featured match watched by 50k local spectators
+(SPECTATORS env var to change)
+
+spectator connections are simulated in memory: broadcasting to a socket
+costs one write into a per-socket buffer, so the numbers show how the work
+is spread over the event loop rather than kernel send costs
+
+    flat:    one set of sockets broadcast to from the player's coroutine,
+             the way send_move used to
+    sharded: spectators.Audience, with and without batching
+
+for each it reports the time a move spends on the player's hot path, the
+time until every spectator has it, and the worst event loop stall seen by
+a ticker task (what every other match on the process would feel)
+
+run from the repo root with `python benchmarks/bench_spectators.py`
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spectators import Audience
+
+SPECTATORS = int(os.environ.get("SPECTATORS", "50000"))
+MOVES = 42
+
+
+class FakeSpectator:
+    __slots__ = ["received"]
+
+    def __init__(self):
+        self.received = []
+
+
+def fake_broadcast(websockets, frame):
+    for websocket in websockets:
+        websocket.received.append(frame)
+
+
+async def ticker(stalls):
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last - 0.001)
+        last = now
+
+
+async def scenario(name, make_audience):
+    spectators = [FakeSpectator() for _ in range(SPECTATORS)]
+    stalls = []
+    tick = asyncio.create_task(ticker(stalls))
+    audience, publish = make_audience(spectators)
+
+    hot_path = 0.0
+    start = time.perf_counter()
+    for move in range(MOVES):
+        before = time.perf_counter()
+        publish(f"move {move}")
+        hot_path += time.perf_counter() - before
+        await asyncio.sleep(0.002)
+    if audience is not None:
+        # batching may coalesce frames, so wait on the last one
+        while not all(s.received and s.received[-1] in (f"move {MOVES - 1}", "state") for s in spectators[::997]):
+            await asyncio.sleep(0.001)
+        audience.close()
+    delivered = time.perf_counter() - start
+    tick.cancel()
+
+    print(
+        f"{name:>22}: hot path {hot_path / MOVES * 1e6:9.1f}us/move"
+        f" | all delivered after {delivered * 1000:7.1f}ms"
+        f" | worst loop stall {max(stalls) * 1000:6.2f}ms"
+    )
+
+
+def flat(spectators):
+    members = set(spectators)
+    return None, lambda frame: fake_broadcast(members, frame)
+
+
+def sharded(flush_interval=0.0, coalesce=False):
+    def make(spectators):
+        audience = Audience(
+            snapshot=lambda: "state",
+            flush_interval=flush_interval,
+            coalesce=coalesce,
+            broadcast=fake_broadcast,
+        )
+        for spectator in spectators:
+            audience.add(spectator)
+        return audience, audience.publish
+    return make
+
+
+async def main():
+    print(f"{SPECTATORS:,} spectators, {MOVES} moves 2ms apart")
+    await scenario("flat", flat)
+    await scenario("sharded", sharded())
+    await scenario("sharded, 10ms batches", sharded(flush_interval=0.01))
+    await scenario("sharded, coalesced", sharded(flush_interval=0.01, coalesce=True))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
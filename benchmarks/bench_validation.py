@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+incoming message validation and flood handling
+
+    1. play messages validated per second: json.loads + get_col_from_play_event
+       for every message (the old play() loop) vs parse_play_message, for the
+       exact messages main.js sends and for other valid spellings
+    2. a client flooding the real handler() with play messages as fast as it
+       can: how many get through, how many error replies it gets, and how
+       long until the server disconnects it
+
+run from the repo root with `python benchmarks/bench_validation.py`
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets
+
+import app
+import throttle
+
+MESSAGES = 200_000
+FLOOD = 10_000
+PORT = int(os.environ.get("BENCH_PORT", "8902"))
+
+
+def validated_per_second(parse, messages):
+    start = time.perf_counter()
+    for message in messages:
+        parse(message)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def old_parse(message):
+    return app.get_col_from_play_event(json.loads(message))
+
+
+async def flood():
+    async with websockets.serve(app.handler, "localhost", PORT, max_size=throttle.MAX_MESSAGE_SIZE):
+        async with websockets.connect(f"ws://localhost:{PORT}/") as websocket:
+            await websocket.send(json.dumps({"type": "init"}))
+            await websocket.recv()
+
+            received = []
+
+            async def read():
+                try:
+                    async for message in websocket:
+                        received.append(json.loads(message)["type"])
+                except websockets.ConnectionClosed:
+                    pass
+
+            reader = asyncio.create_task(read())
+            start = time.perf_counter()
+            sent = 0
+            try:
+                for number in range(FLOOD):
+                    await websocket.send(json.dumps({"type": "play", "column": number % 7}))
+                    sent += 1
+            except websockets.ConnectionClosed:
+                pass
+            await reader
+            elapsed = time.perf_counter() - start
+            return sent, received.count("play"), received.count("error"), websocket.close_code, elapsed
+
+
+def main():
+    exact = [f'{{"type":"play","column":{n % 7}}}' for n in range(MESSAGES)]
+    spaced = [f'{{"type": "play", "column": {n % 7}}}' for n in range(MESSAGES)]
+    for name, messages in [("main.js messages", exact), ("other spellings", spaced)]:
+        old = validated_per_second(old_parse, messages)
+        new = validated_per_second(app.parse_play_message, messages)
+        print(f"{name:>17}: json {old:12,.0f}/sec | parse_play_message {new:12,.0f}/sec")
+
+    sent, moves, errors, close_code, elapsed = asyncio.run(flood())
+    print(
+        f"flood of {FLOOD:,} messages: {sent:,} sent before disconnect,"
+        f" {moves} moves played, {errors} errors sent back,"
+        f" closed with code {close_code} after {elapsed * 1000:.0f}ms"
+        " (includes the closing handshake timeout, since the server stops reading)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+bytes on the wire and server CPU per 1M moves, JSON vs the binary protocol
+of wire.py
+
+a move is one "play" message from the client plus the "play" event the
+server sends back. bytes include the websocket frame headers (client frames
+are masked, server frames aren't). CPU is what the server spends per move
+decoding the message, translating the event for the connection and
+serializing both frames, measured with time.process_time
+
+run from the repo root with `python benchmarks/bench_wire.py`
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from websockets.frames import Frame, Opcode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import events
+import wire
+from app import parse_play_message
+from connect4 import PLAYER1, PLAYER2
+
+N = int(os.environ.get("MOVES", "1000000"))
+# best of, the CPU figures are noisy on a shared machine
+ROUNDS = int(os.environ.get("ROUNDS", "3"))
+
+
+class Connection:
+    def __init__(self, subprotocol):
+        self.subprotocol = subprotocol
+
+
+def frame(message, mask):
+    if isinstance(message, str):
+        return Frame(Opcode.TEXT, message.encode()).serialize(mask=mask)
+    return Frame(Opcode.BINARY, message).serialize(mask=mask)
+
+
+def workload(seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.choice((PLAYER1, PLAYER2)), rng.randrange(7), rng.randrange(6))
+        for _ in range(N)
+    ]
+
+
+def client_message(subprotocol, column):
+    if subprotocol == wire.BINARY:
+        return bytes([wire.PLAY_FLAG | column])
+    return json.dumps({"type": "play", "column": column}, separators=(",", ":"))
+
+
+def run(subprotocol, moves):
+    connection = Connection(subprotocol)
+    messages = [client_message(subprotocol, column) for _, column, _ in moves]
+
+    sent = received = 0
+    start = time.process_time()
+    for message, (player, column, row) in zip(messages, moves):
+        received += len(frame(message, mask=True))
+        parse_play_message(message)
+        event = wire.encode_for(connection, events.encode_play(player, column, row))
+        sent += len(frame(event, mask=False))
+    elapsed = time.process_time() - start
+    return received, sent, elapsed
+
+
+def main():
+    moves = workload()
+    print(f"{N:,} moves")
+    results = {"json": [], "binary": []}
+    for _ in range(ROUNDS):
+        # alternated, so drift in the machine's speed hits both alike
+        results["json"].append(run(None, moves))
+        results["binary"].append(run(wire.BINARY, moves))
+    for name, rounds in results.items():
+        received, sent, elapsed = min(rounds, key=lambda result: result[2])
+        print(
+            f"{name:>7}: {received / N:5.1f} bytes in + {sent / N:5.1f} bytes out per move, "
+            f"{(received + sent) / 2**20:7.1f} MiB total, "
+            f"{elapsed:6.2f}s CPU ({elapsed / N * 1e9:5.0f} ns/move)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+moves/sec of app.py served by 1, 2 and 4 worker processes
+(WORKER_COUNTS env var to change, e.g. WORKER_COUNTS=1,8)
+
+client processes keep MATCHES matches each going for DURATION seconds.
+every match plays the same 7 move game over real websockets (player 2
+joins through the link, so with several workers half the joins are relayed)
+and starts over once red wins
+
+throughput can only scale with workers on a machine with that many spare
+cores, clients included
+
+run from the repo root with `python benchmarks/bench_workers.py`
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import websockets
+
+import appserver
+
+PORT = int(os.environ.get("BENCH_PORT", "8901"))
+URI = f"ws://localhost:{PORT}/"
+WORKER_COUNTS = [int(count) for count in os.environ.get("WORKER_COUNTS", "1,2,4").split(",")]
+CLIENT_PROCESSES = int(os.environ.get("CLIENT_PROCESSES", str(os.cpu_count() or 1)))
+MATCHES = int(os.environ.get("MATCHES", "50"))
+DURATION = float(os.environ.get("DURATION", "5"))
+
+# red wins on the 7th move
+GAME = [0, 0, 1, 1, 2, 2, 3]
+
+
+async def play_matches(deadline):
+    moves = 0
+    while time.perf_counter() < deadline:
+        async with websockets.connect(URI) as red:
+            await red.send(json.dumps({"type": "init"}))
+            init = json.loads(await red.recv())
+            async with websockets.connect(URI) as yellow:
+                await yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+                await yellow.recv()
+                for number, column in enumerate(GAME):
+                    player = red if number % 2 == 0 else yellow
+                    await player.send(json.dumps({"type": "play", "column": column}))
+                    await red.recv()
+                    await yellow.recv()
+                    moves += 1
+                # "win"
+                await red.recv()
+                await yellow.recv()
+    return moves
+
+
+def client_process(deadline, results):
+    async def run():
+        return sum(await asyncio.gather(*(play_matches(deadline) for _ in range(MATCHES))))
+    results.put(asyncio.run(run()))
+
+
+def run(worker_count):
+    with appserver.running(PORT, {"WEB_CONCURRENCY": str(worker_count)}):
+        results = multiprocessing.Queue()
+        deadline = time.perf_counter() + DURATION
+        clients = [
+            multiprocessing.Process(target=client_process, args=(deadline, results))
+            for _ in range(CLIENT_PROCESSES)
+        ]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        moves = sum(results.get() for _ in clients)
+        elapsed = time.perf_counter() - start
+        for client in clients:
+            client.join()
+    return moves / elapsed
+
+
+def main():
+    print(f"{CLIENT_PROCESSES} client processes x {MATCHES} matches, {DURATION}s per run")
+    baseline = None
+    for worker_count in WORKER_COUNTS:
+        rate = run(worker_count)
+        baseline = baseline or rate
+        print(f"{worker_count:>3} workers: {rate:10,.0f} moves/sec ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,747 @@
+#!/usr/bin/env python
+"""
+load generator for app.py
+
+starts the server as a subprocess and drives it with local websocket
+clients speaking the same init/join/watch/play protocol as main.js. games
+are random (or scripted with --scripted) and checked move by move against
+a local Connect4, so a client always knows which events to expect
+
+scenarios:
+    small_matches:   many concurrent two player matches, a new match as
+                     soon as the previous game ends
+    huge_spectated:  a few matches, each watched by many spectators, playing
+                     one game with some thinking time between moves
+    join_storm:      every player 1 connects at once, then every player 2
+                     follows its join link at once
+    restart:         small_matches with some thinking time, and the server
+                     is sent SIGTERM half way through and a new one started
+                     right away, as in a deploy. the server drains and hands
+                     unfinished matches over through its journal, players
+                     follow "reconnect" events. counts the games dropped
+    flaky:           small_matches where, before each move, the player who
+                     isn't moving may lose its connection (--drop-rate) and
+                     comes back with its reconnect token and the number of
+                     the last event it got. checks it is sent exactly the
+                     events it missed, or a snapshot when it asks from
+                     further back than the server keeps (a tenth of the
+                     resumes ask from 0, like a page that lost its state).
+                     a player dropped during the last move doesn't come
+                     back, finished games can't be resumed
+
+for each it records connections/sec, moves/sec, p50/p99 move latency (a
+player sending a move until it gets the "play" event back), spectator
+delivery latency where there are spectators, and the server's peak RSS and
+CPU time, read from /proc (so those two are Linux only)
+
+results are written as JSON, by default to loadtest-results/<commit>.json,
+and two result files can be compared:
+
+    python benchmarks/loadtest.py                        # every scenario
+    python benchmarks/loadtest.py small_matches --scale 4
+    python benchmarks/loadtest.py --compare old.json new.json
+
+SERVER_ENV passes extra variables to the server, e.g.
+SERVER_ENV="WEB_CONCURRENCY=2 COMPRESSION=off". clients play as fast as the
+server answers, far above the per-connection message rate of throttle.py,
+so the server runs with THROTTLE_RATE raised unless SERVER_ENV sets it
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import appserver
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+PORT = int(os.environ.get("BENCH_PORT", "8903"))
+URI = f"ws://localhost:{PORT}/"
+WATCH_URI = f"ws://localhost:{PORT}/watch"
+RESULTS_DIR = os.path.join(ROOT, "loadtest-results")
+
+# a short game red wins, for --scripted
+SCRIPTED_GAME = [0, 0, 1, 1, 2, 2, 3]
+
+# seconds between two samples of the server's RSS
+SAMPLE_INTERVAL = 0.2
+
+# seconds a player keeps trying to get back to its match after a restart
+REJOIN_TIMEOUT = 10.0
+# seconds to wait for the replay after rejoining, a match without moves has none
+REPLAY_WAIT = 0.5
+
+
+class Reconnect(Exception):
+    """
+    the server sent a "reconnect" event or closed the connection
+    """
+
+
+class Dropped(Exception):
+    """
+    a match could not be resumed after a restart
+    """
+
+
+class Stats:
+    """
+    what one client process measured
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.connect_seconds = 0.0
+        self.moves = 0
+        self.games = 0
+        self.errors = 0
+        self.move_latencies = []
+        self.spectator_latencies = []
+        # restart scenario
+        self.reconnects = 0
+        self.dropped = 0
+        # flaky scenario
+        self.resumes = 0
+        self.resumed_frames = 0
+        self.resume_snapshots = 0
+        self.resume_latencies = []
+
+    def merge(self, other):
+        self.connections += other.connections
+        self.connect_seconds = max(self.connect_seconds, other.connect_seconds)
+        self.moves += other.moves
+        self.games += other.games
+        self.errors += other.errors
+        self.move_latencies += other.move_latencies
+        self.spectator_latencies += other.spectator_latencies
+        self.reconnects += other.reconnects
+        self.dropped += other.dropped
+        self.resumes += other.resumes
+        self.resumed_frames += other.resumed_frames
+        self.resume_snapshots += other.resume_snapshots
+        self.resume_latencies += other.resume_latencies
+        return self
+
+
+async def connect(stats, uri=URI):
+    websocket = await websockets.connect(uri, max_size=None)
+    stats.connections += 1
+    return websocket
+
+
+async def recv_event(websocket, stats):
+    """
+    next event from the server, error events are counted and skipped
+    """
+    while True:
+        event = json.loads(await websocket.recv())
+        if event["type"] != "error":
+            return event
+        stats.errors += 1
+
+
+async def start_match(stats, inits=None):
+    """
+    returns (red, yellow, watch key) of a new match, both players connected
+
+    inits, if given, is a list the init events of red and yellow are added to
+    """
+    red = await connect(stats)
+    await red.send(json.dumps({"type": "init"}))
+    init = await recv_event(red, stats)
+    yellow = await connect(stats)
+    await yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+    yellow_init = await recv_event(yellow, stats)
+    if inits is not None:
+        inits += [init, yellow_init]
+    return red, yellow, init["watch"]
+
+
+async def play_game(red, yellow, stats, rng, scripted=False, think=0.0, on_move=None):
+    """
+    plays a game to its end over two connected players
+    """
+    game = Connect4()
+    script = iter(SCRIPTED_GAME)
+    for number in range(42):
+        player, websocket, other = (
+            (PLAYER1, red, yellow) if number % 2 == 0 else (PLAYER2, yellow, red)
+        )
+        if scripted:
+            column = next(script)
+        else:
+            column = rng.choice([c for c in range(7) if game.top[c] < 6])
+        if think:
+            await asyncio.sleep(think * rng.random())
+
+        start = time.perf_counter()
+        await websocket.send(json.dumps({"type": "play", "column": column}))
+        event = json.loads(await websocket.recv())
+        while event["type"] == "error":
+            # rejected, e.g. throttled: count it and try again
+            stats.errors += 1
+            await asyncio.sleep(0.1)
+            await websocket.send(json.dumps({"type": "play", "column": column}))
+            event = json.loads(await websocket.recv())
+        stats.move_latencies.append(time.perf_counter() - start)
+        assert event["type"] == "play", event
+        await recv_event(other, stats)
+        game.play(player, column)
+        stats.moves += 1
+        if on_move is not None:
+            on_move(start)
+
+        if game.winner:
+            await recv_event(red, stats)
+            await recv_event(yellow, stats)
+            break
+    stats.games += 1
+
+
+async def small_matches(stats, config, rng):
+    deadline = time.perf_counter() + config["duration"]
+
+    async def run_matches():
+        while time.perf_counter() < deadline:
+            red, yellow, _ = await start_match(stats)
+            try:
+                await play_game(red, yellow, stats, rng, config["scripted"])
+            finally:
+                await red.close()
+                await yellow.close()
+
+    await asyncio.gather(*(run_matches() for _ in range(config["matches"])))
+
+
+async def huge_spectated(stats, config, rng):
+    async def spectate(watch_key, sent_times, done):
+        websocket = await connect(stats, WATCH_URI)
+        await websocket.send(json.dumps({"type": "init", "watch": watch_key}))
+        try:
+            received = 0
+            while not done.is_set():
+                try:
+                    event = json.loads(await asyncio.wait_for(websocket.recv(), 0.5))
+                except asyncio.TimeoutError:
+                    continue
+                if event["type"] == "play":
+                    received += 1
+                    if received <= len(sent_times):
+                        stats.spectator_latencies.append(time.perf_counter() - sent_times[received - 1])
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            await websocket.close()
+
+    async def run_match():
+        red, yellow, watch_key = await start_match(stats)
+        sent_times = []
+        done = asyncio.Event()
+        spectators = [
+            asyncio.create_task(spectate(watch_key, sent_times, done))
+            for _ in range(config["spectators"])
+        ]
+        # lets every spectator connect before the game starts
+        await asyncio.sleep(config["spectators"] / 2000 + 0.5)
+        try:
+            # a single game, players thinking up to `think` seconds a move
+            await play_game(red, yellow, stats, rng, think=config["think"], on_move=sent_times.append)
+        finally:
+            await asyncio.sleep(0.5)
+            done.set()
+            await asyncio.gather(*spectators)
+            await red.close()
+            await yellow.close()
+
+    await asyncio.gather(*(run_match() for _ in range(config["matches"])))
+
+
+async def join_storm(stats, config, rng):
+    start = time.perf_counter()
+    reds = await asyncio.gather(*(connect(stats) for _ in range(config["matches"])))
+    await asyncio.gather(*(red.send(json.dumps({"type": "init"})) for red in reds))
+    inits = await asyncio.gather(*(recv_event(red, stats) for red in reds))
+    yellows = await asyncio.gather(*(connect(stats) for _ in reds))
+    await asyncio.gather(*(
+        yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+        for yellow, init in zip(yellows, inits)
+    ))
+    await asyncio.gather(*(recv_event(yellow, stats) for yellow in yellows))
+    stats.connect_seconds = time.perf_counter() - start
+
+    # one move each, to check every join went through
+    await asyncio.gather(*(
+        play_game(red, yellow, stats, rng, scripted=True) for red, yellow in zip(reds, yellows)
+    ))
+    await asyncio.gather(*(websocket.close() for websocket in reds + yellows))
+
+
+async def connect_retrying(stats, deadline):
+    """
+    connects, retrying while no server listens, e.g. during a restart
+    """
+    while True:
+        try:
+            return await connect(stats)
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise Dropped
+            await asyncio.sleep(0.1)
+
+
+async def expect_play(websocket):
+    """
+    waits for the next "play" event, raises Reconnect if the server goes away
+    """
+    try:
+        while True:
+            event = json.loads(await websocket.recv())
+            if event["type"] == "play":
+                return event
+            if event["type"] == "reconnect":
+                raise Reconnect
+    except websockets.ConnectionClosed:
+        raise Reconnect
+
+
+async def start_resilient_match(stats):
+    """
+    start_match, retrying while the server restarts. returns (red, yellow,
+    join key)
+    """
+    deadline = time.perf_counter() + REJOIN_TIMEOUT
+    while True:
+        red = await connect_retrying(stats, deadline)
+        try:
+            await red.send(json.dumps({"type": "init"}))
+            init = json.loads(await red.recv())
+            if init["type"] == "init":
+                yellow = await connect_retrying(stats, deadline)
+                await yellow.send(json.dumps({"type": "init", "join": init["join"]}))
+                return red, yellow, init["join"]
+        except websockets.ConnectionClosed:
+            pass
+        # a draining server turns new games away
+        await red.close()
+        if time.perf_counter() > deadline:
+            raise Dropped
+        await asyncio.sleep(0.1)
+
+
+async def rejoin(stats, join_key, player):
+    """
+    connects to a match again after a restart, retrying until the new server
+    has it. returns the connection and the moves played so far
+    """
+    deadline = time.perf_counter() + REJOIN_TIMEOUT
+    while True:
+        websocket = await connect_retrying(stats, deadline)
+        await websocket.send(json.dumps({"type": "init", "join": join_key, "player": player}))
+        try:
+            event = json.loads(await asyncio.wait_for(websocket.recv(), REPLAY_WAIT))
+            if event["type"] == "init":
+                # the seat is ours, the replay follows if there were moves
+                event = json.loads(await asyncio.wait_for(websocket.recv(), REPLAY_WAIT))
+            if event["type"] == "state":
+                return websocket, event["moves"]
+        except asyncio.TimeoutError:
+            return websocket, []
+        except websockets.ConnectionClosed:
+            pass
+        # e.g. the new server hasn't taken the match over yet
+        await websocket.close()
+        if time.perf_counter() > deadline:
+            raise Dropped
+        await asyncio.sleep(0.1)
+
+
+async def play_resilient_game(stats, rng, think):
+    """
+    play_game, following the server to its replacement when it restarts
+    """
+    red, yellow, join_key = await start_resilient_match(stats)
+    seats = {PLAYER1: red, PLAYER2: yellow}
+    game = Connect4()
+    try:
+        while not game.finished:
+            player, other = (PLAYER1, PLAYER2) if len(game.log) % 2 == 0 else (PLAYER2, PLAYER1)
+            column = rng.choice([c for c in range(7) if game.top[c] < 6])
+            await asyncio.sleep(think * rng.random())
+            try:
+                start = time.perf_counter()
+                await seats[player].send(json.dumps({"type": "play", "column": column}))
+                await expect_play(seats[player])
+                stats.move_latencies.append(time.perf_counter() - start)
+                await expect_play(seats[other])
+            except (Reconnect, websockets.ConnectionClosed):
+                stats.reconnects += 1
+                await asyncio.gather(*(websocket.close() for websocket in seats.values()))
+                try:
+                    (red, red_moves), (yellow, yellow_moves) = await asyncio.gather(
+                        rejoin(stats, join_key, PLAYER1), rejoin(stats, join_key, PLAYER2)
+                    )
+                except Dropped:
+                    if game.log:
+                        raise
+                    # created as the server began draining, its second player
+                    # reached the next server too early and the match closed
+                    # with nothing played. that game never started, start one
+                    red, yellow, join_key = await start_resilient_match(stats)
+                    red_moves = yellow_moves = []
+                seats = {PLAYER1: red, PLAYER2: yellow}
+                # the move just sent may or may not have made it
+                game = Connect4()
+                for moved, played_column, _ in max(red_moves, yellow_moves, key=len):
+                    game.play(moved, played_column)
+                continue
+            game.play(player, column)
+            stats.moves += 1
+    finally:
+        await asyncio.gather(*(websocket.close() for websocket in seats.values()))
+    stats.games += 1
+
+
+async def restart(stats, config, rng):
+    deadline = time.perf_counter() + config["duration"]
+
+    async def run_matches():
+        while time.perf_counter() < deadline:
+            try:
+                await play_resilient_game(stats, rng, config["think"])
+            except Dropped:
+                stats.dropped += 1
+
+    await asyncio.gather(*(run_matches() for _ in range(config["matches"])))
+
+
+async def catch_up(websocket, seq):
+    """
+    the events a player is sent until it has event number `seq`, raises
+    Dropped on an error, e.g. a resume turned down
+    """
+    received = []
+    while not received or received[-1]["seq"] < seq:
+        event = json.loads(await websocket.recv())
+        if event["type"] == "error":
+            raise Dropped
+        received.append(event)
+    return received
+
+
+async def resume(stats, init, since, seq, game):
+    """
+    connects a dropped player again with the token of its init event, and
+    checks what it is sent for the events after `since` up to `seq`
+    """
+    start = time.perf_counter()
+    websocket = await connect(stats)
+    await websocket.send(json.dumps({"type": "init", "join": init["join"], "token": init["token"], "seq": since}))
+    received = await catch_up(websocket, seq) if since < seq else []
+    stats.resume_latencies.append(time.perf_counter() - start)
+    stats.resumes += 1
+    stats.resumed_frames += len(received)
+    if received and received[0]["type"] == "state":
+        stats.resume_snapshots += 1
+        assert len(received) == 1, received
+        assert [tuple(move) for move in received[0]["moves"]] == list(game.moves), received
+    else:
+        assert [event["seq"] for event in received] == list(range(since + 1, seq + 1)), (since, seq, received)
+    return websocket
+
+
+async def play_flaky_game(stats, config, rng):
+    inits = []
+    red, yellow, _ = await start_match(stats, inits)
+    seats = {PLAYER1: red, PLAYER2: yellow}
+    tokens = dict(zip((PLAYER1, PLAYER2), inits))
+    # { player : number of the last event it got }
+    seqs = {PLAYER1: 0, PLAYER2: 0}
+    game = Connect4()
+    try:
+        while not game.finished:
+            player, other = (PLAYER1, PLAYER2) if len(game.log) % 2 == 0 else (PLAYER2, PLAYER1)
+            column = rng.choice([c for c in range(7) if game.top[c] < 6])
+            dropped = rng.random() < config["drop_rate"]
+            if dropped:
+                # gone without a close frame, as when a phone loses its network
+                seats[other].transport.abort()
+
+            start = time.perf_counter()
+            await seats[player].send(json.dumps({"type": "play", "column": column}))
+            game.play(player, column)
+            # the play event, and the win if that was the winning move
+            received = await catch_up(seats[player], seqs[player] + (2 if game.winner else 1))
+            stats.move_latencies.append(time.perf_counter() - start)
+            assert received[0]["type"] == "play" and received[0]["column"] == column, received
+            seqs[player] = received[-1]["seq"]
+            stats.moves += 1
+
+            if dropped and game.finished:
+                # that was the last move, there is no game to come back to
+                break
+            if dropped:
+                await asyncio.sleep(config["offline"] * rng.random())
+                # a tenth of them lost track of the events, e.g. after a reload
+                since = 0 if rng.random() < 0.1 else seqs[other]
+                seats[other] = await resume(stats, tokens[other], since, seqs[player], game)
+            else:
+                await catch_up(seats[other], seqs[player])
+            seqs[other] = seqs[player]
+    finally:
+        await asyncio.gather(*(websocket.close() for websocket in seats.values()))
+    stats.games += 1
+
+
+async def flaky(stats, config, rng):
+    deadline = time.perf_counter() + config["duration"]
+
+    async def run_matches():
+        while time.perf_counter() < deadline:
+            try:
+                await play_flaky_game(stats, config, rng)
+            except Dropped:
+                stats.dropped += 1
+
+    await asyncio.gather(*(run_matches() for _ in range(config["matches"])))
+
+
+SCENARIOS = {
+    # { name : (client coroutine, default settings) }
+    "small_matches": (small_matches, {"matches": 50, "duration": 5.0}),
+    "huge_spectated": (huge_spectated, {"matches": 2, "spectators": 500, "think": 0.1}),
+    "join_storm": (join_storm, {"matches": 500}),
+    "restart": (
+        restart,
+        {"matches": 50, "duration": 8.0, "think": 0.2, "restart_after": 3.0, "drain_timeout": 1.0},
+    ),
+    "flaky": (flaky, {"matches": 50, "duration": 8.0, "drop_rate": 0.1, "offline": 0.2}),
+}
+
+# settings multiplied by --scale
+SCALED = {"matches", "spectators"}
+
+
+def client_process(name, config, seed):
+    scenario, _ = SCENARIOS[name]
+    stats = Stats()
+    start = time.perf_counter()
+    asyncio.run(scenario(stats, config, random.Random(seed)))
+    if not stats.connect_seconds:
+        stats.connect_seconds = time.perf_counter() - start
+    return stats
+
+
+def proc_stats(pid):
+    """
+    (RSS bytes, CPU seconds) of a process and its children, from /proc
+    """
+    rss = cpu = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            pids += [int(child) for child in file.read().split()]
+    except OSError:
+        pass
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/statm") as file:
+                rss += int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{process}/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except OSError:
+            pass
+    return rss, cpu
+
+
+def start_server(extra_env=None):
+    env = {}
+    for assignment in os.environ.get("SERVER_ENV", "").split():
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    env.update(extra_env or {})
+    return appserver.start(PORT, env)
+
+
+def restart_server(server, extra_env):
+    """
+    sends SIGTERM to the server and starts the next one as soon as the old
+    one stops listening
+    """
+    server.send_signal(signal.SIGTERM)
+    for _ in range(100):
+        if not appserver.port_in_use(PORT):
+            break
+        time.sleep(0.05)
+    return start_server(extra_env)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def milliseconds(value):
+    return None if value is None else round(value * 1e3, 3)
+
+
+def run_scenario(name, config, processes):
+    journal_dir = tempfile.TemporaryDirectory()
+    extra_env = {}
+    if "restart_after" in config:
+        extra_env = {
+            "JOURNAL_PATH": os.path.join(journal_dir.name, "journal"),
+            "DRAIN_TIMEOUT": str(config["drain_timeout"]),
+        }
+    servers = [start_server(extra_env)]
+    # { pid : CPU seconds last seen }, a restarted server's time counts too
+    cpu = {}
+    try:
+        _, cpu_before = proc_stats(servers[0].pid)
+        peak_rss = 0
+        with multiprocessing.Pool(processes) as pool:
+            start = time.perf_counter()
+            restart_at = start + config.get("restart_after", float("inf"))
+            pending = pool.starmap_async(
+                client_process, [(name, config, seed) for seed in range(processes)]
+            )
+            while not pending.ready():
+                for server in servers:
+                    if server.poll() is None:
+                        rss, cpu[server.pid] = proc_stats(server.pid)
+                        peak_rss = max(peak_rss, rss)
+                if time.perf_counter() >= restart_at:
+                    restart_at = float("inf")
+                    servers.append(restart_server(servers[-1], extra_env))
+                pending.wait(SAMPLE_INTERVAL)
+            elapsed = time.perf_counter() - start
+            results = pending.get()
+        rss, cpu[servers[-1].pid] = proc_stats(servers[-1].pid)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        journal_dir.cleanup()
+
+    stats = Stats()
+    for result in results:
+        stats.merge(result)
+    return {
+        "config": config,
+        "client_processes": processes,
+        "seconds": round(elapsed, 3),
+        "connections": stats.connections,
+        "connections_per_sec": round(stats.connections / stats.connect_seconds, 1),
+        "games": stats.games,
+        "moves": stats.moves,
+        "moves_per_sec": round(stats.moves / elapsed, 1),
+        "move_latency_p50_ms": milliseconds(percentile(stats.move_latencies, 0.5)),
+        "move_latency_p99_ms": milliseconds(percentile(stats.move_latencies, 0.99)),
+        "spectator_latency_p50_ms": milliseconds(percentile(stats.spectator_latencies, 0.5)),
+        "spectator_latency_p99_ms": milliseconds(percentile(stats.spectator_latencies, 0.99)),
+        "errors": stats.errors,
+        "reconnects": stats.reconnects,
+        "dropped_games": stats.dropped,
+        "resumes": stats.resumes,
+        "resumed_frames_per_resume": round(stats.resumed_frames / stats.resumes, 2) if stats.resumes else None,
+        "resume_snapshots": stats.resume_snapshots,
+        "resume_latency_p50_ms": milliseconds(percentile(stats.resume_latencies, 0.5)),
+        "resume_latency_p99_ms": milliseconds(percentile(stats.resume_latencies, 0.99)),
+        "server_peak_rss_mb": round(max(peak_rss, rss) / 2**20, 1),
+        "server_cpu_seconds": round(sum(cpu.values()) - cpu_before, 2),
+    }
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    print(f"{old['commit']} -> {new['commit']}")
+    for name, new_result in new["scenarios"].items():
+        old_result = old["scenarios"].get(name)
+        if old_result is None:
+            continue
+        print(name)
+        for key, value in new_result.items():
+            before = old_result.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = f"{(value - before) / before:+8.1%}" if before else ""
+            print(f"  {key:>26}: {before:>12} -> {value:>12} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test app.py")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)}, default all")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies matches and spectators")
+    parser.add_argument("--duration", type=float, help="seconds, for the scenarios that run for a while")
+    parser.add_argument("--processes", type=int, default=1, help="client processes, each running the whole scenario")
+    parser.add_argument("--scripted", action="store_true", help="play a fixed short game instead of random ones")
+    parser.add_argument("--drop-rate", type=float, help="flaky: chance of a player losing its connection before each move")
+    parser.add_argument("--output", help="results file, default loadtest-results/<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "server_env": os.environ.get("SERVER_ENV", ""),
+        "scenarios": {},
+    }
+    for name in args.scenarios or list(SCENARIOS):
+        _, defaults = SCENARIOS[name]
+        config = dict(defaults, scripted=args.scripted)
+        for key in SCALED & set(config):
+            config[key] = max(1, int(config[key] * args.scale))
+        if args.duration is not None and "duration" in config:
+            config["duration"] = args.duration
+        if args.drop_rate is not None and "drop_rate" in config:
+            config["drop_rate"] = args.drop_rate
+        result = report["scenarios"][name] = run_scenario(name, config, args.processes)
+        print(name, json.dumps(result, indent=2))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
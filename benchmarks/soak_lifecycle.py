@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+soak test of match cleanup: plays GAMES games (20,000 by default) over real
+connections to the server's handler, printing RSS, matches still in the
+registry and connections still open as it goes. RSS should level off after
+the first batch instead of growing with the number of games, and once the
+last game is over everything is gone after the lifecycle's TTLs
+
+each game has two players and a spectator. most games are played out and
+everybody leaves, the rest go through the other ways a match ends:
+    dropped:  both players leave mid-game, their seats are held for
+              RESUME_GRACE and the match goes when that runs out
+    idle:     the players leave mid-game but the spectator stays, the
+              sweeper evicts the match after IDLE_TTL
+    finished: red and the spectator stay after the win, the sweeper evicts
+              the match after FINISHED_TTL
+
+the server runs in this process with its TTLs shortened, so RSS includes
+the clients. exits with an error if matches or connections are left over
+
+run from the repo root with `python benchmarks/soak_lifecycle.py`
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# read when app.py is imported: seats held for a second, and no throttling
+# of the bots' moves
+os.environ.update(RESUME_GRACE="1", THROTTLE_RATE="1000000", THROTTLE_BURST="1000000")
+
+import websockets
+
+import app
+import wire
+from connect4 import PLAYER1, PLAYER2, Connect4
+
+GAMES = int(os.environ.get("GAMES", "20000"))
+# games played at once
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "50"))
+REPORT_EVERY = GAMES // 10 or 1
+PORT = int(os.environ.get("BENCH_PORT", "8905"))
+URI = f"ws://localhost:{PORT}/"
+
+# seconds, instead of lifecycle.py's minutes
+IDLE_TTL = 3.0
+FINISHED_TTL = 1.0
+SWEEP_INTERVAL = 0.5
+
+# share of the games ending each way, the rest are played out
+ENDINGS = [("dropped", 0.05), ("idle", 0.05), ("finished", 0.1)]
+
+
+def rss_mib():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def connect(init):
+    websocket = await websockets.connect(URI, compression=None)
+    await websocket.send(json.dumps(init))
+    return websocket
+
+
+async def drain(websocket):
+    """
+    reads whatever comes until the connection closes, as a client left open
+    """
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.ConnectionClosed:
+        pass
+
+
+def ending(rng):
+    roll = rng.random()
+    for name, share in ENDINGS:
+        if roll < share:
+            return name
+        roll -= share
+    return "played"
+
+
+async def play_game(rng, left_open):
+    red = await connect({"type": "init"})
+    init = json.loads(await red.recv())
+    yellow = await connect({"type": "init", "join": init["join"]})
+    await yellow.recv()
+    spectator = await connect({"type": "init", "watch": init["watch"]})
+    watching = asyncio.create_task(drain(spectator))
+
+    how = ending(rng)
+    moves = rng.randrange(5, 30) if how in ("dropped", "idle") else 42
+    game = Connect4()
+    seats = {PLAYER1: red, PLAYER2: yellow}
+    player = PLAYER1
+    while game.winner is None and len(game.log) < moves:
+        column = rng.choice([c for c in range(7) if game.top[c] < 6])
+        game.play(player, column)
+        await seats[player].send(json.dumps({"type": "play", "column": column}))
+        await red.recv()
+        await yellow.recv()
+        player = PLAYER2 if player == PLAYER1 else PLAYER1
+
+    await yellow.close()
+    if how == "finished" and game.finished:
+        left_open.add(asyncio.create_task(drain(red)))
+        left_open.add(watching)
+        return
+    await red.close()
+    if how == "idle":
+        left_open.add(watching)
+        return
+    await spectator.close()
+    await watching
+
+
+async def main():
+    app.LIFECYCLE.idle_ttl = IDLE_TTL
+    app.LIFECYCLE.finished_ttl = FINISHED_TTL
+    rng = random.Random(0)
+    left_open = set()
+
+    async with websockets.serve(
+        app.handler, "localhost", PORT, compression=None, select_subprotocol=wire.select_subprotocol,
+    ) as server:
+        sweeper = asyncio.create_task(app.LIFECYCLE.run(SWEEP_INTERVAL))
+
+        def report(label):
+            left_open.difference_update({task for task in left_open if task.done()})
+            print(
+                f"{label:>10} {rss_mib():8.1f} {len(app.MATCHES):>6} {len(server.connections):>6} "
+                f"{dict(app.LIFECYCLE.evictions)}"
+            )
+
+        print(f"{'games':>10} {'rss MiB':>8} {'live':>6} {'conns':>6} evictions")
+        started = played = 0
+
+        async def player():
+            nonlocal started, played
+            while started < GAMES:
+                started += 1
+                await play_game(rng, left_open)
+                played += 1
+                if played % REPORT_EVERY == 0:
+                    report(f"{played:,}")
+
+        await asyncio.gather(*(player() for _ in range(CONCURRENCY)))
+        # held seats, then idle and finished matches, run out
+        await asyncio.sleep(app.RESUME_GRACE + IDLE_TTL + 2 * SWEEP_INTERVAL)
+        if left_open:
+            # closed by the evictions, unless something leaks
+            await asyncio.wait(left_open, timeout=FINISHED_TTL + 2 * SWEEP_INTERVAL)
+        report("after TTLs")
+        sweeper.cancel()
+        leftover = len(app.MATCHES), len(server.connections)
+
+    if any(leftover):
+        sys.exit(f"left over: {leftover[0]} matches, {leftover[1]} connections")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
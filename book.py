@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+opening book: searched values of every position up to a given number of moves
+
+the book is a sorted binary file, memory mapped and looked up with a binary
+search on the mapping, so opening it costs the same whatever its size and
+nothing is loaded into a dict
+
+file layout, little endian:
+    header:  magic b"C4BK", version (u16), depth (u16), record count (u32)
+    records: key (u64), score (i16), best column (u8), sorted by key
+
+keys are the canonical solver key of a position: `current + mask` of the
+position or of its mirror image, whichever is smaller. a position and its
+mirror share a record, which halves the file. lookups of the mirrored side
+flip the column back
+
+scores follow solver.py: beyond +/- solver.WIN the result is exact, below it
+the search ran out of time and the value is a heuristic
+
+build one with
+    python book.py book.bin --depth 6 --budget 0.5
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+import solver
+
+__all__ = ["OpeningBook", "canonical", "open_default"]
+
+MAGIC = b"C4BK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+RECORD = struct.Struct("<QhB")
+
+# used by the server when present, override with the OPENING_BOOK variable
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+
+
+def mirror(key):
+    """
+    key of the mirror image: columns are 8 bits each and adding the stones to
+    the mask never carries into the next column, so mirroring the position
+    mirrors the bytes of its key
+    """
+    return int.from_bytes(key.to_bytes(solver.WIDTH, "little"), "big")
+
+
+def canonical(current, mask):
+    """
+    returns (canonical key, whether that key is the mirror image's)
+    """
+    key = current + mask
+    mirrored = mirror(key)
+    return (mirrored, True) if mirrored < key else (key, False)
+
+
+class OpeningBook:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.depth, self.count = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, current, mask):
+        """
+        returns (column, score) for a position, or None if it isn't in the book
+        """
+        key, mirrored = canonical(current, mask)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, score, column = RECORD.unpack_from(self.mapping, HEADER.size + middle * RECORD.size)
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return (solver.WIDTH - 1 - column if mirrored else column), score
+        return None
+
+    def close(self):
+        self.mapping.close()
+
+
+def open_default():
+    """
+    the book at OPENING_BOOK (or book.bin next to this file), None if there is none
+    """
+    path = os.environ.get("OPENING_BOOK", DEFAULT_PATH)
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def positions(depth):
+    """
+    every position with at most `depth` moves where the game isn't over,
+    once per canonical key, as (current, mask, moves)
+    """
+    seen = set()
+    frontier = [(0, 0, 0)]
+    while frontier:
+        next_frontier = []
+        for current, mask, moves in frontier:
+            key, _ = canonical(current, mask)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield current, mask, moves
+            if moves == depth:
+                continue
+            possible = (mask + solver.BOTTOM) & solver.BOARD
+            if solver.winning_cells(current, mask) & possible:
+                # the player to move wins right away, positions after it aren't needed
+                continue
+            for column_mask in solver.COLUMN_MASKS:
+                move = possible & column_mask
+                if move:
+                    # the player who just moved becomes the opponent
+                    next_frontier.append((current ^ mask, mask | move, moves + 1))
+        frontier = next_frontier
+
+
+def build(path, depth, budget):
+    searcher = solver.Searcher()
+    records = []
+    start = time.perf_counter()
+    for current, mask, moves in positions(depth):
+        column, score, _ = searcher.search(current, mask, moves, budget=budget)
+        key, mirrored = canonical(current, mask)
+        records.append((key, score, solver.WIDTH - 1 - column if mirrored else column))
+        if len(records) % 1000 == 0:
+            print(f"{len(records):,} positions, {time.perf_counter() - start:.0f}s", file=sys.stderr)
+    records.sort()
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, depth, len(records)))
+        for record in records:
+            file.write(RECORD.pack(*record))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build a Connect4 opening book")
+    parser.add_argument("output", nargs="?", default=DEFAULT_PATH)
+    parser.add_argument("--depth", type=int, default=4, help="positions with up to this many moves")
+    parser.add_argument("--budget", type=float, default=0.5, help="search seconds per position")
+    args = parser.parse_args()
+
+    count = build(args.output, args.depth, args.budget)
+    print(f"wrote {count:,} positions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
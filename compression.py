@@ -0,0 +1,145 @@
+"""
+permessage-deflate settings for each kind of connection
+
+the server sends two kinds of traffic: move, win and error frames of a few
+dozen bytes, which deflate can't shrink by more than its own overhead, and
+"state" snapshots of up to a few hundred bytes, which compress well. so:
+
+    players:     no compression. they get moves, and a snapshot at most on
+                 joining, not worth a zlib context per connection
+    spectators:  permessage-deflate without context takeover, a small
+                 window and memLevel, and frames under MIN_SIZE sent
+                 uncompressed (permessage-deflate allows that per message)
+
+without context takeover every message is compressed on its own, so a frame
+compresses to the same bytes for every spectator with the same settings.
+SharedDeflate compresses each frame once and reuses the result, instead of
+running zlib per connection for every broadcast. the connection also keeps
+no zlib encoder between messages, which is most of the memory deflate costs.
+context takeover would shrink moves further, at ~45 KiB and several times
+the CPU per connection, see benchmarks/bench_compression.py
+
+the role is known before the handshake from the path: main.js connects to
+/watch to spectate. COMPRESSION picks the policy:
+    "auto":     the above, the default
+    "off":      no compression for anyone
+    "deflate":  websockets' default permessage-deflate for everyone
+"""
+
+import os
+import zlib
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+    enable_server_permessage_deflate,
+)
+from websockets.frames import CTRL_OPCODES, Frame, Opcode
+
+__all__ = ["SharedDeflate", "SharedDeflateFactory", "extensions_for", "process_request", "POLICY"]
+
+POLICY = os.environ.get("COMPRESSION", "auto")
+
+# bytes, smaller frames go out as they are
+MIN_SIZE = 128
+
+# a 2 KiB window covers the largest JSON snapshot of a full board
+WINDOW_BITS = 11
+MEM_LEVEL = 4
+
+# distinct frames kept compressed. moves repeat across matches, snapshots
+# are only shared within a match's broadcast
+CACHE_SIZE = 4096
+
+SPECTATOR_PATH = "/watch"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def deflate(data, window_bits, mem_level) -> bytes:
+    """
+    compresses one message the way PerMessageDeflate does without context
+    takeover, minus the 0x00 0x00 0xff 0xff trailer the extension drops
+    """
+    encoder = zlib.compressobj(wbits=-window_bits, memLevel=mem_level)
+    return (encoder.compress(data) + encoder.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+class SharedDeflate(PerMessageDeflate):
+    """
+    PerMessageDeflate compressing through the shared `deflate` cache when
+    the server side has no context takeover
+    """
+
+    def encode(self, frame):
+        if (
+            not self.local_no_context_takeover
+            or frame.opcode in CTRL_OPCODES
+            or frame.opcode is Opcode.CONT
+            or not frame.fin
+        ):
+            return super().encode(frame)
+        if len(frame.data) < MIN_SIZE:
+            return frame
+        data = deflate(
+            bytes(frame.data),
+            self.local_max_window_bits,
+            self.compress_settings.get("memLevel", zlib.DEF_MEM_LEVEL),
+        )
+        return Frame(frame.opcode, data, frame.fin, True, frame.rsv2, frame.rsv3)
+
+
+class SharedDeflateFactory(ServerPerMessageDeflateFactory):
+    """
+    negotiates permessage-deflate like the websockets factory, handing out
+    SharedDeflate extensions
+    """
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, SharedDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+
+
+SPECTATOR_EXTENSIONS = [
+    SharedDeflateFactory(
+        server_no_context_takeover=True,
+        # spectators hardly send anything, no need to keep a decoder either
+        client_no_context_takeover=True,
+        server_max_window_bits=WINDOW_BITS,
+        client_max_window_bits=WINDOW_BITS,
+        compress_settings={"memLevel": MEM_LEVEL},
+    )
+]
+
+POLICIES = {
+    # { policy : (player extensions, spectator extensions) }
+    "auto": ([], SPECTATOR_EXTENSIONS),
+    "off": ([], []),
+    "deflate": (enable_server_permessage_deflate(None),) * 2,
+}
+
+
+def extensions_for(path, policy=POLICY):
+    """
+    extension factories offered to a connection opened on this path
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown compression policy: {policy}")
+    players, spectators = POLICIES[policy]
+    return spectators if urlsplit(path).path == SPECTATOR_PATH else players
+
+
+def process_request(connection, request):
+    """
+    process_request hook for websockets.serve: sets the extensions the
+    handshake may negotiate for this connection, then lets it go on
+    """
+    connection.protocol.available_extensions = extensions_for(request.path)
+    return None
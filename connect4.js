@@ -42,4 +42,80 @@ function playMove(board, player, column, row) {
   }
 }
 
-export { PLAYER1, PLAYER2, createBoard, playMove };
+// Compact binary wire protocol, see wire.py for the frame layouts.
+const BINARY_PROTOCOL = "connect4.binary.v1";
+
+const JSON_PROTOCOL = "connect4.json";
+
+const PLAYERS = [PLAYER1, PLAYER2, null];
+
+const INIT_MODES = { join: 1, watch: 2, computer: 3, quick: 4 };
+
+function decodeEvent(data) {
+  // Text frames are JSON, binary frames are decoded into the same events.
+  if (typeof data === "string") {
+    return JSON.parse(data);
+  }
+  const bytes = new Uint8Array(data);
+  const kind = bytes[0];
+  if (kind & 0x80) {
+    return {
+      type: "play",
+      player: PLAYERS[(kind >> 6) & 1],
+      column: (kind >> 3) & 7,
+      row: kind & 7,
+    };
+  }
+  const text = new TextDecoder();
+  switch (kind) {
+    case 0x01: {
+      const separator = bytes.indexOf(0, 1);
+      return {
+        type: "init",
+        join: text.decode(bytes.subarray(1, separator)),
+        watch: text.decode(bytes.subarray(separator + 1)),
+      };
+    }
+    case 0x02:
+      return { type: "win", player: PLAYERS[bytes[1]] };
+    case 0x03:
+      return { type: "error", message: text.decode(bytes.subarray(1)) };
+    case 0x04: {
+      const moves = [];
+      for (let index = 2; index < bytes.length; index++) {
+        const move = bytes[index];
+        moves.push([PLAYERS[index % 2], move >> 3, move & 7]);
+      }
+      return { type: "state", moves: moves, winner: PLAYERS[bytes[1]] };
+    }
+    default:
+      throw new Error(`Unsupported binary frame: ${kind}.`);
+  }
+}
+
+function encodePlay(column) {
+  return Uint8Array.of(0x80 | column);
+}
+
+function encodeInit(event) {
+  // event is an "init" event as sent in JSON.
+  for (const [mode, code] of Object.entries(INIT_MODES)) {
+    if (event[mode]) {
+      const key = event[mode] === true ? "" : event[mode];
+      return Uint8Array.of(0x01, code, ...new TextEncoder().encode(key));
+    }
+  }
+  return Uint8Array.of(0x01, 0);
+}
+
+export {
+  PLAYER1,
+  PLAYER2,
+  BINARY_PROTOCOL,
+  JSON_PROTOCOL,
+  createBoard,
+  playMove,
+  decodeEvent,
+  encodePlay,
+  encodeInit,
+};
@@ -1,7 +1,69 @@
+from collections.abc import Sequence
+
 __all__ = ["PLAYER1", "PLAYER2", "Connect4"]
 
 PLAYER1, PLAYER2 = "red", "yellow"
 
+# Checkers are stored in bitboards with 8 bits per column: bit
+# ``8 * column + row`` is set when that cell holds a checker. Rows 6 and 7
+# are always empty, which keeps diagonal lines from wrapping across columns.
+COLUMNS, ROWS = 7, 6
+
+
+def _windows_through(column, row):
+    """
+    Masks of every line of four cells that contains ``(column, row)``.
+
+    """
+    windows = []
+    for dc, dr in [(1, 0), (0, 1), (1, 1), (1, -1)]:
+        for offset in range(4):
+            cells = [
+                (column + (k - offset) * dc, row + (k - offset) * dr)
+                for k in range(4)
+            ]
+            if all(0 <= c < COLUMNS and 0 <= r < ROWS for c, r in cells):
+                windows.append(sum(1 << (8 * c + r) for c, r in cells))
+    return tuple(windows)
+
+
+# Lines of four through each cell, indexed by ``8 * column + row``.
+WINDOWS = [
+    _windows_through(bit // 8, bit % 8) if bit % 8 < ROWS else ()
+    for bit in range(8 * COLUMNS)
+]
+
+
+class Moves(Sequence):
+    """
+    Read-only view of the moves of a :class:`Connect4` game.
+
+    Items are ``(player, column, row)`` tuples, built on access from the
+    packed move log.
+
+    """
+
+    __slots__ = ["log"]
+
+    def __init__(self, log):
+        self.log = log
+
+    def __len__(self):
+        return len(self.log)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.log)))]
+        if index < 0:
+            index += len(self.log)
+        if not 0 <= index < len(self.log):
+            raise IndexError("move index out of range")
+        move = self.log[index]
+        return PLAYER2 if index % 2 else PLAYER1, move >> 3, move & 7
+
+    def __repr__(self):
+        return repr(list(self))
+
 
 class Connect4:
     """
@@ -15,10 +77,29 @@ class Connect4:
 
     """
 
+    # games live as long as their match, so keep them small: moves are packed
+    # one byte each as ``column << 3 | row`` and the player is implied by
+    # the parity of the move
+    __slots__ = ["log", "top", "winner", "red", "yellow", "snapshot"]
+
     def __init__(self):
-        self.moves = []
-        self.top = [0 for _ in range(7)]
+        self.log = bytearray()
+        self.top = bytearray(7)
         self.winner = None
+        # checkers of each player, updated incrementally by play()
+        self.red = 0
+        self.yellow = 0
+        # encoded "state" event for the current position, filled in lazily
+        # by whoever serializes the game and reset by every play()
+        self.snapshot = None
+
+    @property
+    def moves(self):
+        """
+        Past moves as ``(player, column, row)`` tuples.
+
+        """
+        return Moves(self.log)
 
     @property
     def last_player(self):
@@ -26,16 +107,37 @@ class Connect4:
         Player who played the last move.
 
         """
-        return PLAYER1 if len(self.moves) % 2 else PLAYER2
+        return PLAYER1 if len(self.log) % 2 else PLAYER2
+
+    @property
+    def mask(self):
+        """
+        Bitboard of every occupied cell.
+
+        """
+        return self.red | self.yellow
+
+    @property
+    def finished(self):
+        """
+        Whether the game is over: won, or drawn with the board full.
+
+        """
+        return self.winner is not None or len(self.log) == COLUMNS * ROWS
 
     @property
     def last_player_won(self):
         """
         Whether the last move is winning.
 
+        Only the lines going through the last checker are examined.
+
         """
-        b = sum(1 << (8 * column + row) for _, column, row in self.moves[::-2])
-        return any(b & b >> v & b >> 2 * v & b >> 3 * v for v in [1, 7, 8, 9])
+        if not self.log:
+            return False
+        b = self.red if len(self.log) % 2 else self.yellow
+        move = self.log[-1]
+        return any(b & w == w for w in WINDOWS[8 * (move >> 3) + (move & 7)])
 
     def play(self, player, column):
         """
@@ -53,8 +155,13 @@ class Connect4:
         if row == 6:
             raise RuntimeError("This slot is full.")
 
-        self.moves.append((player, column, row))
+        self.snapshot = None
+        self.log.append(column << 3 | row)
         self.top[column] += 1
+        if player == PLAYER1:
+            self.red |= 1 << (8 * column + row)
+        else:
+            self.yellow |= 1 << (8 * column + row)
 
         if self.winner is None and self.last_player_won:
             self.winner = self.last_player
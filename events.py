@@ -0,0 +1,172 @@
+"""
+encoding of the events the server sends to the browser
+
+"play" and "win" events can only take a handful of values (2 players x 7
+columns x 6 rows, and 2 winners), so they are serialized once at import
+and the same str is reused for every broadcast and replay.
+
+anything else goes through `dumps`, which uses orjson when it is installed
+and falls back to the standard library json module otherwise
+"""
+
+import json
+from functools import lru_cache
+
+from connect4 import PLAYER1, PLAYER2
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = [
+    "dumps",
+    "loads",
+    "encode_play",
+    "encode_win",
+    "encode_error",
+    "encode_init",
+    "encode_state",
+    "encode_reconnect",
+    "encode_rating",
+    "encode_leaderboard",
+    "encode_closed",
+    "encode_sequenced",
+]
+
+
+if orjson is not None:
+    def dumps(event) -> str:
+        """
+        serializes an event to a str, so websockets sends it as a text frame
+        """
+        return orjson.dumps(event).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(event) -> str:
+        """
+        serializes an event to a str, so websockets sends it as a text frame,
+        as compact as orjson's
+        """
+        return json.dumps(event, separators=(",", ":"))
+
+    loads = json.loads
+
+
+# { (player, column, row) : jsoned "play" event }
+PLAY_EVENTS = {
+    (player, column, row): json.dumps({
+        "type": "play",
+        "player": player,
+        "column": column,
+        "row": row
+    }, separators=(",", ":"))
+    for player in (PLAYER1, PLAYER2)
+    for column in range(7)
+    for row in range(6)
+}
+
+# { player : jsoned "win" event }
+WIN_EVENTS = {
+    player: json.dumps({"type": "win", "player": player}, separators=(",", ":"))
+    for player in (PLAYER1, PLAYER2)
+}
+
+
+def encode_play(player, column, row) -> str:
+    """
+    returns the precomputed "play" event for a move
+    """
+    return PLAY_EVENTS[player, column, row]
+
+
+def encode_win(player) -> str:
+    """
+    returns the precomputed "win" event for a player
+    """
+    return WIN_EVENTS[player]
+
+
+@lru_cache(maxsize=256)
+def encode_error(message) -> str:
+    """
+    returns an "error" event for the message
+
+    the same few game errors ("It isn't your turn.", "This slot is full.")
+    are sent over and over, so these are memoized
+    """
+    return dumps({"type": "error", "message": str(message)})
+
+
+def encode_init(join_key, watch_key, token=None, player=None) -> str:
+    """
+    returns the "init" event sent to a player when they get their seat,
+    with the seat and the token to take it back if their connection drops
+    """
+    if token is None:
+        return dumps({"type": "init", "join": join_key, "watch": watch_key})
+    return dumps({"type": "init", "join": join_key, "watch": watch_key, "token": token, "player": player})
+
+
+def encode_state(game) -> str:
+    """
+    returns a "state" event with every move played so far in the game,
+    so a late joiner can draw the board from a single frame
+
+    the encoding is cached on the game and only rebuilt after the next play
+    """
+    if game.snapshot is None:
+        game.snapshot = dumps({
+            "type": "state",
+            "moves": [list(move) for move in game.moves],
+            "winner": game.winner
+        })
+    return game.snapshot
+
+
+def encode_reconnect(**keys) -> str:
+    """
+    returns a "reconnect" event, telling a client the server is going away
+    and how to come back: with its join key and player, its watch key, or
+    nothing for someone who hadn't joined a match yet
+    """
+    return dumps({"type": "reconnect", **keys})
+
+
+def encode_rating(rating, change, rank) -> str:
+    """
+    returns a "rating" event, telling a player their rating, how much the
+    game they just finished changed it, and their rank on the leaderboard
+    """
+    return dumps({"type": "rating", "rating": round(rating), "change": round(change), "rank": rank})
+
+
+def encode_leaderboard(start, entries, you=None) -> str:
+    """
+    returns a "leaderboard" event listing the (rank, name, rating) entries
+    from rank `start` on, and the rank and rating of whoever asked if they
+    are ranked
+    """
+    return dumps({
+        "type": "leaderboard",
+        "start": start,
+        "players": [{"rank": rank, "name": name, "rating": round(rating)} for rank, name, rating in entries],
+        "you": you,
+    })
+
+
+def encode_closed(code, reason) -> str:
+    """
+    returns a "closed" event, telling a session client that one of its
+    matches ended for the reason a connection would have been closed with
+    """
+    return dumps({"type": "closed", "code": code, "reason": reason})
+
+
+def encode_sequenced(seq, frame) -> str:
+    """
+    returns the event frame with its sequence number in the match as the
+    first field, see history.py. the frame isn't parsed again
+    """
+    return '{"seq":' + str(seq) + "," + frame[1:]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+in-memory stand-in for a Redis server, implementing only the commands used by
+the match registry (PING, GET, SET, DEL, APPEND, HSET, HGET, HGETALL,
+PUBLISH, SUBSCRIBE)
+
+good enough to run the server with REDIS_URL pointing at it during
+development, not a database
+
+    python fake_redis.py            # listens on port 6379
+    REDIS_PORT=6380 python fake_redis.py
+"""
+
+import asyncio
+import os
+
+from redis_client import read_reply
+
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), bytes(value))
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        # { channel : set of subscriber StreamWriters }
+        self.subscribers = {}
+
+    def command(self, name, args, writer):
+        if name == "PING":
+            return "PONG"
+        if name == "GET":
+            return self.data.get(args[0])
+        if name == "SET":
+            self.data[args[0]] = args[1]
+            return "OK"
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == "APPEND":
+            value = self.data[args[0]] = self.data.get(args[0], b"") + args[1]
+            return len(value)
+        if name == "HSET":
+            hash_ = self.data.setdefault(args[0], {})
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in hash_
+                hash_[field] = value
+            return added
+        if name == "HGET":
+            return self.data.get(args[0], {}).get(args[1])
+        if name == "HGETALL":
+            return [item for pair in self.data.get(args[0], {}).items() for item in pair]
+        if name == "PUBLISH":
+            subscribers = self.subscribers.get(args[0], set())
+            for subscriber in subscribers:
+                subscriber.write(encode_reply([b"message", args[0], args[1]]))
+            return len(subscribers)
+        if name == "SUBSCRIBE":
+            for channel in args:
+                self.subscribers.setdefault(channel, set()).add(writer)
+            return [b"subscribe", args[0], len(args)]
+        return ValueError(f"unknown command '{name}'")
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                name, args = request[0].decode().upper(), request[1:]
+                writer.write(encode_reply(self.command(name, args, writer)))
+                await writer.drain()
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+async def main():
+    port = int(os.environ.get("REDIS_PORT", "6379"))
+    server = await asyncio.start_server(FakeRedis().serve_client, "localhost", port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+non-blocking fan-out of frames to many connections
+
+every connection gets an Outbox: a bounded queue drained by its own writer
+task. publishing a frame only puts it on each queue, so a player whose TCP
+buffer is full delays nobody but themselves
+
+when a queue is full the outbox applies its slow consumer policy:
+    "drop":       the new frame is discarded
+    "snapshot":   everything queued is replaced by a single "state" frame,
+                  which brings the client up to date in one go
+    "disconnect": the connection is closed, the client can reconnect and
+                  catch up through the late-join replay
+
+frames are queued as JSON and translated to the connection's wire protocol
+(see wire.py) by the writer task
+"""
+
+import asyncio
+
+import websockets
+
+import wire
+
+__all__ = ["Outbox", "publish", "OUTBOX_SIZE"]
+
+# frames a connection may have waiting before it counts as a slow consumer
+# a whole game is 42 moves + 1 win, so a healthy client never gets close
+OUTBOX_SIZE = 64
+
+POLICIES = {"drop", "snapshot", "disconnect"}
+
+# close code for connections dropped for being too slow: "Try Again Later"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class Outbox:
+    """
+    bounded queue of outgoing frames for one websocket
+
+    exposes the same `send` coroutine as a websocket, so the send_* helpers
+    in app.py work with either
+    """
+
+    def __init__(self, websocket, snapshot=None, policy="snapshot", maxsize=OUTBOX_SIZE):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        if policy == "snapshot" and snapshot is None:
+            raise ValueError("the snapshot policy needs a snapshot function")
+
+        self.websocket = websocket
+        # called with no arguments, returns the current "state" frame
+        self.snapshot = snapshot
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize)
+        self.overflows = 0
+        # frames written to the connection so far
+        self.sent = 0
+        self.writer = asyncio.create_task(self.write_frames())
+
+    def put(self, frame):
+        """
+        queues a frame without waiting, applying the slow consumer policy
+        if the queue is full
+        """
+        try:
+            self.queue.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            self.overflows += 1
+
+        if self.policy == "snapshot":
+            # the snapshot already contains every queued move
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.snapshot())
+        elif self.policy == "disconnect":
+            self.writer.cancel()
+            asyncio.create_task(
+                self.websocket.close(SLOW_CONSUMER_CLOSE_CODE, "slow consumer")
+            )
+        # "drop": nothing to do, the frame is lost
+
+    async def send(self, frame):
+        self.put(frame)
+
+    async def write_frames(self):
+        """
+        writer task: sends queued frames one at a time until the connection
+        closes or the outbox is closed
+        """
+        try:
+            while True:
+                frame = await self.queue.get()
+                await self.websocket.send(wire.encode_for(self.websocket, frame))
+                self.sent += 1
+        except websockets.ConnectionClosed:
+            pass
+
+    def close(self):
+        """
+        stops the writer task, dropping anything still queued
+        """
+        self.writer.cancel()
+
+
+def publish(outboxes, frame):
+    """
+    queues a frame on every outbox, never waits
+    """
+    for outbox in outboxes:
+        outbox.put(frame)
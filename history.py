@@ -0,0 +1,62 @@
+"""
+the numbered event stream of a match
+
+every event sent to everyone in a match ("play" and "win") gets the match's
+next sequence number, spliced into the cached frame as a "seq" field:
+
+    {"seq":5,"type":"play","player":"red","column":3,"row":2}
+
+and the last HISTORY_SIZE of them are kept in a ring buffer. a client that
+lost its connection says the last number it got and is sent only what came
+after it, or a single "state" snapshot, numbered like the last event, if
+some of that already left the buffer
+
+binary protocol clients get the one byte "play" and "win" frames without
+the number, every one of them is the next. "state" frames carrying a number
+have no binary form, they go out as JSON
+"""
+
+import collections
+import itertools
+
+import events
+
+__all__ = ["History", "HISTORY_SIZE"]
+
+# events kept per match. a game is at most 43, a client that missed more
+# than this gets a snapshot instead
+HISTORY_SIZE = 16
+
+
+class History:
+    __slots__ = ["seq", "frames"]
+
+    def __init__(self, size=HISTORY_SIZE, seq=0):
+        # number of the last event, 0 before the first
+        self.seq = seq
+        self.frames = collections.deque(maxlen=size)
+
+    def append(self, frame) -> str:
+        """
+        numbers an event and keeps it, returns the numbered frame to send
+        """
+        self.seq += 1
+        frame = events.encode_sequenced(self.seq, frame)
+        self.frames.append(frame)
+        return frame
+
+    def since(self, seq):
+        """
+        the frames of the events after `seq`, None if some of them are no
+        longer kept, or if seq is one this match never reached
+        """
+        missed = self.seq - seq
+        if missed < 0 or missed > len(self.frames):
+            return None
+        return list(itertools.islice(self.frames, len(self.frames) - missed, None))
+
+    def snapshot(self, game) -> str:
+        """
+        the game's "state" frame, numbered like the last event
+        """
+        return events.encode_sequenced(self.seq, events.encode_state(game))
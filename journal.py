@@ -0,0 +1,335 @@
+"""
+append-only log of the matches hosted by this process, so they survive a
+restart or a crash
+
+the registry tells the journal about every match added, move played and
+match removed (see registry.InMemoryMatchRegistry). each becomes one or a
+few records of 6 bytes:
+
+    open   "O" number count   followed by `count` records "K" + 5 bytes
+                              holding the keys and whether player 2 is
+                              the computer
+    move   "M" number move    the byte Connect4 appends to game.log
+    close  "C" number 0
+
+where number is a 4 byte id given to the match when it is opened. with a
+single record size, reading the log is one struct.iter_unpack over it
+
+the event loop only appends records to a queue. a writer thread takes
+whatever piled up every FLUSH_INTERVAL, writes it and fsyncs once for the
+whole batch, so many moves share one fsync. the price is that a crash
+loses the moves of the last FLUSH_INTERVAL or so, the players' clients
+have already been told about them
+
+`open()` reads the log left by the previous run and returns the matches
+that were never closed. the log is then rewritten with only those and
+appended to from there. a log cut short by a crash is read up to its last
+whole record. the log is rewritten the same way while running, once
+COMPACT_AFTER matches were closed, so it holds little more than the
+matches in progress and recovery stays quick
+
+a process holds a lock on the journal (a flock on JOURNAL_PATH.lock) from
+`open()` to `close()`, so a new process started while the old one is still
+draining can wait for it before reading the log. records of matches created
+meanwhile are queued and written once the log is open
+
+enabled by setting JOURNAL_PATH, each worker process gets its own file
+"""
+
+import collections
+import fcntl
+import os
+import struct
+import threading
+import time
+
+import metrics
+import workers
+
+__all__ = ["Journal", "Entry", "from_env", "FLUSH_INTERVAL", "COMPACT_AFTER"]
+
+# seconds between two group commits
+FLUSH_INTERVAL = float(os.environ.get("JOURNAL_FLUSH_INTERVAL", "0.01"))
+
+# matches closed before the log is compacted, see Journal.closed
+COMPACT_AFTER = 10_000
+
+OPEN, KEYS, MOVE, CLOSE = b"O", b"K", b"M", b"C"
+
+# kind, match number and one byte, every record has this size
+RECORD = struct.Struct("<cIB")
+# bytes of key data carried by a KEYS record, in place of the number and byte
+KEYS_CHUNK = RECORD.size - 1
+
+
+# a match found in the log: its keys, whether player 2 is the computer, and
+# its game's packed move log
+Entry = collections.namedtuple("Entry", ["join_key", "watch_key", "computer", "log"])
+
+
+def encode_open(number, join_key, watch_key, computer):
+    """
+    the records opening a match, moves are recorded separately
+    """
+    join_key, watch_key = join_key.encode(), watch_key.encode()
+    keys = bytes([computer, len(join_key)]) + join_key + bytes([len(watch_key)]) + watch_key
+    chunks = [keys[i:i + KEYS_CHUNK].ljust(KEYS_CHUNK, b"\0") for i in range(0, len(keys), KEYS_CHUNK)]
+    return RECORD.pack(OPEN, number, len(chunks)) + b"".join(KEYS + chunk for chunk in chunks)
+
+
+def decode_keys(data, index, count):
+    """
+    join key, watch key and computer flag from the `count` KEYS records
+    following the OPEN record at `index`, None if the log ends before them
+    """
+    start = (index + 1) * RECORD.size
+    records = data[start:start + count * RECORD.size]
+    if len(records) < count * RECORD.size:
+        return None
+    keys = b"".join(records[i + 1:i + RECORD.size] for i in range(0, len(records), RECORD.size))
+    size = keys[1]
+    join_key = keys[2:2 + size].decode()
+    watch_key = keys[3 + size:3 + size + keys[2 + size]].decode()
+    return join_key, watch_key, bool(keys[0])
+
+
+def parse(data):
+    """
+    returns the Entry of every match opened and not closed in the log, read
+    up to its last whole record
+
+    this reads every record of every game ever logged, so the loop only
+    keeps the moves of open matches and where their OPEN record is. keys
+    are decoded at the end, for the matches still open
+    """
+    opened = {}
+    moves = {}
+    end = len(data) - len(data) % RECORD.size
+    for index, (kind, number, value) in enumerate(RECORD.iter_unpack(memoryview(data)[:end])):
+        if kind == MOVE:
+            log = moves.get(number)
+            if log is not None:
+                log.append(value)
+        elif kind == CLOSE:
+            opened.pop(number, None)
+            moves.pop(number, None)
+        elif kind == OPEN:
+            opened[number] = (index, value)
+            moves[number] = bytearray()
+        # KEYS records are read by decode_keys
+
+    entries = []
+    for number, (index, count) in opened.items():
+        keys = decode_keys(data, index, count)
+        if keys is not None:
+            join_key, watch_key, computer = keys
+            entries.append(Entry(join_key, watch_key, computer, bytes(moves[number])))
+    return entries
+
+
+def encode_match(number, join_key, watch_key, computer, log):
+    """
+    the records of a match and every move played so far
+    """
+    records = [encode_open(number, join_key, watch_key, computer)]
+    records.extend(RECORD.pack(MOVE, number, move) for move in log)
+    return b"".join(records)
+
+
+class Snapshot(bytes):
+    """
+    records of every open match, queued for the writer thread to replace
+    the log with
+    """
+
+
+class Journal:
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL, compact_after=COMPACT_AFTER):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        # encoded records waiting for the writer thread
+        self.pending = collections.deque()
+        # { join key : match number } and { match number : Match } of the
+        # matches open in the log
+        self.numbers = {}
+        self.matches = {}
+        self.next_number = 0
+        # matches closed since the log was last compacted
+        self.closed_since_compaction = 0
+        self.file = None
+        self.lock_file = None
+        self.writer = None
+        self.stopping = threading.Event()
+        # group commits done, records they wrote, and compactions
+        self.fsyncs = 0
+        self.records = 0
+        self.compactions = 0
+
+    def lock(self, blocking=True) -> bool:
+        """
+        takes the journal's lock, waiting for whoever has it unless blocking
+        is False. returns whether the lock is held
+        """
+        if self.lock_file is None:
+            self.lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    def open(self):
+        """
+        starts the journal, returns the Entry of every match the previous
+        run left open
+
+        the matches have to be added to the registry again to be recorded,
+        their numbers are kept
+        """
+        self.lock()
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            data = b""
+        entries = parse(data)
+
+        # numbered after the matches created while waiting for the lock
+        records = []
+        for entry in entries:
+            number = self.numbers[entry.join_key] = self.next_number
+            self.next_number += 1
+            records.append(encode_match(number, entry.join_key, entry.watch_key, entry.computer, entry.log))
+        self.rewrite(b"".join(records))
+
+        self.writer = threading.Thread(target=self.run, name="journal", daemon=True)
+        self.writer.start()
+        return entries
+
+    def opened(self, match):
+        if self.stopping.is_set():
+            return
+        number = self.numbers.get(match.join_key)
+        if number is not None:
+            # already in the log, recovered from it
+            self.matches[number] = match
+            return
+        number = self.numbers[match.join_key] = self.next_number
+        self.next_number += 1
+        self.matches[number] = match
+        self.pending.append(
+            encode_match(number, match.join_key, match.watch_key, match.computer, match.game.log)
+        )
+
+    def moved(self, match):
+        number = self.numbers.get(match.join_key)
+        if number is not None:
+            self.pending.append(RECORD.pack(MOVE, number, match.game.log[-1]))
+
+    def closed(self, match):
+        number = self.numbers.pop(match.join_key, None)
+        if number is None:
+            return
+        self.matches.pop(number, None)
+        self.pending.append(RECORD.pack(CLOSE, number, 0))
+
+        # the log only needs what is still open. compacting after at least
+        # as many closes as there are open matches keeps the cost of taking
+        # a snapshot below that of the closes
+        self.closed_since_compaction += 1
+        if self.writer is not None and self.closed_since_compaction >= max(self.compact_after, len(self.matches)):
+            self.compact()
+
+    def compact(self):
+        """
+        queues a snapshot of the open matches, the writer thread makes it
+        the new log. everything queued before it is in the snapshot
+        """
+        self.closed_since_compaction = 0
+        self.pending.append(Snapshot(b"".join(
+            encode_match(number, match.join_key, match.watch_key, match.computer, match.game.log)
+            for number, match in self.matches.items()
+        )))
+
+    def rewrite(self, data):
+        """
+        atomically replaces the log with `data`, and appends to it from then on
+        """
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, "ab")
+
+    def run(self):
+        """
+        writer thread
+        """
+        while not self.stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """
+        writes out the pending records with a single fsync
+        """
+        batch = []
+        try:
+            while True:
+                record = self.pending.popleft()
+                if type(record) is Snapshot:
+                    # what came before is in the snapshot
+                    batch = []
+                    self.rewrite(record)
+                    self.compactions += 1
+                else:
+                    batch.append(record)
+        except IndexError:
+            pass
+        if not batch:
+            return
+        start = time.perf_counter()
+        self.file.write(b"".join(batch))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        metrics.JOURNAL_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        self.fsyncs += 1
+        self.records += len(batch)
+
+    def close(self):
+        """
+        writes what is pending and stops recording, the matches still open
+        stay in the log for the next run
+        """
+        # before the thread stops, so nothing is recorded after its last flush
+        self.numbers.clear()
+        self.matches.clear()
+        self.stopping.set()
+        if self.writer is not None:
+            self.writer.join()
+            self.file.close()
+            self.writer = None
+        if self.lock_file is not None:
+            # the next process can have it
+            self.lock_file.close()
+            self.lock_file = None
+
+
+def from_env():
+    """
+    a Journal writing to JOURNAL_PATH, with the worker id appended when
+    there are several workers, or None when JOURNAL_PATH isn't set
+
+    called in the worker process, once its id is known
+    """
+    path = os.environ.get("JOURNAL_PATH")
+    if not path:
+        return None
+    if workers.WORKER_COUNT > 1:
+        path = f"{path}.{workers.WORKER_ID}"
+    return Journal(path)
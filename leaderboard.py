@@ -0,0 +1,154 @@
+"""
+players ranked by rating, kept up to date one rating change at a time
+
+players are ranked on their rating rounded to a whole point, ties sharing a
+rank. each rounded rating is a bucket holding its players, and a Fenwick
+tree (binary indexed tree) over the buckets, highest rating first, counts
+the players in them. so
+
+    rank of a player:  1 + players in the buckets above, a prefix sum
+    top N from rank r: the bucket holding the r-th player, found by
+                       descending the tree, then the buckets after it
+    rating change:     a count moved from one bucket to another
+
+each a handful of steps through a tree of SIZE counters, O(log SIZE),
+however many players there are. ratings are clamped to [0, SIZE) for
+bucketing, nobody gets anywhere near either end with Elo
+"""
+
+import itertools
+
+__all__ = ["Leaderboard", "Fenwick", "SIZE"]
+
+# rating buckets, one per point
+SIZE = 4096
+
+
+class Fenwick:
+    """
+    counts at positions 0..size-1 with O(log size) updates, prefix sums and
+    search by prefix sum
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # tree[i] holds the sum of counts over (i - lowbit(i), i], 1-indexed
+        self.tree = [0] * (size + 1)
+        # highest power of two <= size, where search() starts descending
+        self.top_bit = 1 << (size.bit_length() - 1)
+
+    def add(self, position, delta):
+        index = position + 1
+        tree = self.tree
+        while index <= self.size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix(self, position) -> int:
+        """
+        sum of the counts at positions 0..position-1
+        """
+        total = 0
+        index = position
+        tree = self.tree
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, count) -> int:
+        """
+        the smallest position whose prefix sum through it is >= count,
+        `size` if the total is less than count
+        """
+        index = 0
+        bit = self.top_bit
+        tree = self.tree
+        while bit:
+            following = index + bit
+            if following <= self.size and tree[following] < count:
+                index = following
+                count -= tree[following]
+            bit >>= 1
+        return index
+
+
+class Leaderboard:
+    def __init__(self):
+        # position in the tree of each bucket: the highest rating first
+        self.counts = Fenwick(SIZE)
+        # { position : { player id : rating } } for non empty buckets
+        self.buckets = {}
+        # { player id : position }
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    @staticmethod
+    def position_of(rating) -> int:
+        return SIZE - 1 - min(max(int(rating + 0.5), 0), SIZE - 1)
+
+    def update(self, player_id, rating):
+        """
+        sets a player's rating, adding them if they weren't ranked
+        """
+        position = self.position_of(rating)
+        previous = self.positions.get(player_id)
+        if previous is not None:
+            bucket = self.buckets[previous]
+            if previous == position:
+                bucket[player_id] = rating
+                return
+            del bucket[player_id]
+            if not bucket:
+                del self.buckets[previous]
+            self.counts.add(previous, -1)
+
+        self.positions[player_id] = position
+        self.buckets.setdefault(position, {})[player_id] = rating
+        self.counts.add(position, 1)
+
+    def remove(self, player_id):
+        position = self.positions.pop(player_id, None)
+        if position is None:
+            return
+        bucket = self.buckets[position]
+        del bucket[player_id]
+        if not bucket:
+            del self.buckets[position]
+        self.counts.add(position, -1)
+
+    def rank(self, player_id):
+        """
+        1 for the best rated players, None for someone not ranked
+        """
+        position = self.positions.get(player_id)
+        if position is None:
+            return None
+        return self.counts.prefix(position) + 1
+
+    def top(self, count, start=1):
+        """
+        up to `count` (rank, player id, rating) from rank `start` on, ties
+        in the order they reached their rating
+        """
+        entries = []
+        position = self.counts.search(start)
+        if position >= SIZE:
+            return entries
+        rank = self.counts.prefix(position) + 1
+        # the walk may start part way through the first bucket
+        skip = start - rank
+        while True:
+            bucket = self.buckets[position]
+            for player_id, rating in itertools.islice(bucket.items(), skip, skip + count - len(entries)):
+                entries.append((rank, player_id, rating))
+            if len(entries) == count:
+                return entries
+            # the next bucket's first player comes right after this one's last
+            rank += len(bucket)
+            skip = 0
+            position = self.counts.search(rank)
+            if position >= SIZE:
+                return entries
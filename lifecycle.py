@@ -0,0 +1,107 @@
+"""
+keeps the match registry from growing without bound
+
+every connection to a match (players and spectators) holds a reference on it,
+and the match is removed as soon as the last one is released
+
+a sweeper task also evicts matches that would otherwise stay resident while
+someone is still connected:
+    finished: the game is won or drawn and nothing happened for FINISHED_TTL
+    idle:     no move was played for IDLE_TTL, e.g. player 2 never joined
+              or someone walked away mid-game
+evicting a match closes whatever connections it still has
+
+evictions are counted by reason in `MatchLifecycle.evictions`, and in
+connect4_match_evictions_total on /metrics
+"""
+
+import asyncio
+import time
+from collections import Counter
+
+import metrics
+
+__all__ = ["MatchLifecycle", "IDLE_TTL", "FINISHED_TTL", "SWEEP_INTERVAL"]
+
+# seconds, see the module docstring
+IDLE_TTL = 30 * 60
+FINISHED_TTL = 60
+SWEEP_INTERVAL = 10
+
+# close code sent to connections of an evicted match: "Going Away"
+EVICTED_CLOSE_CODE = 1001
+
+
+class MatchLifecycle:
+    def __init__(self, registry, idle_ttl=IDLE_TTL, finished_ttl=FINISHED_TTL, clock=time.monotonic):
+        self.registry = registry
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        # swappable so simulations can run faster than real time
+        self.clock = clock
+        # { reason : number of matches evicted for it }
+        self.evictions = Counter()
+
+    def acquire(self, match):
+        """
+        a player or spectator connected to the match
+        """
+        match.refs += 1
+        self.touch(match)
+
+    async def release(self, match):
+        """
+        a player or spectator left the match, removes it after the last one
+        """
+        match.refs -= 1
+        if match.refs <= 0:
+            await self.evict(match, reason="abandoned")
+
+    def touch(self, match):
+        """
+        records activity on the match, resetting its idle timer
+        """
+        match.last_active = self.clock()
+
+    async def evict(self, match, reason):
+        if match.closed:
+            return
+        match.closed = True
+        self.evictions[reason] += 1
+        metrics.MATCH_EVICTIONS.inc(reason)
+
+        await self.registry.remove(match)
+
+        connections = [outbox.websocket for outbox in match.players] + list(match.audience)
+        for outbox in match.players:
+            outbox.close()
+        match.audience.close()
+        if connections:
+            await asyncio.gather(
+                *(websocket.close(EVICTED_CLOSE_CODE, "match ended") for websocket in connections),
+                return_exceptions=True,
+            )
+
+    async def sweep(self):
+        """
+        evicts finished and idle matches, returns how many
+        """
+        now = self.clock()
+        expired = []
+        for match in self.registry:
+            idle_for = now - match.last_active
+            if match.game.finished and idle_for > self.finished_ttl:
+                expired.append((match, "finished"))
+            elif idle_for > self.idle_ttl:
+                expired.append((match, "idle"))
+        for match, reason in expired:
+            await self.evict(match, reason=reason)
+        return len(expired)
+
+    async def run(self, interval=SWEEP_INTERVAL):
+        """
+        sweeper task, runs until cancelled
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.sweep()
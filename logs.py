@@ -0,0 +1,160 @@
+"""
+structured logging that never blocks the event loop
+
+`event(name, **fields)` logs one JSON line, e.g.
+    {"time": 1760781358.2, "level": "info", "event": "game_created", "join": "AbC", "watch": "AdE"}
+
+field names can't be LogRecord attributes ("message", "args", "name"...)
+
+the record only goes on a bounded queue from the event loop. formatting and
+writing to stdout happen on a listener thread, so a slow log pipe delays the
+log lines and not the matches. when the queue is full, lines are dropped
+and counted in `DROPPED`, a logger must not become a way to stall the server
+
+noisy events can be sampled: LOG_SAMPLE="init_received=0.1,other=0.5" keeps
+that fraction of them. spectator messages are also rate limited per
+connection with a throttle.TokenBucket, see `SpectatorChatter`
+
+`start()` starts the listener and puts the queue on the root logger, so the
+warnings and errors of websockets, asyncio and other libraries come out as
+JSON lines too, with the name of their logger in "logger". before that
+(e.g. in benchmarks) records go to whatever the root logger has
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+import throttle
+
+__all__ = ["event", "start", "SpectatorChatter", "DROPPED"]
+
+LOGGER = logging.getLogger("connect4")
+LOGGER.setLevel(logging.INFO)
+
+# records waiting for the listener thread
+QUEUE_SIZE = 10_000
+
+# spectator messages logged per connection: per second, and in a burst
+CHATTER_RATE = 1.0
+CHATTER_BURST = 5
+
+# fields every record has, anything else in a record's __dict__ is ours
+RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(spec):
+    """
+    { event name : fraction kept } from "name=rate,name=rate"
+    """
+    rates = {}
+    for item in filter(None, spec.split(",")):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(os.environ.get("LOG_SAMPLE", ""))
+
+# records dropped because the queue was full
+DROPPED = 0
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        line = {
+            "time": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        if record.name != LOGGER.name:
+            line["logger"] = record.name
+        for key, value in vars(record).items():
+            if key not in RESERVED:
+                line[key] = value
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking or raising when the
+    queue is full, and leaves formatting to the listener thread
+    """
+
+    def prepare(self, record):
+        # fields are plain values, the record can cross threads as it is
+        return record
+
+    def enqueue(self, record):
+        global DROPPED
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED += 1
+
+
+class Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # stop() waits for room instead of failing on a full queue, the
+        # thread is still draining it
+        self.queue.put(self._sentinel)
+
+
+def event(name, level=logging.INFO, **fields):
+    """
+    logs an event with the given fields, subject to LOG_SAMPLE
+    """
+    rate = SAMPLE_RATES.get(name)
+    if rate is not None and random.random() >= rate:
+        return
+    if LOGGER.isEnabledFor(level):
+        LOGGER.log(level, name, extra=fields)
+
+
+def start(stream=None, queue_size=QUEUE_SIZE):
+    """
+    sends every log record, the server's and the libraries', through a queue
+    to a listener thread writing JSON lines to `stream` (stdout by default)
+
+    returns the QueueListener, stop() it to flush what is left
+    """
+    records = queue.Queue(queue_size)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JSONFormatter())
+    listener = Listener(records, output)
+
+    # the server's events reach the queue through the root logger, like
+    # the rest, so each record is written once
+    logging.getLogger().handlers[:] = [DroppingQueueHandler(records)]
+    LOGGER.handlers.clear()
+    LOGGER.propagate = True
+    listener.start()
+    return listener
+
+
+class SpectatorChatter:
+    """
+    rate limited logging of what one spectator sends, which the server
+    otherwise ignores. dropped messages are counted in the next line logged
+    """
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self.bucket = throttle.TokenBucket(CHATTER_RATE, CHATTER_BURST)
+        self.suppressed = 0
+
+    def log(self, message):
+        if not self.bucket.take():
+            self.suppressed += 1
+            return
+        # a spectator could send anything, only so much of it is logged
+        if isinstance(message, bytes):
+            message = message[:64].hex()
+        event("spectator_message", text=message[:200], suppressed=self.suppressed, **self.fields)
+        self.suppressed = 0
@@ -1,4 +1,12 @@
-import { createBoard, playMove } from "./connect4.js";
+import {
+  BINARY_PROTOCOL,
+  JSON_PROTOCOL,
+  createBoard,
+  decodeEvent,
+  encodeInit,
+  encodePlay,
+  playMove,
+} from "./connect4.js";
 
 function getWebSocketServer() {
   if (window.location.host === "fkbad.github.io") {
@@ -17,10 +25,8 @@ window.addEventListener("DOMContentLoaded", () => {
   createBoard(board);
 
   // Open the WebSocket connection and register event handlers.
-  // port specified in main() of `app.py`
-  const websocket_address = getWebSocketServer()
-  console.log("webocket address calculated as:", websocket_address)
-  const websocket = new WebSocket(websocket_address);
+  const watching = new URLSearchParams(window.location.search).has("watch")
+  const websocket = openWebSocket(watching);
 
 
   //information gathering for getting reload button to work:
@@ -38,13 +44,37 @@ window.addEventListener("DOMContentLoaded", () => {
   // we can now start listening to clicks
 
   // think of it as sendMoves from browser
-  sendMoves(board, websocket);
+  sendMoves(board);
 
   // set up listener for messages being send from the website
   // think of it as recieveMoves from browser
   recieveMessages(board,websocket)
 });
 
+// the connection moves are sent on, replaced by a new one when resuming
+// after the connection dropped
+let current_websocket = null;
+
+// what it takes to resume: the seat and its token from the "init" event,
+// or the watch key of a spectator, and the number of the last event of the
+// match received (null when the server didn't say), see history.py
+const seat = { join: null, player: null, token: null, watch: null, seq: 0 };
+let game_over = false;
+// set while waiting to hear whether the server took us back
+let resuming = false;
+
+function openWebSocket(watching) {
+  // port specified in main() of `app.py`
+  // spectators connect to /watch, where the server compresses frames
+  const websocket_address = getWebSocketServer() + (watching ? "watch" : "")
+  console.log("webocket address calculated as:", websocket_address)
+  // ask for the compact binary protocol, servers without it answer in JSON
+  const websocket = new WebSocket(websocket_address, [BINARY_PROTOCOL, JSON_PROTOCOL]);
+  websocket.binaryType = "arraybuffer";
+  current_websocket = websocket;
+  return websocket;
+}
+
 function initGame(websocket) {
 
   //function to start a game upon the initialization of a websocket
@@ -61,6 +91,8 @@ function initGame(websocket) {
     // has separate method to check whether or not a field is in the URL
     const join_key = url_params.get("join")
     const watch_key = url_params.get("watch")
+    const computer = url_params.get("computer")
+    const quick = url_params.get("quick")
     if (join_key) {
       console.log("wow I have join field!")
     }
@@ -80,21 +112,61 @@ function initGame(websocket) {
 
       // add the join field to the event if we havea key
       event.join = join_key
+      // coming back after a server restart, ask for the same seat
+      if (url_params.get("player")) {
+        event.player = url_params.get("player")
+      }
     } else if (watch_key) {
       // tell the server that I have someone watching with this watch key
       event.watch = watch_key
+      seat.watch = watch_key
+    } else if (computer) {
+      // play against the server's solver instead of a second player
+      event.computer = true
+    } else if (quick) {
+      // wait for the server to pair us with someone, the init event comes
+      // back once it has
+      event.quick = true
     }
     else  { // link is just root
       // create new game
     }
+    if (!watch_key) {
+      // players are rated, see ratings.py
+      Object.assign(event, playerIdentity(url_params))
+    }
     // send init message with join key filled in when necessary
-    const jsoned_event = JSON.stringify(event)
-    websocket.send(jsoned_event)
+    // the binary init has no room for a player or a player_id, JSON is
+    // always understood
+    if (websocket.protocol === BINARY_PROTOCOL && !event.player && !event.player_id) {
+      websocket.send(encodeInit(event))
+    } else {
+      const jsoned_event = JSON.stringify(event)
+      websocket.send(jsoned_event)
+    }
   });
 }
+// the id this browser plays under, made up on its first game and kept in
+// localStorage, and the name shown on the leaderboard, set with ?name=
+function playerIdentity(url_params) {
+  let player_id = window.localStorage.getItem("player_id")
+  if (!player_id) {
+    player_id = window.crypto.randomUUID()
+    window.localStorage.setItem("player_id", player_id)
+  }
+  if (url_params.get("name")) {
+    window.localStorage.setItem("name", url_params.get("name"))
+  }
+  const identity = { player_id: player_id }
+  if (window.localStorage.getItem("name")) {
+    identity.name = window.localStorage.getItem("name")
+  }
+  return identity
+}
+
 // function to listen for clicks and send move information when 
 // a click is on a column
-function sendMoves(board, websocket) {
+function sendMoves(board) {
   // When clicking a column, send a "play" event for a move in that column.
   board.addEventListener("click", ({ target }) => {
     const column = target.dataset.column;
@@ -106,8 +178,14 @@ function sendMoves(board, websocket) {
       type: "play",
       column: parseInt(column, 10),
     };
-    // send personally formatted JSON to server
-    websocket.send(JSON.stringify(event));
+    const websocket = current_websocket;
+    if (websocket.protocol === BINARY_PROTOCOL) {
+      // a single byte, see wire.py
+      websocket.send(encodePlay(event.column));
+    } else {
+      // send personally formatted JSON to server
+      websocket.send(JSON.stringify(event));
+    }
   });
 }
 
@@ -124,8 +202,17 @@ function showMessage(message) {
 // the event listener in here will get that message and process it
 function recieveMessages(board, websocket) {
   websocket.addEventListener("message", ({ data }) => {
-    const event = JSON.parse(data);
+    if (websocket !== current_websocket) {
+      // left behind for a new connection
+      return;
+    }
+    // JSON text frames, or binary frames with the binary protocol
+    const event = decodeEvent(data);
     console.log(event)
+    if (resuming && event.type !== "error") {
+      resuming = false;
+      resume_attempts = 0;
+    }
     switch (event.type) {
       case "init":
         // receiving init from the player/browser
@@ -137,27 +224,162 @@ function recieveMessages(board, websocket) {
         // adds the link with the join code appened to the join button
         document.querySelector(".join").href = "?join=" + event.join;
         document.querySelector(".watch").href = "?watch=" + event.watch;
+        if (event.token) {
+          // our seat, to take back if the connection drops
+          Object.assign(seat, { join: event.join, player: event.player, token: event.token });
+        }
 
         // break added because switch cases are fun :)
         break;
 
       case "play":
+        if (!inSequence(board, event)) {
+          break;
+        }
         // Update the UI with the move.
         playMove(board, event.player, event.column, event.row);
+        countEvent(event);
+        break;
+
+      case "state":
+        // full board sent once to anyone joining after moves were made,
+        // or in place of moves that piled up on a slow connection
+        // event.moves is a list of [player, column, row]
+        // so start from an empty board and redraw everything
+        for (const cell of board.querySelectorAll(".cell")) {
+          cell.className = "cell empty";
+        }
+        for (const [player, column, row] of event.moves) {
+          playMove(board, player, column, row);
+        }
+        if (event.winner) {
+          showMessage(`Player ${event.winner} wins!`);
+        }
+        seat.seq = event.seq ?? null;
         break;
 
       case "win":
+        if (!inSequence(board, event)) {
+          break;
+        }
+        countEvent(event);
+        game_over = true;
         showMessage(`Player ${event.player} wins!`);
         // No further messages are expected; close the WebSocket connection.
         websocket.close(1000);
         break;
 
       case "error":
+        if (resuming) {
+          // the seat is gone, e.g. the server restarted: ask for it by
+          // colour, as after a "reconnect" event
+          resuming = false;
+          reconnect(seat.watch ? { watch: seat.watch } : { join: seat.join, player: seat.player });
+          break;
+        }
         showMessage(event.message);
         break;
 
+      case "rating": {
+        // sent just before the "win" event of a rated game
+        const sign = event.change < 0 ? "" : "+";
+        document.querySelector(".rating").textContent =
+          `Rating ${event.rating} (${sign}${event.change}), rank ${event.rank}`;
+        break;
+      }
+
+      case "reconnect":
+        // the server is restarting, come back to the same match once the
+        // next one is up
+        reconnect(event);
+        break;
+
       default:
         throw new Error(`Unsupported event type: ${event.type}.`);
     }
   });
+
+  // closed without a "reconnect" event first, e.g. while following a match
+  // hosted on another server
+  // a dropped connection (flaky network, phone switching networks) is
+  // resumed in place, the server sends only the events we missed
+  websocket.addEventListener("close", ({ code }) => {
+    if (code === RESTART_CLOSE_CODE) {
+      reconnect({});
+    } else if (
+      code === ABNORMAL_CLOSE_CODE && (seat.token || seat.watch) && !game_over &&
+      websocket === current_websocket && resume_attempts < RESUME_ATTEMPTS
+    ) {
+      resume_attempts += 1;
+      window.setTimeout(() => resume(board), 1000 * resume_attempts);
+    }
+  });
+}
+
+// close code the browser reports for a connection lost without a close frame
+const ABNORMAL_CLOSE_CODE = 1006;
+// attempts at resuming, a second more apart each time, the server keeps
+// the seat for a minute (RESUME_GRACE)
+const RESUME_ATTEMPTS = 10;
+let resume_attempts = 0;
+
+function resume(board) {
+  const websocket = openWebSocket(seat.watch !== null);
+  websocket.addEventListener("open", () => {
+    resuming = true;
+    const event = seat.watch
+      ? { type: "init", watch: seat.watch, since: seat.seq }
+      : { type: "init", join: seat.join, token: seat.token, seq: seat.seq };
+    websocket.send(JSON.stringify(event));
+  });
+  recieveMessages(board, websocket);
+}
+
+// whether a "play" or "win" event is the one after the last we got. one we
+// already have is ignored, and after a gap (events lost on the way from
+// another server) we connect again asking for the ones we missed
+function inSequence(board, event) {
+  if (event.seq === undefined || seat.seq === null || event.seq === seat.seq + 1) {
+    return true;
+  }
+  if (event.seq <= seat.seq) {
+    return false;
+  }
+  if (!seat.token && !seat.watch) {
+    // nowhere to ask, take it anyway
+    return true;
+  }
+  const websocket = current_websocket;
+  resume(board);
+  websocket.close(1000);
+  return false;
+}
+
+// binary frames have no number, each one is the next
+function countEvent(event) {
+  seat.seq = event.seq ?? (seat.seq === null ? null : seat.seq + 1);
+}
+
+// close code of a server shutting down, see drain() in app.py
+const RESTART_CLOSE_CODE = 1012;
+let reconnecting = false;
+
+// reloads the page with the keys from a "reconnect" event, after a random
+// delay so everyone doesn't hit the new server at once
+function reconnect(event) {
+  if (reconnecting) {
+    return;
+  }
+  reconnecting = true;
+  const params = new URLSearchParams(window.location.search);
+  if (event.join) {
+    params.set("join", event.join);
+    params.set("player", event.player);
+  } else if (event.watch) {
+    params.set("watch", event.watch);
+  }
+  const delay = 1000 + Math.random() * 2000;
+  window.setTimeout(() => {
+    window.location.search = params.toString();
+  }, delay);
 }
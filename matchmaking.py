@@ -0,0 +1,228 @@
+"""
+quick play: players waiting to be paired with someone of about their rating
+
+waiting players are kept in buckets of BUCKET_WIDTH rating points, each an
+OrderedDict of tickets in the order they arrived, and the numbers of the
+buckets with someone in them are kept in a sorted list. looking for an
+opponent bisects that list for the buckets within the player's window and
+takes the oldest ticket of the closest one, it never looks at the other
+players waiting. there are a few hundred buckets at most, so the sorted list
+stays small whatever the number of players
+
+a player accepts opponents up to INITIAL_WINDOW rating points away, widening
+by WINDOW_STEP every STEP_SECONDS they wait, up to MAX_WINDOW. a newcomer
+looks for an opponent right away. everyone waiting looks again each time
+their window widens: a heap ordered by when that happens has one entry per
+waiting player, and `widen()` (run by the `run()` task) pops those that are
+due. the one looking decides, someone who waited long enough to have a wide
+window takes a newcomer whose own window is narrower
+
+enqueue, cancel and each search cost O(log n) with n players waiting.
+tickets cancelled or paired are left in the heap and skipped when they come
+up
+
+the two players' `found` futures are resolved with the same Pairing, the
+one who waited longer first. its `match` future is for the players to hand
+over whatever they set up for the game, the queue doesn't use it
+"""
+
+import asyncio
+import bisect
+import collections
+import heapq
+import time
+
+import metrics
+
+__all__ = [
+    "Queue",
+    "Ticket",
+    "Pairing",
+    "DEFAULT_RATING",
+    "INITIAL_WINDOW",
+    "WINDOW_STEP",
+    "MAX_WINDOW",
+    "STEP_SECONDS",
+]
+
+# rating of players who don't have one
+DEFAULT_RATING = 1500
+
+# rating points per bucket
+BUCKET_WIDTH = 25
+
+# rating points between opponents: at first, added every STEP_SECONDS
+# waited, and at most
+INITIAL_WINDOW = 50
+WINDOW_STEP = 50
+MAX_WINDOW = 400
+STEP_SECONDS = 1.0
+
+
+Pairing = collections.namedtuple("Pairing", ["first", "second", "match"])
+
+
+class Ticket:
+    """
+    a player waiting in the queue
+    """
+
+    __slots__ = ["player", "rating", "since", "bucket", "found"]
+
+    def __init__(self, player, rating, since, found):
+        # whatever was queued, e.g. the player's connection
+        self.player = player
+        self.rating = rating
+        self.since = since
+        # number of the bucket it waits in, None once it stopped waiting
+        self.bucket = None
+        # resolved with a Pairing
+        self.found = found
+
+
+class Queue:
+    def __init__(
+        self,
+        initial_window=INITIAL_WINDOW,
+        window_step=WINDOW_STEP,
+        max_window=MAX_WINDOW,
+        step_seconds=STEP_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.initial_window = initial_window
+        self.window_step = window_step
+        self.max_window = max_window
+        self.step_seconds = step_seconds
+        # swappable so simulations can run faster than real time
+        self.clock = clock
+        # { bucket number : OrderedDict { Ticket : None } }, only non empty
+        # buckets, and their numbers in order
+        self.buckets = {}
+        self.filled = []
+        # (time the window widens, sequence number, Ticket)
+        self.heap = []
+        self.sequence = 0
+        self.waiting = 0
+        self.pairings = 0
+
+    def __len__(self):
+        return self.waiting
+
+    def window(self, ticket, now):
+        steps = int((now - ticket.since) / self.step_seconds)
+        return min(self.initial_window + steps * self.window_step, self.max_window)
+
+    def enqueue(self, player, rating=DEFAULT_RATING) -> Ticket:
+        """
+        queues a player, who may be paired right away
+        """
+        now = self.clock()
+        ticket = Ticket(player, rating, now, asyncio.get_running_loop().create_future())
+        opponent = self.find(ticket, self.initial_window)
+        if opponent is not None:
+            self.pair(opponent, ticket, now)
+            return ticket
+
+        number = int(rating // BUCKET_WIDTH)
+        bucket = self.buckets.get(number)
+        if bucket is None:
+            bucket = self.buckets[number] = collections.OrderedDict()
+            bisect.insort(self.filled, number)
+        bucket[ticket] = None
+        ticket.bucket = number
+        self.waiting += 1
+        self.schedule(ticket, now)
+        return ticket
+
+    def cancel(self, ticket):
+        """
+        takes a player out of the queue, e.g. when they leave. does nothing
+        if they were paired already
+        """
+        if ticket.bucket is None:
+            return
+        bucket = self.buckets[ticket.bucket]
+        del bucket[ticket]
+        if not bucket:
+            del self.buckets[ticket.bucket]
+            del self.filled[bisect.bisect_left(self.filled, ticket.bucket)]
+        ticket.bucket = None
+        self.waiting -= 1
+
+    def clear(self):
+        """
+        empties the queue, returns the tickets of everyone who was waiting
+        """
+        tickets = [ticket for bucket in self.buckets.values() for ticket in bucket]
+        for ticket in tickets:
+            ticket.bucket = None
+        self.buckets.clear()
+        self.filled.clear()
+        self.heap.clear()
+        self.waiting = 0
+        return tickets
+
+    def schedule(self, ticket, now):
+        self.sequence += 1
+        heapq.heappush(self.heap, (now + self.step_seconds, self.sequence, ticket))
+
+    def find(self, ticket, window):
+        """
+        the longest waiting player of the bucket closest to `ticket`'s
+        rating within `window`, or None
+        """
+        rating = ticket.rating
+        low = bisect.bisect_left(self.filled, int((rating - window) // BUCKET_WIDTH))
+        high = bisect.bisect_right(self.filled, int((rating + window) // BUCKET_WIDTH))
+        best, best_gap = None, window
+        for number in self.filled[low:high]:
+            candidates = iter(self.buckets[number])
+            candidate = next(candidates)
+            if candidate is ticket:
+                candidate = next(candidates, None)
+                if candidate is None:
+                    continue
+            # the bucket's range can stick out of the window
+            gap = abs(candidate.rating - rating)
+            if gap <= best_gap:
+                best, best_gap = candidate, gap
+        return best
+
+    def pair(self, first, second, now):
+        self.cancel(first)
+        self.cancel(second)
+        if second.since < first.since:
+            first, second = second, first
+        self.pairings += 1
+        metrics.QUICK_PLAY_WAIT_SECONDS.observe(now - first.since)
+        metrics.QUICK_PLAY_WAIT_SECONDS.observe(now - second.since)
+        pairing = Pairing(first, second, asyncio.get_running_loop().create_future())
+        first.found.set_result(pairing)
+        second.found.set_result(pairing)
+
+    def widen(self):
+        """
+        players whose window widened since the last call look for an
+        opponent again, returns how many were paired
+        """
+        now = self.clock()
+        paired = self.pairings
+        while self.heap and self.heap[0][0] <= now:
+            _, _, ticket = heapq.heappop(self.heap)
+            if ticket.bucket is None:
+                # paired or gone
+                continue
+            opponent = self.find(ticket, self.window(ticket, now))
+            if opponent is not None:
+                self.pair(ticket, opponent, now)
+            else:
+                self.schedule(ticket, now)
+        return self.pairings - paired
+
+    async def run(self):
+        """
+        widening task, runs until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.step_seconds / 2)
+            self.widen()
@@ -0,0 +1,228 @@
+"""
+counters, gauges and histograms about the server, served in the Prometheus
+text format on /metrics (see `process_request` in app.py)
+
+metrics are module level objects updated in place by the code they measure:
+a counter increment is a dict update and a histogram observation a bisect
+over a dozen buckets. timing something takes two perf_counter calls on top,
+together about as long as handing a frame to a few queues, so the move path
+only times one in SAMPLE_EVERY publishes and broadcasts. gauges that can be
+read off existing state (matches, spectators) take a function and are only
+computed when scraped
+"""
+
+import asyncio
+import bisect
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "render",
+    "watch_loop_lag",
+    "CONTENT_TYPE",
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# every metric, in the order they are rendered
+METRICS = []
+
+# seconds between two event loop lag measurements
+LAG_INTERVAL = 0.5
+
+# one in this many publishes and broadcasts is timed
+SAMPLE_EVERY = 16
+
+
+class Counter:
+    """
+    a count that only goes up, optionally split by the value of one label
+    """
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        # { label value (None without a label) : count }
+        self.values = {}
+        METRICS.append(self)
+
+    def inc(self, label_value=None, amount=1):
+        """
+        returns the new count
+        """
+        count = self.values[label_value] = self.values.get(label_value, 0) + amount
+        return count
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        if self.label is None:
+            yield f"{self.name} {self.values.get(None, 0)}"
+            return
+        for label_value, count in sorted(self.values.items()):
+            yield f'{self.name}{{{self.label}="{label_value}"}} {count}'
+
+
+class Gauge:
+    """
+    a value that goes up and down, either set or read from a function at
+    scrape time
+    """
+
+    def __init__(self, name, help, function=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.value = 0
+        METRICS.append(self)
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self):
+        value = self.function() if self.function is not None else self.value
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {value}"
+
+
+class Histogram:
+    """
+    distribution of observed values over fixed buckets
+    """
+
+    def __init__(self, name, help, buckets, sample_every=1):
+        self.name = name
+        self.help = help
+        self.sample_every = sample_every
+        self.skipped = 0
+        self.buckets = sorted(buckets)
+        # counts[i] is the number of values in (buckets[i-1], buckets[i]],
+        # the last one those above every bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        METRICS.append(self)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def sample(self) -> bool:
+        """
+        whether to time this occurrence, true once every `sample_every` calls
+        """
+        self.skipped += 1
+        if self.skipped < self.sample_every:
+            return False
+        self.skipped = 0
+        return True
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}} {cumulative}'
+        yield f"{self.name}_sum {self.sum:g}"
+        yield f"{self.name}_count {cumulative}"
+
+
+def render() -> str:
+    """
+    every metric in the Prometheus text exposition format
+    """
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+async def watch_loop_lag(interval=LAG_INTERVAL):
+    """
+    task observing how late the event loop wakes up from a sleep, which is
+    how long anything else ready to run had to wait. runs until cancelled
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+
+# seconds, from a cache hit to a slow send
+FAST_BUCKETS = [1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0]
+
+
+# the server's metrics
+
+ACTIVE_MATCHES = Gauge("connect4_active_matches", "matches hosted by this process")
+SPECTATORS = Gauge("connect4_spectators", "spectators connected to matches hosted by this process")
+MOVES = Counter("connect4_moves_total", "moves played")
+WINS = Counter("connect4_wins_total", "games won")
+ERRORS = Counter("connect4_errors_total", "error events sent to clients, by type", label="type")
+ENCODE_SECONDS = Histogram(
+    "connect4_encode_seconds",
+    "time spent encoding state events, play and win events are precomputed",
+    FAST_BUCKETS,
+)
+PUBLISH_SECONDS = Histogram(
+    "connect4_publish_seconds",
+    "time a move spends handing its event to the players' outboxes and the audience, sampled",
+    FAST_BUCKETS,
+    sample_every=SAMPLE_EVERY,
+)
+BROADCAST_SECONDS = Histogram(
+    "connect4_broadcast_seconds",
+    "time a spectator shard spends broadcasting a batch of frames, sampled",
+    FAST_BUCKETS,
+    sample_every=SAMPLE_EVERY,
+)
+REPLAY_BYTES = Histogram(
+    "connect4_replay_bytes",
+    "bytes replayed to late joiners and returning spectators, a state frame or the events they missed",
+    [0, 32, 64, 128, 256, 512, 1024],
+)
+LOG_LINES_DROPPED = Gauge(
+    "connect4_log_lines_dropped", "log lines dropped because the log queue was full"
+)
+JOURNAL_FLUSH_SECONDS = Histogram(
+    "connect4_journal_flush_seconds",
+    "time the journal's writer thread takes to write and fsync a batch of records",
+    FAST_BUCKETS,
+)
+QUICK_PLAY_QUEUED = Gauge("connect4_quick_play_queued", "players waiting for a quick play opponent")
+QUICK_PLAY_WAIT_SECONDS = Histogram(
+    "connect4_quick_play_wait_seconds",
+    "time players waited in the quick play queue before being paired",
+    [0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0],
+)
+RATED_GAMES = Counter("connect4_rated_games_total", "games that changed their players' ratings")
+RATED_PLAYERS = Gauge("connect4_rated_players", "players on this process' leaderboard")
+RESUMES = Counter(
+    "connect4_resumes_total",
+    "players back after losing their connection, by what they were sent (delta or snapshot), or expired seats",
+    label="outcome",
+)
+SPECTATOR_REPLAYS = Counter(
+    "connect4_spectator_replays_total",
+    "spectators watching with since, by what they were sent (delta or snapshot)",
+    label="outcome",
+)
+SPECTATORS_SKIPPED = Counter(
+    "connect4_spectators_skipped_total", "spectators that fell too far behind and were skipped to a snapshot"
+)
+MATCH_EVICTIONS = Counter(
+    "connect4_match_evictions_total",
+    "matches removed from the registry, by reason (abandoned, finished or idle)",
+    label="reason",
+)
+SESSIONS = Gauge("connect4_sessions", "multiplexed session connections")
+SESSION_CHANNELS = Gauge("connect4_session_channels", "matches followed or played through multiplexed sessions")
+LOOP_LAG_SECONDS = Histogram(
+    "connect4_event_loop_lag_seconds", "delay of the event loop waking up from a sleep", FAST_BUCKETS
+)
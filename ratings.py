@@ -0,0 +1,203 @@
+"""
+Elo ratings of the players, updated after every game between two players
+who identified themselves, and the leaderboard ranking them
+
+players are known by the `player_id` they send in their init event, a
+random id main.js keeps in localStorage, and by an optional display name.
+the id is never shown to anyone else, the leaderboard lists names. a name
+sent by someone who hasn't played a rated game yet is kept aside, up to
+MAX_PENDING_NAMES of them, until they do
+
+everyone starts at INITIAL_RATING. after a game each player's rating moves
+by K_FACTOR * (score - expected score), the score being 1 for a win, 0.5
+for a draw and 0 for a loss, and the expected score 1 / (1 + 10 ** (gap /
+400)) where gap is the opponent's rating minus theirs
+
+with RATINGS_PATH set every change is appended to that file as a JSON line,
+and read back on startup: the last line of each player wins, and the file
+is rewritten with one line per player. lines are written as they come, a
+crash only loses what the OS hadn't written yet. as with the journal, the
+file is locked (a flock on RATINGS_PATH.lock) by the process using it, and
+a new process started while the old one drains waits for the lock before
+loading. results of games finished meanwhile are applied once it has
+"""
+
+import collections
+import fcntl
+import json
+import os
+
+import workers
+from leaderboard import Leaderboard
+
+__all__ = ["Ratings", "Player", "from_env", "INITIAL_RATING", "K_FACTOR"]
+
+INITIAL_RATING = 1500
+K_FACTOR = 32
+
+# longest player id and name taken from a client
+MAX_ID_SIZE = 64
+MAX_NAME_SIZE = 32
+# names kept for players who haven't been rated yet, the oldest dropped first
+MAX_PENDING_NAMES = 10_000
+
+
+class Player:
+    __slots__ = ["player_id", "name", "rating", "games"]
+
+    def __init__(self, player_id, name=None, rating=INITIAL_RATING, games=0):
+        self.player_id = player_id
+        self.name = name
+        self.rating = rating
+        self.games = games
+
+    def to_json(self):
+        return json.dumps(
+            {"id": self.player_id, "name": self.name, "rating": self.rating, "games": self.games}
+        )
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+class Ratings:
+    def __init__(self, path=None):
+        self.path = path
+        # { player id : Player }
+        self.players = {}
+        # { player id : name } of players not rated yet, oldest first
+        self.pending_names = collections.OrderedDict()
+        self.leaderboard = Leaderboard()
+        self.file = None
+        self.lock_file = None
+        # results waiting for the file to be loaded: (red id, yellow id, score)
+        self.waiting = None if path is None else []
+
+    def lock(self, blocking=True) -> bool:
+        """
+        takes the file's lock, waiting for whoever has it unless blocking is
+        False. returns whether the lock is held
+        """
+        if self.lock_file is None:
+            self.lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    def open(self):
+        """
+        loads the ratings left by the previous run, then applies the results
+        recorded since this one started
+        """
+        self.lock()
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        saved = json.loads(line)
+                    except ValueError:
+                        # cut short by a crash
+                        continue
+                    player = Player(saved["id"], saved["name"], saved["rating"], saved["games"])
+                    self.players[player.player_id] = player
+        except FileNotFoundError:
+            pass
+        # names sent while the file was loading win over the saved ones
+        for player_id in [player_id for player_id in self.pending_names if player_id in self.players]:
+            self.players[player_id].name = self.pending_names.pop(player_id)
+        for player in self.players.values():
+            self.leaderboard.update(player.player_id, player.rating)
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            file.writelines(player.to_json() + "\n" for player in self.players.values())
+        os.replace(temporary, self.path)
+        # a line per write, so the OS has each result as soon as it happens
+        self.file = open(self.path, "a", buffering=1)
+
+        waiting, self.waiting = self.waiting, None
+        for result in waiting:
+            self.record(*result)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def get(self, player_id) -> Player:
+        """
+        the player with this id, who may not have played yet
+        """
+        player = self.players.get(player_id)
+        if player is None:
+            player = Player(player_id, self.pending_names.get(player_id))
+        return player
+
+    def rating(self, player_id):
+        return self.get(player_id).rating
+
+    def rename(self, player_id, name):
+        player = self.players.get(player_id)
+        if player is None:
+            # kept until they are rated, see record
+            self.pending_names[player_id] = name
+            self.pending_names.move_to_end(player_id)
+            if len(self.pending_names) > MAX_PENDING_NAMES:
+                self.pending_names.popitem(last=False)
+            return
+        if player.name != name:
+            player.name = name
+            self.save(player)
+
+    def record(self, red_id, yellow_id, score):
+        """
+        updates both players' ratings after a game, score being red's: 1
+        if red won, 0.5 for a draw and 0 if yellow did
+
+        returns the change of each player's rating, red's first. both are 0
+        while the previous run's ratings haven't been loaded, they are
+        applied once they are
+        """
+        if self.waiting is not None:
+            self.waiting.append((red_id, yellow_id, score))
+            return 0.0, 0.0
+        red, yellow = self.get(red_id), self.get(yellow_id)
+        change = K_FACTOR * (score - expected_score(red.rating, yellow.rating))
+        for player, delta in ((red, change), (yellow, -change)):
+            player.rating += delta
+            player.games += 1
+            self.players[player.player_id] = player
+            self.pending_names.pop(player.player_id, None)
+            self.leaderboard.update(player.player_id, player.rating)
+            self.save(player)
+        return change, -change
+
+    def save(self, player):
+        if self.file is not None:
+            self.file.write(player.to_json() + "\n")
+
+    def top(self, count, start=1):
+        """
+        up to `count` (rank, Player) of the leaderboard from rank `start` on
+        """
+        return [(rank, self.players[player_id]) for rank, player_id, _ in self.leaderboard.top(count, start)]
+
+    def rank(self, player_id):
+        return self.leaderboard.rank(player_id)
+
+
+def from_env():
+    """
+    Ratings saved to RATINGS_PATH, with the worker id appended when there
+    are several workers, or only kept in memory when RATINGS_PATH isn't set
+    """
+    path = os.environ.get("RATINGS_PATH")
+    if path and workers.WORKER_COUNT > 1:
+        path = f"{path}.{workers.WORKER_ID}"
+    return Ratings(path or None)
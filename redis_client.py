@@ -0,0 +1,136 @@
+"""
+minimal asyncio client for Redis compatible stores, speaking RESP2
+
+only what the match registry needs: one command, or one pipelined batch of
+them, at a time on a connection, and a separate connection per pub/sub
+subscription. no third party client
+is required, and `fake_redis.py` can stand in for a real server
+"""
+
+import asyncio
+from urllib.parse import urlparse
+
+__all__ = ["RedisClient", "RedisError"]
+
+
+class RedisError(Exception):
+    """
+    error reply sent by the server
+    """
+
+
+def encode_command(args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by the server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"unexpected reply: {line!r}")
+
+
+class RedisClient:
+    """
+    a single connection, opened on first use
+
+    bulk replies come back as bytes, callers decode what they need
+    """
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.reader = self.writer = None
+        # commands are sent one at a time, replies come back in order
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command(["AUTH", self.password]))
+            await read_reply(reader)
+        return reader, writer
+
+    async def execute(self, *args):
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                self.reader, self.writer = await self.connect()
+            self.writer.write(encode_command(args))
+            return await read_reply(self.reader)
+
+    async def pipeline(self, commands):
+        """
+        sends several commands in one write and reads their replies, a single
+        round trip. an error reply is raised once every reply is read
+        """
+        async with self.lock:
+            if self.writer is None or self.writer.is_closing():
+                self.reader, self.writer = await self.connect()
+            self.writer.write(b"".join(encode_command(args) for args in commands))
+            replies = []
+            error = None
+            try:
+                for _ in commands:
+                    try:
+                        replies.append(await read_reply(self.reader))
+                    except RedisError as exc:
+                        replies.append(exc)
+                        error = error or exc
+            except (OSError, asyncio.IncompleteReadError):
+                # replies of this batch may still come, start over on a new
+                # connection
+                self.writer.close()
+                self.writer = None
+                raise
+            if error is not None:
+                raise error
+            return replies
+
+    async def subscribe(self, channel):
+        """
+        async generator of the messages published on a channel, on its own
+        connection which is closed when the generator is
+        """
+        reader, writer = await self.connect()
+        try:
+            writer.write(encode_command(["SUBSCRIBE", channel]))
+            # confirmation: ["subscribe", channel, count]
+            await read_reply(reader)
+            while True:
+                kind, _, message = await read_reply(reader)
+                if kind == b"message":
+                    yield message
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,327 @@
+"""
+where the server keeps track of its matches
+
+a Match is a single record holding both keys, the game and everyone connected
+to it. a MatchRegistry indexes matches by join key and by watch key
+
+    InMemoryMatchRegistry: two dicts, the default
+    RedisMatchRegistry:    also writes every match and move to a Redis
+                           compatible store and publishes moves on a pub/sub
+                           channel, so other hosts can follow a match (a
+                           restarted process gets its own matches back from
+                           the journal, see journal.py). picked when
+                           REDIS_URL is set
+
+registry methods are coroutines so any backend can do I/O, the in-memory
+one simply never waits
+"""
+
+import asyncio
+import collections
+import logging
+import os
+
+from connect4 import PLAYER2, Connect4, Moves
+from history import History
+from redis_client import RedisClient, RedisError
+import logs
+
+__all__ = ["Match", "MatchRegistry", "InMemoryMatchRegistry", "RedisMatchRegistry", "from_env"]
+
+# what a store that is down or misbehaving raises
+STORE_ERRORS = (OSError, RedisError, asyncio.IncompleteReadError, ValueError)
+# commands kept for the store while it can't be written to
+MAX_PENDING = 100_000
+# seconds the writer waits after a failed write, doubled after each one
+RETRY_DELAY = 0.1
+RETRY_DELAY_MAX = 5.0
+
+
+class Match:
+    """
+    one game and everyone connected to it
+    """
+
+    __slots__ = [
+        "join_key",
+        "watch_key",
+        "game",
+        "players",
+        "audience",
+        "local",
+        "computer",
+        "seats",
+        "player_ids",
+        "history",
+        "tokens",
+        "held",
+        "refs",
+        "last_active",
+        "closed",
+    ]
+
+    def __init__(self, join_key, watch_key, game, audience=None, local=True, computer=False):
+        self.join_key = join_key
+        self.watch_key = watch_key
+        self.game = game
+        # { Outbox of each connected player : the player it plays }
+        self.players = {}
+        # spectators.Audience, None for a match hosted somewhere else
+        self.audience = audience
+        # False for a match loaded from a shared store that this process
+        # doesn't host: it can be watched through pub/sub but not played
+        self.local = local
+        # True when player 2 is the solver, nobody else may join
+        self.computer = computer
+        # players nobody has taken yet, join() hands them out in order.
+        # the creator of a match plays red
+        self.seats = [] if computer else [PLAYER2]
+        # { player : the player_id they sent, see ratings.py }, games are
+        # rated when both players have one
+        self.player_ids = {}
+        # the numbered play and win events, the last few kept for players
+        # catching up after losing their connection
+        self.history = History()
+        # { player : token to take the seat back with, sent in their init }
+        # and { player : task keeping the seat of a player who dropped }
+        self.tokens = {}
+        self.held = {}
+        # bookkeeping of lifecycle.MatchLifecycle: connections holding the
+        # match, time of the last activity, and whether it was evicted
+        self.refs = 0
+        self.last_active = 0.0
+        self.closed = False
+
+
+class MatchRegistry:
+    """
+    interface of the match registries
+    """
+
+    async def add(self, match):
+        raise NotImplementedError
+
+    async def remove(self, match):
+        raise NotImplementedError
+
+    async def by_join_key(self, join_key):
+        """
+        returns the match with this join key, or None
+        """
+        raise NotImplementedError
+
+    async def by_watch_key(self, watch_key):
+        """
+        returns the match with this watch key, or None
+        """
+        raise NotImplementedError
+
+    async def record_move(self, match, frame):
+        """
+        called after every move with its encoded "play" event
+        """
+        raise NotImplementedError
+
+    async def record_win(self, match, frame):
+        """
+        called when the game ends with its encoded "win" event
+        """
+        raise NotImplementedError
+
+    async def follow(self, match):
+        """
+        async generator of the "play" and "win" events of a match hosted
+        somewhere else, for backends that can return such matches
+        """
+        raise NotImplementedError
+        yield
+
+    def __len__(self):
+        """
+        number of matches hosted by this process
+        """
+        raise NotImplementedError
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class InMemoryMatchRegistry(MatchRegistry):
+    def __init__(self):
+        self.join_index = {}
+        self.watch_index = {}
+        # journal.Journal recording the matches hosted here on disk, if any
+        self.journal = None
+
+    async def add(self, match):
+        self.join_index[match.join_key] = match
+        self.watch_index[match.watch_key] = match
+        if self.journal is not None:
+            self.journal.opened(match)
+
+    async def remove(self, match):
+        self.join_index.pop(match.join_key, None)
+        self.watch_index.pop(match.watch_key, None)
+        if self.journal is not None:
+            self.journal.closed(match)
+
+    async def by_join_key(self, join_key):
+        return self.join_index.get(join_key)
+
+    async def by_watch_key(self, watch_key):
+        return self.watch_index.get(watch_key)
+
+    async def record_move(self, match, frame):
+        if self.journal is not None:
+            self.journal.moved(match)
+
+    async def record_win(self, match, frame):
+        pass
+
+    def __len__(self):
+        return len(self.join_index)
+
+    def __iter__(self):
+        return iter(list(self.join_index.values()))
+
+
+class RedisMatchRegistry(InMemoryMatchRegistry):
+    """
+    matches hosted here are kept in memory as usual and mirrored to the store:
+
+        c4:match:{join_key}   hash with the watch key and the winner
+        c4:moves:{join_key}   the game's packed move log, one byte per move
+        c4:watch:{watch_key}  join key of the match
+        c4:events:{join_key}  pub/sub channel with every "play" and "win" event
+
+    new matches, moves, wins and removals are queued for a writer task that
+    sends all that is waiting in one pipelined round trip, as journal.py does
+    with its thread: a move never waits on the store. a store that is down
+    is logged instead of dropping the players, the writer waits a little
+    longer after each failure (up to RETRY_DELAY_MAX) and keeps at most
+    MAX_PENDING commands meanwhile, dropping the oldest. lookups of matches
+    hosted elsewhere find nothing while the store can't be reached
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        self.client = RedisClient(url)
+        # commands waiting for the writer task, in order
+        self.pending = collections.deque(maxlen=MAX_PENDING)
+        self.wakeup = asyncio.Event()
+        self.writer = None
+
+    def queue(self, *commands):
+        self.pending.extend(commands)
+        self.wakeup.set()
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(self.write_pending())
+
+    async def write_pending(self):
+        """
+        writer task
+        """
+        delay = 0
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            commands = list(self.pending)
+            self.pending.clear()
+            try:
+                await self.client.pipeline(commands)
+            except Exception as exc:
+                logs.event("store_write_failed", level=logging.WARNING, commands=len(commands), error=repr(exc))
+                delay = min(max(delay * 2, RETRY_DELAY), RETRY_DELAY_MAX)
+                await asyncio.sleep(delay)
+            else:
+                delay = 0
+
+    async def read(self, *args):
+        """
+        runs a command reading the store, None when it fails
+        """
+        try:
+            return await self.client.execute(*args)
+        except STORE_ERRORS as exc:
+            logs.event("store_read_failed", level=logging.WARNING, command=args[0], error=repr(exc))
+            return None
+
+    async def add(self, match):
+        await super().add(match)
+        self.queue(
+            ("HSET", f"c4:match:{match.join_key}", "watch", match.watch_key),
+            ("SET", f"c4:watch:{match.watch_key}", match.join_key),
+        )
+
+    async def remove(self, match):
+        await super().remove(match)
+        # queued after the match's last moves, which would create the keys again
+        self.queue((
+            "DEL",
+            f"c4:match:{match.join_key}",
+            f"c4:moves:{match.join_key}",
+            f"c4:watch:{match.watch_key}",
+        ))
+
+    async def by_join_key(self, join_key):
+        match = await super().by_join_key(join_key)
+        if match is None:
+            match = await self.load(join_key)
+        return match
+
+    async def by_watch_key(self, watch_key):
+        match = await super().by_watch_key(watch_key)
+        if match is None:
+            join_key = await self.read("GET", f"c4:watch:{watch_key}")
+            if join_key is not None:
+                match = await self.load(join_key.decode())
+        return match
+
+    async def load(self, join_key):
+        """
+        rebuilds a match hosted elsewhere from the store, or returns None
+        """
+        record = await self.read("HGETALL", f"c4:match:{join_key}")
+        if not record:
+            return None
+        record = dict(zip(record[::2], record[1::2]))
+        log = await self.read("GET", f"c4:moves:{join_key}") or b""
+        game = Connect4()
+        for player, column, _ in Moves(log):
+            game.play(player, column)
+        return Match(join_key, record[b"watch"].decode(), game, local=False)
+
+    async def record_move(self, match, frame):
+        await super().record_move(match, frame)
+        self.queue(
+            ("APPEND", f"c4:moves:{match.join_key}", match.game.log[-1:]),
+            ("PUBLISH", f"c4:events:{match.join_key}", frame),
+        )
+
+    async def record_win(self, match, frame):
+        self.queue(
+            ("HSET", f"c4:match:{match.join_key}", "winner", match.game.winner),
+            ("PUBLISH", f"c4:events:{match.join_key}", frame),
+        )
+
+    async def follow(self, match):
+        """
+        async generator of the events of a match hosted elsewhere, which
+        ends if the store goes away
+        """
+        try:
+            async for frame in self.client.subscribe(f"c4:events:{match.join_key}"):
+                yield frame.decode()
+        except STORE_ERRORS as exc:
+            logs.event("store_follow_failed", level=logging.WARNING, join=match.join_key, error=repr(exc))
+
+
+def from_env():
+    """
+    RedisMatchRegistry when REDIS_URL is set (as on heroku with a redis
+    add-on), InMemoryMatchRegistry otherwise
+    """
+    url = os.environ.get("REDIS_URL")
+    if url:
+        return RedisMatchRegistry(url)
+    return InMemoryMatchRegistry()
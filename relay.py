@@ -0,0 +1,180 @@
+"""
+forwarding of websocket connections between worker processes
+
+when a client reaches a worker that doesn't host its match, that worker
+opens a Unix socket to the owner and pipes frames both ways. on the owner's
+side the Unix socket is wrapped in a RelayedConnection, which offers the
+parts of the websocket connection API that handler() uses, so the match
+code treats it like any other client
+
+frames on the Unix socket are a 1 byte kind, a 4 byte big endian length
+and the payload. the owner always sends JSON events, the forwarding worker
+translates them for clients on the binary wire protocol. when the owner
+closes a connection it sends its close code and reason first, for the
+forwarding worker to close the client's with. an owner gone without
+saying is restarting, its clients are closed with RESTART_CLOSE_CODE
+"""
+
+import asyncio
+import collections
+import os
+import struct
+import tempfile
+
+import websockets
+
+import wire
+
+__all__ = ["RelayedConnection", "forward", "serve", "close", "socket_path", "FORWARDED"]
+
+TEXT, BINARY, CLOSE = b"t", b"b", b"c"
+HEADER = struct.Struct("!cI")
+CLOSE_CODE = struct.Struct("!H")
+
+# close code for clients whose match's worker went away: "Service Restart",
+# as when a server drains
+RESTART_CLOSE_CODE = 1012
+
+# what a CLOSE frame carries
+Closed = collections.namedtuple("Closed", ["code", "reason"])
+
+RELAY_DIR = os.environ.get("RELAY_DIR", tempfile.gettempdir())
+
+# client connections being piped to another worker, they end when that
+# worker closes its side
+FORWARDED = set()
+
+
+def socket_path(port, worker_id) -> str:
+    return os.path.join(RELAY_DIR, f"connect4-{port}-worker-{worker_id}.sock")
+
+
+def write_frame(writer, message):
+    if isinstance(message, str):
+        kind, payload = TEXT, message.encode()
+    else:
+        kind, payload = BINARY, bytes(message)
+    writer.write(HEADER.pack(kind, len(payload)) + payload)
+
+
+async def read_frame(reader):
+    """
+    returns the next message, a Closed if the other side is closing the
+    connection, or None once it has hung up
+    """
+    try:
+        kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+    if kind == CLOSE:
+        (code,) = CLOSE_CODE.unpack_from(payload)
+        return Closed(code, payload[CLOSE_CODE.size:].decode())
+    return payload.decode() if kind == TEXT else payload
+
+
+class RelayedConnection:
+    """
+    a client connected to another worker, seen from the worker hosting its match
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def recv(self):
+        message = await read_frame(self.reader)
+        if message is None or isinstance(message, Closed):
+            raise websockets.ConnectionClosedOK(None, None)
+        return message
+
+    async def __aiter__(self):
+        while (message := await read_frame(self.reader)) is not None and not isinstance(message, Closed):
+            yield message
+
+    async def send(self, message):
+        self.write(message)
+        await self.writer.drain()
+
+    def write(self, message):
+        """
+        queues a message without waiting, the counterpart of websockets.broadcast
+        """
+        if not self.writer.is_closing():
+            write_frame(self.writer, message)
+
+    async def close(self, code=1000, reason=""):
+        if not self.writer.is_closing():
+            payload = CLOSE_CODE.pack(code) + reason.encode()
+            self.writer.write(HEADER.pack(CLOSE, len(payload)) + payload)
+        self.writer.close()
+
+
+async def forward(websocket, port, worker_id, first_message):
+    """
+    pipes a client connection to the worker hosting its match until either
+    side closes
+    """
+    reader, writer = await asyncio.open_unix_connection(socket_path(port, worker_id))
+    # the owner reads the init message again to dispatch the connection
+    write_frame(writer, first_message)
+
+    async def upstream():
+        async for message in websocket:
+            write_frame(writer, message)
+            await writer.drain()
+
+    async def downstream():
+        """
+        returns how the owner closed the connection
+        """
+        while (message := await read_frame(reader)) is not None:
+            if isinstance(message, Closed):
+                return message
+            await websocket.send(wire.encode_for(websocket, message))
+        return Closed(RESTART_CLOSE_CODE, "server restarting")
+
+    sending, receiving = asyncio.create_task(upstream()), asyncio.create_task(downstream())
+    FORWARDED.add(websocket)
+    try:
+        await asyncio.wait((sending, receiving), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        FORWARDED.discard(websocket)
+        sending.cancel()
+        receiving.cancel()
+        writer.close()
+    if receiving.done() and not receiving.cancelled() and receiving.exception() is None:
+        await websocket.close(*receiving.result())
+    else:
+        # the client left, or its connection failed
+        await websocket.close()
+
+
+def serve(handler, port, worker_id):
+    """
+    starts this worker's relay server, await it to get the asyncio.Server
+    """
+    path = socket_path(port, worker_id)
+    if os.path.exists(path):
+        # left behind by a previous run
+        os.unlink(path)
+
+    async def serve_relayed(reader, writer):
+        try:
+            await handler(RelayedConnection(reader, writer))
+        finally:
+            writer.close()
+
+    return asyncio.start_unix_server(serve_relayed, path)
+
+
+def close(server, port, worker_id):
+    """
+    stops this worker's relay server and removes its socket file, which
+    asyncio leaves behind
+    """
+    server.close()
+    try:
+        os.unlink(socket_path(port, worker_id))
+    except FileNotFoundError:
+        pass
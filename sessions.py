@@ -0,0 +1,166 @@
+"""
+multiplexed sessions: many matches followed and played over one connection
+
+a client whose first message is {"type": "session"} keeps its connection for
+as many matches as it likes (up to MAX_CHANNELS), each under an id of its
+choosing sent as "match" on every message. every frame sent for a match
+carries the same "match" field, e.g.
+
+    {"match":"m2","type":"play","player":"red","column":3,"row":0}
+
+each match of a session is a Channel, which stands in for a websocket
+wherever the server deals with one: it is what goes in a match's Audience,
+and a player's Outbox writes to it. so broadcasting, replays, eviction and
+draining handle session clients without knowing about them. a frame is
+tagged by splicing the channel's '{"match":...,' prefix in place of the
+frame's opening brace, the cached frames of events.py are never parsed again
+
+a spectator channel costs a Channel object and a place in the audience,
+instead of a connection with its buffers, handler task and TCP socket
+"""
+
+import websockets
+
+import events
+
+__all__ = ["Session", "Channel", "tag", "valid_id", "MAX_CHANNELS", "MAX_ID_SIZE"]
+
+# matches a session may follow or play at once
+MAX_CHANNELS = 100
+
+# longest string id a client may give a match
+MAX_ID_SIZE = 64
+
+# a session may send as many messages as this many connections, see throttle.py
+THROTTLE_FACTOR = 10
+
+
+def valid_id(match_id) -> bool:
+    """
+    whether a client's match id is usable: a short string or an integer
+    """
+    if type(match_id) is int:
+        return True
+    return isinstance(match_id, str) and 0 < len(match_id) <= MAX_ID_SIZE
+
+
+def prefix_for(match_id) -> str:
+    return '{"match":' + events.dumps(match_id) + ","
+
+
+def tag(match_id, frame) -> str:
+    """
+    the JSON frame with the match id added as its first field
+    """
+    return prefix_for(match_id) + frame[1:]
+
+
+class Channel:
+    """
+    one match of a session, seen from the match as a connection
+
+    player is the seat the session plays in the match, None for a spectator
+    """
+
+    __slots__ = ["session", "match_id", "prefix", "match", "player", "outbox", "follower", "reply"]
+
+    def __init__(self, session, match_id):
+        self.session = session
+        self.match_id = match_id
+        self.prefix = prefix_for(match_id)
+        # set once the channel is added to the session
+        self.match = None
+        self.player = None
+        # fanout.Outbox of a player channel
+        self.outbox = None
+        # task relaying a match hosted somewhere else, see app.follow_remote
+        self.follower = None
+        # task playing the computer's move, see app.reply_as_computer
+        self.reply = None
+
+    def tag(self, frame) -> str:
+        return self.prefix + frame[1:]
+
+    async def send(self, frame):
+        await self.session.websocket.send(self.tag(frame))
+
+    def write(self, frame):
+        """
+        sends a frame without waiting, the counterpart of websockets.broadcast
+        """
+        websockets.broadcast([self.session.websocket], self.tag(frame))
+
+    async def close(self, code=1000, reason=""):
+        """
+        ends the channel as closing a connection would, telling the client
+        with a "closed" event. the session stays open
+        """
+        await self.session.leave(self, code, reason)
+
+
+class Session:
+    """
+    the channels of one multiplexed connection
+    """
+
+    def __init__(self, websocket, lifecycle):
+        self.websocket = websocket
+        # lifecycle.MatchLifecycle holding the matches the channels are on
+        self.lifecycle = lifecycle
+        # { match id : Channel }
+        self.channels = {}
+
+    def __len__(self):
+        return len(self.channels)
+
+    def add(self, channel, match, player=None, outbox=None):
+        """
+        puts a channel on a match: as the player's outbox if given, else in
+        its audience. a match hosted somewhere else only gets a follower task,
+        set by the caller
+        """
+        channel.match = match
+        channel.player = player
+        channel.outbox = outbox
+        self.channels[channel.match_id] = channel
+        if not match.local:
+            return
+        if outbox is not None:
+            match.players[outbox] = player
+        else:
+            match.audience.add(channel)
+        self.lifecycle.acquire(match)
+
+    async def leave(self, channel, code=None, reason=""):
+        """
+        takes a channel off its match, sending the client a "closed" event
+        when given a close code
+        """
+        if self.channels.get(channel.match_id) is not channel:
+            # left already
+            return
+        del self.channels[channel.match_id]
+        match = channel.match
+        if channel.follower is not None:
+            channel.follower.cancel()
+        if channel.reply is not None:
+            channel.reply.cancel()
+        if channel.outbox is not None:
+            channel.outbox.close()
+            match.players.pop(channel.outbox, None)
+        elif match.local:
+            match.audience.discard(channel)
+        if code is not None:
+            try:
+                await channel.send(events.encode_closed(code, reason))
+            except websockets.ConnectionClosed:
+                pass
+        if match.local:
+            await self.lifecycle.release(match)
+
+    async def close(self):
+        """
+        leaves every match, once the connection is gone
+        """
+        for channel in list(self.channels.values()):
+            await self.leave(channel)
@@ -0,0 +1,275 @@
+"""
+Connect4 solver for the computer opponent
+
+alpha-beta negamax over bitboards, in the style of Pascal Pons' solver:
+    - positions are two ints, the stones of the player to move and the mask
+      of all stones, in the same 8 bits per column layout as connect4.py
+    - a bounded transposition table keyed by `current + mask`, which is
+      unique for every position
+    - moves are ordered by how many winning cells they create, center first
+      on ties, with the best move of the previous iteration tried first
+    - iterative deepening, so the search can be stopped when its time budget
+      runs out and still answer with the best move of the last full depth
+
+below the depth limit positions are scored by a heuristic (open winning
+cells), so only scores beyond +/- WIN are exact results
+
+searches run in a process pool through `choose_move`, so they never block
+the event loop serving the other matches. the pool has SOLVER_PROCESSES
+processes (1 by default) per server worker, each with its own table of
+SOLVER_TABLE_SIZE entries
+"""
+
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+__all__ = ["Searcher", "best_move", "choose_move", "position_from_log", "TIME_BUDGET"]
+
+WIDTH, HEIGHT = 7, 6
+STRIDE = 8
+
+BOTTOM = sum(1 << (STRIDE * column) for column in range(WIDTH))
+BOARD = BOTTOM * ((1 << HEIGHT) - 1)
+COLUMN_MASKS = [((1 << HEIGHT) - 1) << (STRIDE * column) for column in range(WIDTH)]
+CENTER_FIRST = [3, 2, 4, 1, 5, 0, 6]
+
+# exact results score WIN + the number of moves left after the game ends,
+# so faster wins score higher. heuristic scores stay well below WIN
+WIN = 100
+
+# entries in the transposition table, ~100 bytes each once filled, so
+# about 25 MB for the default
+TABLE_SIZE = int(os.environ.get("SOLVER_TABLE_SIZE", str(1 << 18)))
+
+# processes searching at once, each holding a table
+PROCESSES = int(os.environ.get("SOLVER_PROCESSES", "1"))
+
+# seconds the computer spends on a move
+TIME_BUDGET = 1.0
+
+# nodes between two looks at the clock
+CLOCK_CHECK = 4096
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class Timeout(Exception):
+    pass
+
+
+def winning_cells(stones, mask):
+    """
+    empty cells that would complete a line of four for `stones`
+    """
+    # vertical
+    r = (stones << 1) & (stones << 2) & (stones << 3)
+    # horizontal, then both diagonals
+    for shift in (STRIDE, STRIDE - 1, STRIDE + 1):
+        p = (stones << shift) & (stones << 2 * shift)
+        r |= p & (stones << 3 * shift)
+        r |= p & (stones >> shift)
+        p = (stones >> shift) & (stones >> 2 * shift)
+        r |= p & (stones << shift)
+        r |= p & (stones >> 3 * shift)
+    return r & (BOARD ^ mask)
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+def position_from_log(log):
+    """
+    returns (current, mask, moves) for a Connect4 move log, current being the
+    stones of the player to move
+    """
+    stones = [0, 0]
+    for index, move in enumerate(log):
+        stones[index % 2] |= 1 << (STRIDE * (move >> 3) + (move & 7))
+    moves = len(log)
+    return stones[moves % 2], stones[0] | stones[1], moves
+
+
+class Searcher:
+    """
+    holds the transposition table and counters across searches
+    """
+
+    def __init__(self, table_size=TABLE_SIZE):
+        self.table_size = table_size
+        # always-replace: a colliding position evicts the previous entry
+        self.table = [None] * table_size
+        self.nodes = 0
+        self.deadline = None
+
+    def negamax(self, current, mask, moves, alpha, beta, depth):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % CLOCK_CHECK == 0:
+            if time.perf_counter() > self.deadline:
+                raise Timeout
+
+        possible = (mask + BOTTOM) & BOARD
+        if winning_cells(current, mask) & possible:
+            return WIN + (WIDTH * HEIGHT - moves - 1)
+        if moves >= WIDTH * HEIGHT - 1:
+            # the last move can't win, see above, so this is a draw
+            return 0
+
+        opponent = current ^ mask
+        threats = winning_cells(opponent, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                # two threats to block, the opponent wins next move
+                return -(WIN + (WIDTH * HEIGHT - moves - 2))
+            possible = forced
+        # never play right below a cell where the opponent would win
+        possible &= ~(threats >> 1)
+        if not possible:
+            return -(WIN + (WIDTH * HEIGHT - moves - 2))
+
+        if depth == 0:
+            return popcount(winning_cells(current, mask)) - popcount(threats)
+
+        key = current + mask
+        slot = key % self.table_size
+        entry = self.table[slot]
+        best_column = None
+        if entry is not None and entry[0] == key:
+            _, entry_depth, flag, value, best_column = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER and value >= beta:
+                    return value
+                if flag == UPPER and value <= alpha:
+                    return value
+
+        # order moves by the number of winning cells they leave us
+        candidates = []
+        for order, column in enumerate(CENTER_FIRST):
+            move = possible & COLUMN_MASKS[column]
+            if move:
+                priority = popcount(winning_cells(current | move, mask | move))
+                if column == best_column:
+                    priority = 1000
+                candidates.append((-priority, order, column, move))
+        candidates.sort()
+
+        original_alpha = alpha
+        best = -(WIN + WIDTH * HEIGHT)
+        for _, _, column, move in candidates:
+            score = -self.negamax(opponent, mask | move, moves + 1, -beta, -alpha, depth - 1)
+            if score > best:
+                best, best_column = score, column
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[slot] = (key, depth, flag, best, best_column)
+        return best
+
+    def search(self, current, mask, moves, budget=None, max_depth=None):
+        """
+        iterative deepening search of the position
+
+        returns (column, score, depth) for the last depth searched completely
+        """
+        self.deadline = time.perf_counter() + budget if budget else None
+        remaining = WIDTH * HEIGHT - moves
+        max_depth = min(max_depth or remaining, remaining)
+
+        key = current + mask
+        possible = (mask + BOTTOM) & BOARD
+        # fallback if not even depth 1 completes
+        column = next(c for c in CENTER_FIRST if possible & COLUMN_MASKS[c])
+        score, completed = 0, 0
+
+        # a move winning on the spot needs no search
+        wins = winning_cells(current, mask) & possible
+        if wins:
+            column = next(c for c in CENTER_FIRST if wins & COLUMN_MASKS[c])
+            return column, WIN + remaining - 1, 0
+
+        try:
+            for depth in range(1, max_depth + 1):
+                score = self.negamax(current, mask, moves, -(WIN + WIDTH * HEIGHT), WIN + WIDTH * HEIGHT, depth)
+                completed = depth
+                entry = self.table[key % self.table_size]
+                if entry is not None and entry[0] == key and entry[4] is not None:
+                    column = entry[4]
+                if abs(score) >= WIN:
+                    # the result is exact, searching deeper won't change it
+                    break
+        except Timeout:
+            pass
+        finally:
+            self.deadline = None
+        return column, score, completed
+
+
+# one searcher per pool process, so its table is reused between moves
+SEARCHER = None
+
+
+def best_move(log, budget=TIME_BUDGET):
+    """
+    column to play in the position reached by a Connect4 move log
+    """
+    global SEARCHER
+    if SEARCHER is None:
+        SEARCHER = Searcher()
+    column, _, _ = SEARCHER.search(*position_from_log(log), budget=budget)
+    return column
+
+
+POOL = None
+
+
+async def choose_move(game, budget=TIME_BUDGET, book=None):
+    """
+    returns a column for the game's position: straight from the opening
+    book if it has the position, else from a search in the process pool
+    """
+    if book is not None:
+        entry = book.lookup(*position_from_log(game.log)[:2])
+        if entry is not None:
+            return entry[0]
+
+    global POOL
+    if POOL is None:
+        # spawn rather than fork: the server process has sockets and tasks
+        # that the searchers have no business inheriting
+        POOL = ProcessPoolExecutor(max_workers=PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    # the pool starts its processes as searches are submitted
+    with as_main_module():
+        search = POOL.submit(best_move, bytes(game.log), budget)
+    return await asyncio.wrap_future(search)
+
+
+@contextlib.contextmanager
+def as_main_module():
+    """
+    makes this module __main__ while pool processes are started. a spawned
+    process imports the parent's main module again before anything else,
+    which would be all of app.py with its registry, ratings and book, where
+    a searcher only needs this module
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
@@ -0,0 +1,225 @@
+"""
+distribution of game events to spectators
+
+a match's spectators are split into shards of at most SHARD_SIZE sockets.
+publishing a frame only appends it to each shard's buffer and wakes the
+shard's background task, which broadcasts everything buffered to its sockets.
+the player's play() coroutine never loops over the audience itself
+
+with a flush interval, a shard task waits that long after waking up so
+several moves go out together, and with coalescing a batch of more than one
+frame is replaced by a single "state" snapshot
+
+a spectator that can't keep up, with more than LAG_LIMIT bytes of frames
+still waiting to be sent, stops getting frames: they would only pile up in
+its write buffer. once it has caught up it is sent the current snapshot and
+gets the frames that follow, like everyone else
+"""
+
+import asyncio
+import time
+
+import websockets
+
+import metrics
+import wire
+from relay import RelayedConnection
+from sessions import Channel
+
+__all__ = ["Audience", "SHARD_SIZE", "FLUSH_INTERVAL", "LAG_LIMIT"]
+
+# spectators handled by one background task
+SHARD_SIZE = 1000
+
+# seconds a shard waits to batch frames before broadcasting them
+# 0 means frames go out on the next turn of the event loop
+FLUSH_INTERVAL = 0.0
+
+# bytes waiting to be sent to a spectator before it is skipped, it is sent
+# a snapshot once less than half of that is left
+LAG_LIMIT = 64 * 1024
+
+# seconds between two checks of a shard's spectators for lag, a backlog
+# takes a while to build up and checking every socket on every batch
+# would cost as much as the broadcast
+LAG_CHECK_INTERVAL = 1.0
+
+
+def broadcast(connections, frame):
+    """
+    websockets.broadcast, extended to spectators relayed from another worker,
+    following the match from a multiplexed session, and speaking the binary
+    wire protocol
+    """
+    local, binary = [], []
+    for connection in connections:
+        if type(connection) is RelayedConnection or type(connection) is Channel:
+            connection.write(frame)
+        elif wire.is_binary(connection):
+            binary.append(connection)
+        else:
+            local.append(connection)
+    websockets.broadcast(local, frame)
+    if binary:
+        websockets.broadcast(binary, wire.to_binary(frame))
+
+
+def backlog(connection) -> int:
+    """
+    bytes written to a spectator that haven't gone out yet
+    """
+    if type(connection) is Channel:
+        connection = connection.session.websocket
+    elif type(connection) is RelayedConnection:
+        return connection.writer.transport.get_write_buffer_size()
+    transport = getattr(connection, "transport", None)
+    return 0 if transport is None else transport.get_write_buffer_size()
+
+
+class Shard:
+    """
+    a set of spectator sockets with its own buffer and broadcast task
+    """
+
+    def __init__(self, audience):
+        self.audience = audience
+        self.members = set()
+        # sockets that joined while frames were buffered: they already got a
+        # snapshot including those frames, so they only start with the next batch
+        self.newcomers = set()
+        # sockets too far behind to be sent frames, see LAG_LIMIT
+        self.lagging = set()
+        self.next_lag_check = 0.0
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def __len__(self):
+        return len(self.members) + len(self.newcomers) + len(self.lagging)
+
+    def add(self, websocket):
+        if self.pending:
+            self.newcomers.add(websocket)
+        else:
+            self.members.add(websocket)
+
+    def discard(self, websocket):
+        self.members.discard(websocket)
+        self.newcomers.discard(websocket)
+        self.lagging.discard(websocket)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if self.audience.flush_interval:
+                await asyncio.sleep(self.audience.flush_interval)
+            self.flush()
+
+    def flush(self):
+        self.wakeup.clear()
+        frames, self.pending = self.pending, []
+        caught_up = ()
+        if frames and (self.members or self.lagging):
+            snapshot = self.audience.snapshot
+            if snapshot is not None and time.perf_counter() >= self.next_lag_check:
+                self.next_lag_check = time.perf_counter() + LAG_CHECK_INTERVAL
+                caught_up = self.sort_laggards()
+            if len(frames) > 1 and self.audience.coalesce and snapshot is not None:
+                frames = [snapshot()]
+            timed = metrics.BROADCAST_SECONDS.sample()
+            if timed:
+                start = time.perf_counter()
+            for frame in frames:
+                self.audience.broadcast(self.members, frame)
+            if caught_up:
+                # the snapshot already has this batch's frames
+                self.audience.broadcast(caught_up, snapshot())
+            if timed:
+                metrics.BROADCAST_SECONDS.observe(time.perf_counter() - start)
+        self.members.update(caught_up)
+        self.members |= self.newcomers
+        self.newcomers.clear()
+
+    def sort_laggards(self):
+        """
+        takes the members with more than LAG_LIMIT bytes waiting out of the
+        broadcast, returns the lagging ones that have caught up since
+        """
+        caught_up = [websocket for websocket in self.lagging if backlog(websocket) < LAG_LIMIT // 2]
+        self.lagging.difference_update(caught_up)
+        behind = [websocket for websocket in self.members if backlog(websocket) > LAG_LIMIT]
+        if behind:
+            self.members.difference_update(behind)
+            self.lagging.update(behind)
+            metrics.SPECTATORS_SKIPPED.inc(amount=len(behind))
+        return caught_up
+
+
+class Audience:
+    """
+    every spectator of one match, split in shards
+    """
+
+    def __init__(
+        self,
+        snapshot=None,
+        shard_size=SHARD_SIZE,
+        flush_interval=FLUSH_INTERVAL,
+        coalesce=False,
+        broadcast=broadcast,
+    ):
+        # called with no arguments, returns the current "state" frame
+        self.snapshot = snapshot
+        self.shard_size = shard_size
+        self.flush_interval = flush_interval
+        self.coalesce = coalesce
+        # swappable so benchmarks can count deliveries without real sockets
+        self.broadcast = broadcast
+        self.shards = []
+        # { websocket : shard it belongs to }
+        self.shard_of = {}
+
+    def __len__(self):
+        return len(self.shard_of)
+
+    def __iter__(self):
+        return iter(self.shard_of)
+
+    def add(self, websocket):
+        """
+        adds a spectator to the first shard with room, making a new one if needed
+        """
+        for shard in self.shards:
+            if len(shard) < self.shard_size:
+                break
+        else:
+            shard = Shard(self)
+            self.shards.append(shard)
+        shard.add(websocket)
+        self.shard_of[websocket] = shard
+
+    def discard(self, websocket):
+        shard = self.shard_of.pop(websocket, None)
+        if shard is not None:
+            shard.discard(websocket)
+
+    def publish(self, frame):
+        """
+        buffers a frame for every shard, never waits
+        """
+        for shard in self.shards:
+            shard.pending.append(frame)
+            shard.wakeup.set()
+
+    def close(self):
+        """
+        sends out anything still buffered, then stops the shard tasks
+        """
+        for shard in self.shards:
+            shard.flush()
+            if shard.lagging and self.snapshot is not None:
+                # the final board, for those who missed the end
+                self.broadcast(shard.lagging, self.snapshot())
+            shard.task.cancel()
+        self.shards.clear()
+        self.shard_of.clear()
@@ -0,0 +1,59 @@
+"""
+per-connection limits on incoming messages
+
+each player connection gets a TokenBucket: a message takes a token, tokens
+come back at RATE per second up to BURST. messages arriving with no token
+left are dropped, and a connection that keeps sending while throttled is
+flooding and gets disconnected
+"""
+
+import os
+import time
+
+__all__ = ["TokenBucket", "RATE", "BURST", "FLOOD_LIMIT", "MAX_MESSAGE_SIZE"]
+
+# a person clicking fast plays a few moves per second
+# THROTTLE_RATE and THROTTLE_BURST override these, e.g. for load tests
+RATE = float(os.environ.get("THROTTLE_RATE", "5"))
+BURST = int(os.environ.get("THROTTLE_BURST", "10"))
+
+# messages dropped in a row before the connection is closed
+FLOOD_LIMIT = 50
+
+# bytes, largest frame accepted by websockets.serve. the biggest message a
+# client sends is an "init" with two keys, well under this
+MAX_MESSAGE_SIZE = 1024
+
+# close code for flooding connections: "Policy Violation"
+FLOOD_CLOSE_CODE = 1008
+
+
+class TokenBucket:
+    __slots__ = ["rate", "burst", "tokens", "updated", "dropped", "clock"]
+
+    def __init__(self, rate=RATE, burst=BURST, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.clock = clock
+        self.updated = clock()
+        # messages dropped since the last one let through
+        self.dropped = 0
+
+    def take(self) -> bool:
+        """
+        whether a message may go through, using up a token if so
+        """
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.dropped = 0
+            return True
+        self.dropped += 1
+        return False
+
+    @property
+    def flooding(self) -> bool:
+        return self.dropped >= FLOOD_LIMIT
@@ -0,0 +1,134 @@
+"""
+compact binary wire protocol, opted into with the "connect4.binary.v1"
+websocket subprotocol. clients that don't ask for it get the JSON events
+from events.py as before
+
+server to client:
+    play   1 byte   0x80 | player << 6 | column << 3 | row
+    init   0x01, join key, 0x00, watch key
+    win    0x02, player
+    error  0x03, message in utf-8
+    state  0x04, winner (2 for none), then one byte per move: column << 3 | row,
+           players alternating from red
+players are 0 for red and 1 for yellow. events without a binary form are
+sent as their JSON text, so a binary client decodes binary frames and
+parses text frames. that includes init events with a reconnect token and
+numbered state events. play and win frames lose their "seq" number, each
+one is numbered one more than the previous, see history.py
+
+client to server:
+    play   1 byte   0x80 | column
+    init   0x01, mode (0 new game, 1 join, 2 watch, 3 computer, 4 quick play),
+           key in utf-8
+
+the server keeps producing JSON frames internally. they are translated at
+the edge by `to_binary`, which is memoized: play, win and error frames are
+the same few str objects over and over, so translating them is a dict lookup
+"""
+
+from functools import lru_cache
+
+import events
+from connect4 import PLAYER1, PLAYER2
+
+__all__ = [
+    "BINARY",
+    "JSON",
+    "SUBPROTOCOLS",
+    "select_subprotocol",
+    "is_binary",
+    "encode_for",
+    "to_binary",
+    "decode_client_message",
+]
+
+BINARY = "connect4.binary.v1"
+JSON = "connect4.json"
+# in order of preference when a client offers both
+SUBPROTOCOLS = [BINARY, JSON]
+
+PLAY_FLAG = 0x80
+INIT, WIN, ERROR, STATE = 0x01, 0x02, 0x03, 0x04
+PLAYER_CODES = {PLAYER1: 0, PLAYER2: 1, None: 2}
+INIT_MODES = {0: None, 1: "join", 2: "watch", 3: "computer", 4: "quick"}
+
+# { binary "play" message : column }
+PLAY_MESSAGES = {bytes([PLAY_FLAG | column]): column for column in range(7)}
+
+
+def select_subprotocol(connection, subprotocols):
+    """
+    select_subprotocol for websockets.serve: the first of SUBPROTOCOLS the
+    client offers, else no subprotocol (JSON). unlike the default, clients
+    offering none, or only unknown ones, are still accepted
+    """
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+def is_binary(websocket) -> bool:
+    return getattr(websocket, "subprotocol", None) == BINARY
+
+
+def encode_for(websocket, frame):
+    """
+    the JSON frame as it should go out on this websocket
+    """
+    return to_binary(frame) if is_binary(websocket) else frame
+
+
+# play and win frames are numbered (see history.py), a few thousand different ones
+@lru_cache(maxsize=16384)
+def to_binary(frame):
+    """
+    translates a JSON event frame from events.py to its binary form, or
+    returns it as is if it has none
+    """
+    event = events.loads(frame)
+    event_type = event.get("type")
+    if event_type == "play":
+        return bytes([
+            PLAY_FLAG
+            | PLAYER_CODES[event["player"]] << 6
+            | event["column"] << 3
+            | event["row"]
+        ])
+    if event_type == "init" and set(event) == {"type", "join", "watch"}:
+        return bytes([INIT]) + event["join"].encode() + b"\x00" + event["watch"].encode()
+    if event_type == "win":
+        return bytes([WIN, PLAYER_CODES[event["player"]]])
+    if event_type == "error":
+        return bytes([ERROR]) + event["message"].encode()
+    if event_type == "state" and set(event) == {"type", "moves", "winner"}:
+        return bytes([STATE, PLAYER_CODES[event["winner"]]]) + bytes(
+            column << 3 | row for _, column, row in event["moves"]
+        )
+    return frame
+
+
+def decode_client_message(message):
+    """
+    returns the event dict for a binary message from a client
+
+    raises ValueError if it isn't a valid one
+    """
+    if not message:
+        raise ValueError("empty message")
+    kind = message[0]
+    if kind & PLAY_FLAG and len(message) == 1:
+        return {"type": "play", "column": kind & 0x7F}
+    if kind == INIT and len(message) >= 2 and message[1] in INIT_MODES:
+        event = {"type": "init"}
+        mode = INIT_MODES[message[1]]
+        if mode in ("computer", "quick"):
+            # flags, no key
+            event[mode] = True
+        elif mode is not None:
+            try:
+                event[mode] = bytes(message[2:]).decode()
+            except UnicodeDecodeError:
+                raise ValueError("key is not valid utf-8")
+        return event
+    raise ValueError("unknown binary message")
@@ -0,0 +1,88 @@
+"""
+multi-process mode: WEB_CONCURRENCY worker processes all listen on the same
+port with SO_REUSEPORT, so the kernel spreads incoming connections over them
+
+matches live in the worker that created them. the first character of every
+join and watch key names that worker, so a connection for a match hosted
+elsewhere is handed to relay.py, which forwards it to the owning worker
+over a Unix socket
+"""
+
+import multiprocessing
+import os
+import signal
+
+__all__ = ["WORKER_ID", "WORKER_COUNT", "worker_count", "key_prefix", "owner_of", "spawn"]
+
+# url safe characters, the prefix of a key is this alphabet's entry for its worker
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+# set in each worker process by spawn(), a single process server is worker 0 of 1
+WORKER_ID = 0
+WORKER_COUNT = 1
+
+
+def worker_count() -> int:
+    """
+    number of worker processes asked for in the environment
+    WEB_CONCURRENCY is the variable heroku sets based on the dyno size
+    """
+    count = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    if not 1 <= count <= len(ALPHABET):
+        raise ValueError(f"WEB_CONCURRENCY must be between 1 and {len(ALPHABET)}")
+    return count
+
+
+def key_prefix() -> str:
+    """
+    first character of the keys of matches created in this worker
+    """
+    return ALPHABET[WORKER_ID]
+
+
+def owner_of(key) -> int:
+    """
+    id of the worker hosting the match with this join or watch key
+
+    keys that don't name a valid worker, or aren't strings, are treated as
+    local, so they end up with the usual "invalid key" error
+    """
+    worker_id = ALPHABET.find(key[:1]) if key and isinstance(key, str) else -1
+    if 0 <= worker_id < WORKER_COUNT:
+        return worker_id
+    return WORKER_ID
+
+
+def run_worker(worker_id, count, target):
+    global WORKER_ID, WORKER_COUNT
+    WORKER_ID, WORKER_COUNT = worker_id, count
+    # the parent forwards SIGTERM, ctrl-c in a terminal reaches everyone
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target()
+
+
+def spawn(count, target):
+    """
+    runs target() in `count` forked worker processes and waits for them
+
+    a SIGTERM sent to the parent is passed on to every worker, so each one
+    goes through its own shutdown in main()
+    """
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=run_worker, args=(worker_id, count, target), name=f"worker-{worker_id}")
+        for worker_id in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    for process in processes:
+        process.join()